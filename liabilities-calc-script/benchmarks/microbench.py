@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of the per-row hot functions, with stored baselines.
+
+Each benchmark calls one function over a fixed synthetic workload (seeded, built once,
+outside the timing) and reports the best of REPEATS timed passes, per call. Times are
+also divided by the best time of a fixed pure-Python calibration loop, timed between the
+benchmark's passes so both see the same machine state; baselines recorded on one
+machine then stay comparable on another, and comparisons use these normalized times. A
+benchmark that looks regressed is re-run (--confirm times) and only reported when it
+stays slower, since a loaded machine can slow any single run.
+
+    python benchmarks/microbench.py run                 # print current timings
+    python benchmarks/microbench.py save                # record them as benchmarks/baselines.json
+    python benchmarks/microbench.py compare             # exit 1 on a regression beyond --tolerance
+    python benchmarks/microbench.py compare --only identify_liabilities --tolerance 0.1
+
+Not part of the shipped scripts (package root is src/); run from liabilities-calc-script.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+import main as m  # noqa: E402
+import peptide_main as pm  # noqa: E402
+from annotations import base36_encode, extract_cdrs_fr1, parse_annotations  # noqa: E402
+from detection import classify_risk, identify_liabilities  # noqa: E402
+from scoring import classify_developability_risk, compute_developability_score  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_TOLERANCE = 0.3
+REPEATS = 15
+WORKLOAD_ROWS = 1000
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+REGIONS = ("FR1", "CDR1", "CDR2", "CDR3")
+LABEL_MAP = {"1": "CDR1", "2": "CDR2", "3": "CDR3"}
+
+
+def _sequences(rng: random.Random, n: int, low: int, high: int) -> list[str]:
+    return ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(low, high))) for _ in range(n)]
+
+
+def _calibration_pass() -> float:
+    """Seconds of a fixed pure-Python loop: the unit of normalized times."""
+    started = time.perf_counter()
+    total = 0
+    for i in range(50_000):
+        total += i * i % 7
+    return time.perf_counter() - started
+
+
+def _workloads(rows: int) -> dict[str, Callable[[], Callable[[], None]]]:
+    """Benchmark name → setup returning the timed pass (one call per workload row)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        config = m.build_scan_config()
+    fixability, risk_levels = config.combined_fixability_map, config.combined_risk_level_map
+
+    def scan_args(region: str) -> tuple:
+        return (
+            region,
+            config.active_cdr_defs,
+            config.active_extra_defs,
+            config.active_cys_defs,
+            config.expected_cys_map,
+            config.active_custom_defs,
+        )
+
+    def region_liabilities(rng: random.Random) -> list[dict[str, str]]:
+        seqs = {region: _sequences(rng, rows, 8, 25) for region in REGIONS}
+        return [
+            {region: identify_liabilities(seqs[region][i], *scan_args(region)) for region in REGIONS}
+            for i in range(rows)
+        ]
+
+    def identify():
+        seqs = _sequences(random.Random(1), rows, 8, 25)
+        args = scan_args("CDR3")
+        return lambda: [identify_liabilities(seq, *args) for seq in seqs]
+
+    def risk():
+        cells = [row["CDR3"] for row in region_liabilities(random.Random(2))]
+        return lambda: [classify_risk(cell, fixability, risk_levels) for cell in cells]
+
+    def developability_risk():
+        rows_liabs = region_liabilities(random.Random(3))
+        return lambda: [classify_developability_risk(row, fixability, risk_levels) for row in rows_liabs]
+
+    def developability_score():
+        rows_liabs = [
+            {f"{region} aa liabilities": v for region, v in row.items()} for row in region_liabilities(random.Random(4))
+        ]
+        return lambda: [compute_developability_score(row, fixability) for row in rows_liabs]
+
+    def annotation_rows(rng: random.Random) -> list[tuple[str, str]]:
+        out = []
+        for seq in _sequences(rng, rows, 110, 130):
+            bounds = sorted(rng.sample(range(10, len(seq) - 10), 6))
+            parts = [
+                f"{code}:{base36_encode(bounds[2 * i])}+{base36_encode(bounds[2 * i + 1] - bounds[2 * i])}"
+                for i, code in enumerate("123")
+            ]
+            parts += [f"{rng.choice('45678')}:{base36_encode(rng.randrange(len(seq)))}+0" for _ in range(9)]
+            out.append((seq, "|".join(parts)))
+        return out
+
+    def parse():
+        annotations = [ann for _seq, ann in annotation_rows(random.Random(5))]
+        return lambda: [parse_annotations(ann) for ann in annotations]
+
+    def extract():
+        parsed = [(seq, parse_annotations(ann)) for seq, ann in annotation_rows(random.Random(6))]
+        return lambda: [extract_cdrs_fr1(seq, segments, LABEL_MAP) for seq, segments in parsed]
+
+    def summary():
+        heavy, light = region_liabilities(random.Random(7)), region_liabilities(random.Random(8))
+        row_dicts = [
+            {f"Heavy {r} aa liabilities": h[r] for r in REGIONS} | {f"Light {r} aa liabilities": lt[r] for r in REGIONS}
+            for h, lt in zip(heavy, light)
+        ]
+        return lambda: [m._create_sequence_liabilities_summary_str(row) for row in row_dicts]
+
+    def peptide_scan():
+        rules = pm._build_active_rules(True, [], [])
+        peptides = _sequences(random.Random(9), rows, 8, 40)
+        return lambda: [pm._scan_sequence(seq, rules) for seq in peptides]
+
+    return {
+        "identify_liabilities": identify,
+        "classify_risk": risk,
+        "classify_developability_risk": developability_risk,
+        "compute_developability_score": developability_score,
+        "parse_annotations": parse,
+        "extract_cdrs_fr1": extract,
+        "_create_sequence_liabilities_summary_str": summary,
+        "peptide _scan_sequence": peptide_scan,
+    }
+
+
+def run_benchmarks(only: list[str] | None = None, rows: int = WORKLOAD_ROWS, repeats: int = REPEATS) -> dict:
+    """Timings of the selected benchmarks (all by default) as a baseline-file document."""
+    workloads = _workloads(rows)
+    unknown = sorted(set(only or []) - set(workloads))
+    if unknown:
+        raise KeyError(f"unknown benchmark(s) {unknown}; known: {sorted(workloads)}")
+    results, calibrations = {}, []
+    for name, setup in workloads.items():
+        if only and name not in only:
+            continue
+        timed = setup()
+        calibration = best = float("inf")
+        with contextlib.redirect_stderr(io.StringIO()):
+            timed()  # Warm-up (caches, lazily compiled patterns)
+            for _ in range(repeats):  # Interleaved, so both minima come from the same conditions
+                calibration = min(calibration, _calibration_pass())
+                started = time.perf_counter()
+                timed()
+                best = min(best, time.perf_counter() - started)
+        calibrations.append(calibration)
+        per_call = best / rows
+        results[name] = {"calls": rows, "seconds_per_call": per_call, "normalized": per_call / calibration}
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration_seconds": min(calibrations, default=0.0),
+        "benchmarks": results,
+    }
+
+
+def keep_fastest(first: dict, second: dict) -> dict:
+    """`first` with every benchmark also timed in `second` replaced by the faster (normalized) entry."""
+    benchmarks = dict(first["benchmarks"])
+    for name, entry in second["benchmarks"].items():
+        if name not in benchmarks or entry["normalized"] < benchmarks[name]["normalized"]:
+            benchmarks[name] = entry
+    return {**first, "benchmarks": benchmarks}
+
+
+def compare(baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE) -> tuple[list[dict], bool]:
+    """(per-benchmark rows, any regression): current normalized time over the baseline's."""
+    rows, regressed = [], False
+    for name, now in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            rows.append({"benchmark": name, "ratio": None, "status": "new"})
+            continue
+        ratio = now["normalized"] / before["normalized"]
+        status = "regressed" if ratio > 1 + tolerance else "improved" if ratio < 1 - tolerance else "ok"
+        regressed |= status == "regressed"
+        rows.append({"benchmark": name, "ratio": ratio, "status": status})
+    return rows, regressed
+
+
+def _print_timings(document: dict) -> None:
+    print(f"calibration: {document['calibration_seconds'] * 1e3:.2f} ms")
+    for name, entry in document["benchmarks"].items():
+        per_call, normalized = entry["seconds_per_call"] * 1e6, entry["normalized"] * 1e3
+        print(f"{name:45s} {per_call:10.2f} µs/call  {normalized:8.4f} ‰ of calibration")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Micro-benchmarks of the hot per-row functions.")
+    p.add_argument("command", choices=("run", "save", "compare"))
+    p.add_argument("--only", nargs="+", metavar="NAME", help="Benchmarks to run (default: all)")
+    p.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file (default: %(default)s)")
+    p.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed slowdown over the baseline, as a fraction (default: %(default)s)",
+    )
+    p.add_argument(
+        "--confirm",
+        type=int,
+        default=2,
+        help="Re-runs of apparently regressed benchmarks before they are reported (default: %(default)s)",
+    )
+    p.add_argument("--output", help="Also write the current timings to this JSON file")
+    args = p.parse_args()
+
+    try:
+        current = run_benchmarks(args.only)
+    except KeyError as e:
+        sys.exit(f"Error: {e.args[0]}")
+    _print_timings(current)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.command == "save":
+        if args.only and os.path.exists(args.baseline):  # Update the selected entries only
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            current = {**current, "benchmarks": {**stored["benchmarks"], **current["benchmarks"]}}
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+        print(f"Baselines written to {args.baseline}")
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, current, args.tolerance)
+        for _ in range(args.confirm):
+            suspects = [row["benchmark"] for row in rows if row["status"] == "regressed"]
+            if not suspects:
+                break
+            print(f"Re-running {suspects} to confirm")
+            current = keep_fastest(current, run_benchmarks(suspects))
+            rows, regressed = compare(baseline, current, args.tolerance)
+        print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for row in rows:
+            ratio = "" if row["ratio"] is None else f"{row['ratio']:6.2f}x"
+            print(f"{row['benchmark']:45s} {ratio:>8s}  {row['status']}")
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
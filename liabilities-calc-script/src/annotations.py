@@ -1,5 +1,9 @@
+import json
+import os
 import sys
 
+from diagnostics import SEGMENT_OUT_OF_BOUNDS, UNDECODABLE_PART, Diagnostics
+
 
 # Base-36 Utilities
 def base36_encode(n: int) -> str:
@@ -19,7 +23,7 @@ def base36_decode(s: str) -> int:
 
 
 # Parsing & Extraction
-def parse_annotations(ann: str):
+def parse_annotations(ann: str, diagnostics: Diagnostics | None = None):
     segs = []
     if not ann or not isinstance(ann, str):
         return segs
@@ -31,22 +35,27 @@ def parse_annotations(ann: str):
         try:
             segs.append((lab, base36_decode(st36), base36_decode(ln36)))
         except ValueError:
-            print(f"Warning: Could not decode part '{part}' in annotation '{ann}'", file=sys.stderr)
+            message = f"Could not decode part '{part}' in annotation '{ann}'"
+            if diagnostics is None:
+                print(f"Warning: {message}", file=sys.stderr)
+            else:
+                diagnostics.warn(UNDECODABLE_PART, message)
             continue
     return sorted(segs, key=lambda x: x[1])
 
 
 # Extract CDRs & FR1
-def extract_cdrs_fr1(seq: str, segments: list, region_map: dict):
+def extract_cdrs_fr1(seq: str, segments: list, region_map: dict, diagnostics: Diagnostics | None = None):
     frags, coords = {}, {}
     for lab, start, length in segments:
         name = region_map.get(str(lab))
         if name:
             if start < 0 or start + length > len(seq):
-                print(
-                    f"Warning: Segment {name} ({start}+{length}) out of bounds for seq length {len(seq)}.",
-                    file=sys.stderr,
-                )
+                message = f"Segment {name} ({start}+{length}) out of bounds for seq length {len(seq)}."
+                if diagnostics is None:
+                    print(f"Warning: {message}", file=sys.stderr)
+                else:
+                    diagnostics.warn(SEGMENT_OUT_OF_BOUNDS, message)
                 continue
             frags[name] = seq[start : start + length]
             coords[name] = (start, length)
@@ -56,3 +65,20 @@ def extract_cdrs_fr1(seq: str, segments: list, region_map: dict):
             frags["FR1"] = seq[:s0]
             coords["FR1"] = (0, s0)
     return frags, coords
+
+
+# Label maps
+def load_label_map(value: str | None) -> dict:
+    """Load a label map given as a JSON file path or an inline JSON string; {} when absent or invalid."""
+    if not value:
+        return {}
+    try:
+        if os.path.isfile(value):
+            with open(value, "r") as f:
+                label_map = json.load(f)
+        else:
+            label_map = json.loads(value)
+    except Exception as e:
+        print(f"Error loading --label-map: {e}", file=sys.stderr)
+        return {}
+    return label_map if isinstance(label_map, dict) else {}
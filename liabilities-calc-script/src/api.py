@@ -0,0 +1,126 @@
+"""In-process scanning of Polars frames, without the TSV round-trip of the CLIs.
+
+    rules = RuleSet.build(custom=[{"name": "WW", "pattern": "WW", "riskLevel": "Low",
+                                   "fixability": "fixable", "regions": ["CDR3"]}])
+    clonotypes = scan_clonotypes(df, rules, numbering_schema="imgt", label_map={"1": "CDR1", ...})
+    peptides = scan_peptides(peptide_df, rules)
+
+A RuleSet compiles the rules of both scanners once and is never modified afterwards, so
+one instance can be shared by any number of calls and threads. Each call keeps its own
+state (liability code table, regex time budget, statistics) and prints no progress
+messages. Input frames take the columns of the corresponding CLI input (column names
+are used as given); the result is the frame the CLI would write.
+
+The regex time budget holds on any thread: off the main thread, where SIGALRM cannot
+interrupt a match, backtracking custom rules run in a worker process of the calling
+thread (started on first use), which is killed when the budget runs out.
+"""
+
+import dataclasses
+from dataclasses import dataclass
+from types import MappingProxyType
+
+import polars as pl
+
+import peptide_main
+from custom_regex import DEFAULT_TIME_BUDGET_SECONDS, RegexBudget
+from definitions import build_expected_cys_map
+from kmer_index import KmerIndexBuilder
+from main import (
+    LiabilityCodes,
+    ScanConfig,
+    _input_columns,
+    _process_frame,
+    build_scan_config,
+    compile_custom_liabilities,
+)
+from match_matrix import WeightProfile
+from scan_stats import ScanStats
+
+__all__ = ["RuleSet", "scan_clonotypes", "scan_peptides"]
+
+
+@dataclass(frozen=True)
+class RuleSet:
+    """Compiled liability rules for clonotype and peptide scans; build with RuleSet.build()."""
+
+    clonotype_config: ScanConfig
+    peptide_rules: MappingProxyType
+
+    @classmethod
+    def build(
+        cls,
+        use_predefined: bool = True,
+        include: set[str] | None = None,
+        disabled: set[str] = frozenset(),
+        custom: list[dict] = (),
+    ) -> "RuleSet":
+        """Select the predefined rules (`include`, default all, minus `disabled`) and add `custom`
+        entries ({name, pattern, riskLevel, fixability, regions}).
+
+        `regions` only applies to clonotypes; entries without it are scanned in peptides only.
+        Raises re.error for an invalid custom pattern and KeyError for a missing field.
+        """
+        compiled = compile_custom_liabilities([{**entry, "regions": entry.get("regions", ())} for entry in custom])
+        clonotype_custom = {name: rule for name, rule in compiled.items() if rule["regions"]}
+        config = build_scan_config(use_predefined, include, set(disabled), clonotype_custom)
+        # Peptides have their own predefined subset (see peptide_main); `include` does not apply.
+        peptide_rules = peptide_main._build_active_rules(use_predefined, list(disabled), list(custom))
+        return cls(config, MappingProxyType(peptide_rules))
+
+    def label_map(self, label_map: dict | None = None) -> dict[str, str]:
+        """Code → name map for the annotations scan_clonotypes writes with `label_map`,
+        as the CLI's --output-label-map (liability codes follow the rule set, not the input)."""
+        region_map = {str(k): str(v) for k, v in (label_map or {}).items()}
+        codes = LiabilityCodes(region_map, self.clonotype_config.liability_names())
+        return {**region_map, **{code: name for name, code in codes.codes.items()}}
+
+
+def scan_clonotypes(
+    df: pl.DataFrame,
+    rules: RuleSet,
+    numbering_schema: str | None = None,
+    label_map: dict | None = None,
+    regex_time_budget: float | None = DEFAULT_TIME_BUDGET_SECONDS,
+    on_regex_timeout: str = "fail",
+    stats: ScanStats | None = None,
+    parallel_chains: bool = True,
+    kmer_index: KmerIndexBuilder | None = None,
+    weights: dict[str, WeightProfile] | None = None,
+) -> pl.DataFrame:
+    """Scan a clonotype frame (annotation or pre-fragmented CDR/FR columns) as main.py does.
+
+    `label_map` names the numeric region codes of annotation columns. Custom rules that need
+    a backtracking regex engine share `regex_time_budget` seconds (None: unlimited) for this
+    call; RegexTimeout is raised when it runs out and `on_regex_timeout` is "fail". Paired
+    chains are scanned in worker processes unless `parallel_chains` is False. The region
+    columns are added to `kmer_index` when given. Each of `weights` (see
+    match_matrix.load_weight_profiles) adds a "Developability cost (<name>)" column.
+    """
+    config = dataclasses.replace(
+        rules.clonotype_config,
+        expected_cys_map=build_expected_cys_map(numbering_schema),
+        initial_region_map=dict(label_map or {}),
+        regex_budget=RegexBudget(regex_time_budget, on_regex_timeout),
+        weight_profiles=dict(weights or {}),
+    )
+    df = df.select(_input_columns(df.columns))
+    codes = LiabilityCodes.for_config(config)
+    return _process_frame(df, config, codes, parallel_chains, stats, verbose=False, kmer_index=kmer_index).df_out
+
+
+def scan_peptides(
+    df: pl.DataFrame,
+    rules: RuleSet,
+    regex_time_budget: float | None = DEFAULT_TIME_BUDGET_SECONDS,
+    on_regex_timeout: str = "fail",
+    stats: ScanStats | None = None,
+) -> pl.DataFrame:
+    """Scan a peptide frame (`variantKey`, `sequence aa`) as peptide_main.py does.
+
+    Raises ValueError when a column is missing; the regex budget is as in scan_clonotypes.
+    """
+    peptide_main._check_columns(df)
+    return peptide_main._scan_frame(
+        df, dict(rules.peptide_rules), stats, RegexBudget(regex_time_budget, on_regex_timeout)
+    )
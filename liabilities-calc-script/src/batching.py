@@ -0,0 +1,272 @@
+"""Memory-bounded batch processing for the scanning entry points.
+
+With --max-memory the input is not read in one go. A sample of rows is processed first
+to measure what one row costs (input frame, output frame and every Python/NumPy
+allocation made while scanning it); the batch size is then chosen so that one batch
+plus the interpreter's baseline footprint fits the budget. Each batch's output is
+written to a part file in a spill directory and the parts are concatenated at the end.
+
+Batches are pipelined (run_pipeline): a reader thread parses the next batch and a writer
+thread writes the previous one's part while the current batch is scanned, with bounded
+queues in between, so at most PIPELINE_BATCHES batches are held in memory.
+"""
+
+import io
+import itertools
+import os
+import queue
+import re
+import resource
+import sys
+import tempfile
+import threading
+import tracemalloc
+from collections.abc import Callable, Iterable, Iterator
+
+import polars as pl
+
+import tsv_io
+
+SAMPLE_ROWS = 2000
+MIN_BATCH_ROWS = 1000
+# Measured sample peaks miss Polars' native allocations and allocator fragmentation.
+SAFETY_FACTOR = 2.0
+# Batches waiting between pipeline stages (reader → scan, scan → writer)
+PIPELINE_QUEUE_SIZE = 1
+# Batches alive at once: one being parsed, the queued ones and one being scanned (inputs);
+# one being scanned, the queued ones and one being written (outputs).
+PIPELINE_BATCHES = PIPELINE_QUEUE_SIZE + 2
+_POLL_SECONDS = 0.1
+_DONE = object()
+
+_SIZE_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1000,
+    "kb": 1000,
+    "kib": 1024,
+    "m": 1000**2,
+    "mb": 1000**2,
+    "mib": 1024**2,
+    "g": 1000**3,
+    "gb": 1000**3,
+    "gib": 1024**3,
+    "t": 1000**4,
+    "tb": 1000**4,
+    "tib": 1024**4,
+}
+
+
+def parse_memory_size(value: str) -> int:
+    """Parse a size such as '16GiB', '512MiB', '2G' or '1500000000' into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or match.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f"memory size must look like '16GiB', '512MiB' or a byte count, got {value!r}")
+    size = int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+    if size <= 0:
+        raise ValueError(f"memory size must be positive, got {value!r}")
+    return size
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects affinity / cgroup pinning where the OS exposes it)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def peak_rss_bytes() -> int:
+    """High-water resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def measure_row_bytes(process: Callable[[pl.DataFrame], pl.DataFrame], sample: pl.DataFrame) -> float:
+    """Approximate peak bytes per row of running `process` on `sample`."""
+    tracemalloc.start()
+    try:
+        out = process(sample)
+        _current, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    total = traced_peak + sample.estimated_size() + out.estimated_size()
+    return SAFETY_FACTOR * total / max(1, len(sample))
+
+
+def choose_batch_rows(max_memory: int, row_bytes: float, baseline: int, in_flight: int = PIPELINE_BATCHES) -> int:
+    """Largest batch that keeps `baseline` plus `in_flight` batches under `max_memory` (at least MIN_BATCH_ROWS)."""
+    available = max_memory - baseline
+    if available <= 0:
+        print(
+            f"Warning: --max-memory ({max_memory} bytes) is below the process baseline ({baseline} bytes);"
+            f" using the minimum batch of {MIN_BATCH_ROWS} rows.",
+            file=sys.stderr,
+        )
+        return MIN_BATCH_ROWS
+    return max(MIN_BATCH_ROWS, int(available // (max(row_bytes, 1.0) * in_flight)))
+
+
+def infer_schema(path: str, infer_schema_length: int | None, ignore_errors: bool) -> pl.Schema:
+    """The schema a single pl.read_csv of the whole file would infer (from its first rows)."""
+    n_rows = infer_schema_length if infer_schema_length else None
+    return pl.read_csv(
+        path, separator="\t", ignore_errors=ignore_errors, infer_schema_length=infer_schema_length, n_rows=n_rows
+    ).schema
+
+
+def count_data_rows(path: str) -> int:
+    """Data lines of the TSV: the row numbers iter_tsv_batches' `start` and `stop` refer to."""
+    lf = pl.scan_csv(path, separator="\t", ignore_errors=True, infer_schema_length=0, quote_char=None)
+    return lf.select(pl.len()).collect().item()
+
+
+def _multiline_error(path: str) -> ValueError:
+    return ValueError(
+        f"{path}: a quoted field spans several lines, which batched runs cannot split;"
+        " remove the line breaks from the field or run without a memory limit"
+    )
+
+
+def iter_tsv_batches(
+    path: str,
+    batch_rows: int,
+    schema: pl.Schema,
+    ignore_errors: bool,
+    start: int = 0,
+    stop: int | None = None,
+) -> Iterator[pl.DataFrame]:
+    """Yield data rows [start, stop) of a TSV as DataFrames of at most `batch_rows` rows.
+
+    Every batch is parsed with the same schema, so batches carry the dtypes a single read
+    of the whole file would. At least one (possibly empty) frame is always yielded.
+
+    Batches are cut at line ends, so one row must be one line: a quoted field spanning
+    lines, which a single read would accept, raises ValueError.
+    """
+    with tsv_io.open_input(path) as f:
+        header = f.readline()
+        for _ in itertools.islice(f, start):
+            pass
+        remaining = None if stop is None else max(0, stop - start)
+        yielded = False
+        while remaining is None or remaining > 0:
+            take = batch_rows if remaining is None else min(batch_rows, remaining)
+            lines = list(itertools.islice(f, take))
+            if not lines:
+                break
+            if not lines[-1].endswith(b"\n"):
+                lines[-1] += b"\n"
+            if remaining is not None:
+                remaining -= len(lines)
+            yielded = True
+            try:
+                batch = pl.read_csv(
+                    io.BytesIO(header + b"".join(lines)), separator="\t", schema=schema, ignore_errors=ignore_errors
+                )
+            except pl.exceptions.ComputeError as e:
+                if not any(b'"' in line for line in lines):
+                    raise
+                raise _multiline_error(path) from e
+            if batch.height != len(lines):
+                raise _multiline_error(path)
+            yield batch
+        if not yielded:
+            yield pl.DataFrame(schema=schema)
+
+
+def run_pipeline(
+    batches: Iterable,
+    process: Callable[[int, object], object],
+    write: Callable[[int, object], None],
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+) -> int:
+    """process(index, batch) every batch on the calling thread, then write(index, output) it.
+
+    `batches` is iterated on a reader thread and outputs are written on a writer thread, in
+    input order, so parsing, scanning and writing overlap. The bounded queues between the
+    stages hold back a stage that runs ahead. Scanning stays on the calling thread (the
+    regex time budget interrupts it with a signal). The first error of any stage stops the
+    others and is re-raised here. Returns the number of batches.
+    """
+    to_process: queue.Queue = queue.Queue(maxsize=queue_size)
+    to_write: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def read() -> None:
+        iterator = iter(batches)
+        try:
+            for batch in iterator:
+                if not put(to_process, batch):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()  # Release the input file when stopped early
+        put(to_process, _DONE)
+
+    def drain() -> None:
+        try:
+            while (item := get(to_write)) is not _DONE:
+                write(*item)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    reader = threading.Thread(target=read, name="batch-reader", daemon=True)
+    writer = threading.Thread(target=drain, name="batch-writer", daemon=True)
+    reader.start()
+    writer.start()
+    n_batches = 0
+    try:
+        while (batch := get(to_process)) is not _DONE:
+            output = process(n_batches, batch)
+            del batch  # Let the input go before waiting on the writer
+            if not put(to_write, (n_batches, output)):
+                break
+            n_batches += 1
+        put(to_write, _DONE)
+        writer.join()
+    finally:
+        stop.set()  # Unblocks the reader (and the writer, if processing failed)
+        reader.join()
+        writer.join()
+    if errors:
+        raise errors[0]
+    return n_batches
+
+
+def part_path(spill_dir: str, index: int) -> str:
+    return os.path.join(spill_dir, f"part-{index:05d}.tsv")
+
+
+def spill_dir_for(output_path: str) -> tempfile.TemporaryDirectory:
+    """Spill directory next to the output, so parts live on the same (local) filesystem."""
+    parent = os.path.dirname(os.path.abspath(output_path))
+    return tempfile.TemporaryDirectory(prefix=".liabilities-batches-", dir=parent)
+
+
+def combine_parts(part_paths: list[str], output_path: str, compression: str | None = None, threads: int = 1) -> None:
+    """Concatenate per-batch TSV parts, in order, into the final (optionally compressed) output."""
+    if len(part_paths) == 1 and compression is None:
+        os.replace(part_paths[0], output_path)
+    else:
+        tsv_io.concat_tsvs(part_paths, output_path, compression, threads)
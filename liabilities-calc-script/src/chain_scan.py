@@ -0,0 +1,169 @@
+"""Motif rules evaluated once per full chain, with the matches attributed to annotated regions.
+
+Path A extracts the regions of every chain ("Heavy sequence aa") from its annotations. Rather
+than running each rule on each region fragment, the chain column is packed once and every
+rule the motif kernel can express with a fixed length is evaluated over it once; each match
+start is then attributed by coordinate to the row's regions. A match counts for a region
+when it lies entirely inside it, so per region the result is exactly what a scan of the
+fragment finds:
+
+- a trailing (?!$) means "not at the end of the region", checked against the region bounds;
+- overlapping matches are dropped greedily from the left within each region, as
+  re.finditer does on the fragment.
+
+The regions of all rows are kept in one table sorted by (row, start), so a match start
+finds its region with one bisect; the table is built once per chain and every rule's
+matches are located once. When a row's annotation segments overlap (FR1 is derived from
+CDR1, labels may repeat) a position can lie in several regions, and the regions are then
+tested by interval containment instead. Matches that start in one region and end in
+another are the boundary-spanning motifs a fragment scan never sees; boundary_hits() finds
+their two regions with the same bisect.
+
+Rules the kernel cannot express (look-around, backreferences, variable length) depend on
+the context around a match, so they keep running on the fragments, as do chain columns
+with non-ASCII residues (byte offsets would not be residue offsets).
+"""
+
+import re
+
+import numpy as np
+import polars as pl
+
+from custom_regex import CustomPattern
+from detection import _motif_for
+from motif_kernel import Motif, PackedColumn, non_overlapping
+
+
+class ChainScan:
+    """One chain column and the chain coordinates of its regions; matches are computed and
+    attributed once per pattern, so every region and caller of a rule shares one pass."""
+
+    def __init__(self, seqs: list, spans: dict[str, tuple[np.ndarray, np.ndarray]]):
+        """`spans` maps each region to per-row (start, end) chain coordinates; start is -1
+        where the row has no such region."""
+        self.packed = PackedColumn.from_series(pl.Series(seqs, dtype=pl.Utf8))
+        self.spans = spans
+        self.names = list(spans)
+        self._matches: dict[tuple, tuple[np.ndarray, ...]] = {}
+
+        # All regions sorted by (row, start), as one key: the region of a position is the
+        # last one starting at or before it.
+        parts = [(np.flatnonzero(start >= 0), start, end) for start, end in spans.values()]
+        rows = np.concatenate([p for p, _s, _e in parts]) if parts else np.zeros(0, dtype=np.int64)
+        starts = np.concatenate([s[p] for p, s, _e in parts]) if parts else np.zeros(0, dtype=np.int64)
+        ends = np.concatenate([e[p] for p, _s, e in parts]) if parts else np.zeros(0, dtype=np.int64)
+        ids = np.concatenate([np.full(len(p), i) for i, (p, _s, _e) in enumerate(parts)]) if parts else rows
+        self._stride = int(self.packed.lengths.max(initial=0)) + 1
+        order = np.argsort(rows * self._stride + starts, kind="stable")
+        self._rows, self._starts, self._ends, self._ids = rows[order], starts[order], ends[order], ids[order]
+        self._keys = self._rows * self._stride + self._starts
+        same_row = self._rows[1:] == self._rows[:-1]
+        self._disjoint = not bool((same_row & (self._starts[1:] < self._ends[:-1])).any())
+
+    def motif(self, pattern: str | re.Pattern | CustomPattern) -> Motif | None:
+        """The pattern's fixed-length motif, or None when it must run on the fragments."""
+        motif = _motif_for(self.packed, pattern)
+        return motif if motif is not None and motif.fixed_length is not None else None
+
+    def _locate(self, rows: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        """Index (in the sorted region table) of the region holding each position, or -1."""
+        if not len(self._keys):
+            return np.full(len(positions), -1)
+        i = np.searchsorted(self._keys, rows * self._stride + positions, side="right") - 1
+        at = np.maximum(i, 0)
+        found = (i >= 0) & (self._rows[at] == rows) & (positions < self._ends[at])
+        return np.where(found, i, -1)
+
+    def _match_starts(self, motif: Motif) -> tuple[np.ndarray, np.ndarray, dict]:
+        """(row, chain offset) of every, possibly overlapping, match start ((?!$) is left to
+        the regions) and, for disjoint regions, the contained ones grouped per region as
+        (row, offset in the region, residues left in the region after the match)."""
+        key = tuple(lut.tobytes() for alt in motif.alternatives for lut in alt) + (len(motif.alternatives),)
+        if key not in self._matches:
+            positions = np.flatnonzero(Motif(motif.alternatives).hit_mask(self.packed))
+            rows = np.searchsorted(self.packed.starts, positions, side="right") - 1
+            offsets = positions - self.packed.starts[rows]
+            grouped = {}
+            if self._disjoint:
+                located = self._locate(rows, offsets)
+                ends = self._ends[np.maximum(located, 0)] if len(self._ends) else np.zeros(len(rows), dtype=np.int64)
+                room = ends - offsets - motif.fixed_length
+                inside = np.flatnonzero((located >= 0) & (room >= 0))
+                # A stable sort by region keeps each region's matches in (row, offset) order.
+                inside = inside[np.argsort(self._ids[located[inside]], kind="stable")]
+                ids = self._ids[located[inside]]
+                bounds = np.searchsorted(ids, np.arange(len(self.names) + 1))
+                local = offsets[inside] - self._starts[located[inside]]
+                for rid, name in enumerate(self.names):
+                    part = slice(bounds[rid], bounds[rid + 1])
+                    grouped[name] = (rows[inside[part]], local[part], room[inside[part]])
+            self._matches[key] = (rows, offsets, grouped)
+        return self._matches[key]
+
+    def region_matches(
+        self, pattern: str | re.Pattern | CustomPattern, region: str
+    ) -> tuple[np.ndarray, np.ndarray] | None:
+        """(row, offset in the region) of the re.finditer matches of `pattern` in every row's
+        `region` fragment; None when the pattern is not evaluated on the chain."""
+        motif = self.motif(pattern)
+        if motif is None:
+            return None
+        k = motif.fixed_length
+        rows, offsets, grouped = self._match_starts(motif)
+        if self._disjoint:
+            rows, offsets, room = grouped[region]
+            if motif.not_at_end:
+                rows, offsets = rows[room > 0], offsets[room > 0]
+        else:  # Overlapping segments: test the region's bounds directly
+            region_start, region_end = self.spans[region]
+            start, end = region_start[rows], region_end[rows]
+            limit = end - 1 if motif.not_at_end else end
+            inside = (start >= 0) & (offsets >= start) & (offsets + k <= limit)
+            rows, offsets = rows[inside], offsets[inside] - start[inside]
+        keep = non_overlapping(offsets, rows, k)
+        return rows[keep], offsets[keep]
+
+    def region(self, region: str) -> "ChainRegion":
+        return ChainRegion(self, region)
+
+    def boundary_hits(self, rules: dict[str, str]) -> pl.Series:
+        """Per row, the rules with a match starting in one region and ending in another, as
+        "name (FROM/TO)" sorted and comma-separated ("None" if none, "Unknown" for rows
+        without regions)."""
+        n_rows = len(self.packed)
+        cells: list[set[str]] = [set() for _ in range(n_rows)]
+        for name, pattern in rules.items():
+            motif = self.motif(pattern)
+            if motif is None or motif.fixed_length < 2:
+                continue
+            rows, offsets, _grouped = self._match_starts(motif)
+            if motif.not_at_end:
+                kept = offsets + motif.fixed_length < self.packed.lengths[rows]
+                rows, offsets = rows[kept], offsets[kept]
+            first = self._locate(rows, offsets)
+            last = self._locate(rows, offsets + motif.fixed_length - 1)
+            spanning = (first >= 0) & (last >= 0) & (first != last)
+            for r, a, b in zip(rows[spanning].tolist(), first[spanning].tolist(), last[spanning].tolist()):
+                cells[r].add(f"{name} ({self.names[self._ids[a]]}/{self.names[self._ids[b]]})")
+        has_regions = np.zeros(n_rows, dtype=bool)
+        has_regions[self._rows] = True
+        return pl.Series(
+            [", ".join(sorted(c)) if c else "None" if has_regions[r] else "Unknown" for r, c in enumerate(cells)],
+            dtype=pl.Utf8,
+        )
+
+
+class ChainRegion:
+    """One region of a ChainScan, as scan_region_liabilities consumes it."""
+
+    def __init__(self, chain: ChainScan, region: str):
+        self.chain = chain
+        self.region = region
+
+    def match_counts(self, pattern: str | re.Pattern | CustomPattern) -> np.ndarray | None:
+        """re.finditer matches per row in the region's fragments; None when the pattern is not
+        evaluated on the chain."""
+        matches = self.chain.region_matches(pattern, self.region)
+        if matches is None:
+            return None
+        return np.bincount(matches[0], minlength=len(self.chain.packed))
@@ -0,0 +1,119 @@
+"""Resumable batched runs (--checkpoint-dir).
+
+With --max-memory the output of every batch is a part file; with a checkpoint directory
+the parts are written there instead of a temporary spill directory, made durable (fsync)
+and then recorded in a manifest, together with what the batch contributes to the run's
+other outputs (frame metadata, input warnings, match-matrix rows). The manifest also
+records the run's identity: the input's fingerprint, the rule-set hash, the label map,
+the shard and the batch size. A restarted run with the same arguments finds the
+manifest, skips the input rows of the recorded batches and scans the rest with the same
+batch size, so the parts, and the final output concatenated from them, are those an
+uninterrupted run writes.
+
+Batches are written in input order, so the recorded batches are always a prefix of the
+run. The manifest is replaced atomically: a crash leaves either the previous or the new
+manifest, and an unrecorded part is simply written again.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+_HASH_CHUNK_BYTES = 1 << 20
+
+
+def input_fingerprint(path: str) -> dict:
+    """Size and SHA-256 of the input file's bytes (not its name or timestamps)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return {"size": os.path.getsize(path), "sha256": digest.hexdigest()}
+
+
+def _fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Checkpoint:
+    def __init__(self, directory: str, run: dict, batch_rows: int | None = None, batches: list[dict] = ()):
+        self.directory = directory
+        self.run = run
+        self.batch_rows = batch_rows
+        self.batches = list(batches)
+
+    @classmethod
+    def open(cls, directory: str, run: dict) -> "Checkpoint":
+        """The checkpoint in `directory` (created if needed) for a run identified by `run`.
+
+        Raises ValueError when the directory holds the checkpoint of a different run
+        (other input, rule set, label map, shard or manifest version).
+        """
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return cls(directory, run)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"checkpoint {directory!r} was written by an incompatible version; remove it to restart")
+        changed = sorted(k for k in run.keys() | manifest["run"].keys() if run.get(k) != manifest["run"].get(k))
+        if changed:
+            raise ValueError(
+                f"checkpoint {directory!r} belongs to a different run ({', '.join(changed)} changed);"
+                " remove it or choose another --checkpoint-dir"
+            )
+        return cls(directory, run, manifest["batch_rows"], manifest["batches"])
+
+    @property
+    def done_rows(self) -> int:
+        """Input rows covered by the recorded batches."""
+        return sum(batch["rows"] for batch in self.batches)
+
+    def path(self, index: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"part-{index:05d}{suffix}")
+
+    def record(self, index: int, rows: int, meta: dict, files: list[str]) -> None:
+        """Make batch `index`'s `files` durable, then add the batch (`rows` input rows, `meta`)
+        to the manifest. Batches must be recorded in order."""
+        if index != len(self.batches):
+            raise ValueError(f"batch {index} recorded out of order (expected {len(self.batches)})")
+        for path in files:
+            _fsync_path(path)
+        self.batches.append({"rows": rows, "files": [os.path.basename(p) for p in files], **meta})
+        self._write_manifest()
+
+    def start(self, batch_rows: int) -> None:
+        """Fix the batch size of a new checkpoint (a resumed one keeps its own)."""
+        self.batch_rows = batch_rows
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        manifest = {"version": MANIFEST_VERSION, "run": self.run, "batch_rows": self.batch_rows}
+        manifest["batches"] = self.batches
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_path(self.directory)
+
+    def remove(self) -> None:
+        """Delete the checkpoint's files (not the directory's other contents), and the directory if it is then empty."""
+        names = [MANIFEST_NAME] + [name for batch in self.batches for name in batch["files"]]
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
@@ -0,0 +1,306 @@
+"""Engine selection and time budgets for user-supplied (custom) liability regexes.
+
+Custom patterns are validated once, when the rules are loaded:
+
+- patterns the Rust regex engine behind Polars accepts (no look-around, backreferences,
+  atomic groups, possessive quantifiers or conditionals) run there, column-wise and in
+  time linear in the sequence length;
+- the rest run with Python's backtracking `re`, row by row, under a RegexBudget: a
+  per-job time allowance after which the job either fails with a clear message or skips
+  the rule with a warning. On the main thread the budget interrupts a single runaway
+  match (SIGALRM); other threads (API callers) run the rows in a worker process of
+  their own, which is killed when the budget runs out.
+
+Rules expressible as short motifs still go to the NumPy kernel first (see detection.py).
+"""
+
+import contextlib
+import multiprocessing
+import re
+import signal
+import sys
+import threading
+import time
+import warnings
+from dataclasses import dataclass, field
+from re import _constants as sre_constants
+from re import _parser as sre_parse
+
+import numpy as np
+import polars as pl
+
+ON_TIMEOUT = ("fail", "skip")
+DEFAULT_TIME_BUDGET_SECONDS = 600.0
+
+_CONSTRUCTS = {
+    sre_constants.GROUPREF: "backreference",
+    sre_constants.GROUPREF_EXISTS: "conditional group",
+    sre_constants.ATOMIC_GROUP: "atomic group",
+    sre_constants.POSSESSIVE_REPEAT: "possessive quantifier",
+}
+# Assertions on the surroundings of a match (anchors, word boundaries)
+_CONTEXT_ASSERTIONS = {
+    sre_constants.AT_BEGINNING,
+    sre_constants.AT_BEGINNING_STRING,
+    sre_constants.AT_END,
+    sre_constants.AT_END_STRING,
+    sre_constants.AT_BOUNDARY,
+    sre_constants.AT_NON_BOUNDARY,
+}
+
+
+class RegexTimeout(Exception):
+    """A backtracking custom regex used up the job's time budget."""
+
+
+@dataclass(frozen=True)
+class CustomPattern:
+    pattern: str
+    compiled: re.Pattern
+    # Constructs that keep the pattern off the linear-time engine (empty when linear)
+    unsupported: tuple[str, ...]
+    # No anchors, word boundaries or empty matches: a match's offset can be recovered by
+    # searching its text from the end of the previous match.
+    context_free: bool
+
+    @property
+    def linear(self) -> bool:
+        return not self.unsupported
+
+    @property
+    def engine(self) -> str:
+        return "linear regex" if self.linear else "regex"
+
+
+def _walk(items, found: set[str], context: list[bool]) -> None:
+    for op, av in items:
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            direction, _sub = av
+            found.add(
+                ("negative " if op is sre_constants.ASSERT_NOT else "")
+                + ("look-ahead" if direction > 0 else "look-behind")
+            )
+        elif op in _CONSTRUCTS:
+            found.add(_CONSTRUCTS[op])
+        elif op is sre_constants.AT and av in _CONTEXT_ASSERTIONS:
+            context[0] = False
+        for value in av if isinstance(av, (tuple, list)) else (av,):
+            if isinstance(value, sre_parse.SubPattern):
+                _walk(value, found, context)
+            elif isinstance(value, list) and value and isinstance(value[0], sre_parse.SubPattern):
+                for sub in value:  # BRANCH alternatives
+                    _walk(sub, found, context)
+
+
+def compile_custom(pattern: str) -> CustomPattern:
+    """Compile a custom liability pattern and decide which engine runs it.
+
+    Raises re.error when Python cannot compile the pattern at all.
+    """
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        compiled = re.compile(pattern)
+    found: set[str] = set()
+    context = [True]
+    _walk(sre_parse.parse(pattern), found, context)
+    if any(issubclass(w.category, FutureWarning) for w in caught):
+        found.add("nested character set (read differently by the two engines)")
+    if not found:
+        try:
+            pl.Series([""], dtype=pl.Utf8).str.contains(pattern)
+        except pl.exceptions.ComputeError as e:
+            reason = next((line.strip() for line in str(e).splitlines() if line.strip().startswith("error:")), "")
+            found.add(f"rejected by the linear engine ({reason.removeprefix('error: ') or 'unsupported syntax'})")
+    context_free = context[0] and compiled.match("") is None
+    return CustomPattern(pattern, compiled, tuple(sorted(found)), context_free)
+
+
+def describe_engine(name: str, custom: CustomPattern) -> str:
+    """One line for the upfront validation report."""
+    if custom.linear:
+        return f"Custom liability '{name}': linear-time regex engine."
+    return (
+        f"Custom liability '{name}': {', '.join(custom.unsupported)} not supported by the linear-time engine;"
+        " evaluated with backtracking regex under the regex time budget."
+    )
+
+
+def _can_alarm() -> bool:
+    """Whether SIGALRM can interrupt a match running in the calling thread."""
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+@contextlib.contextmanager
+def _alarm(seconds: float | None):
+    """Raise RegexTimeout in the main thread after `seconds`."""
+    if seconds is None or not _can_alarm():
+        yield
+        return
+
+    def on_alarm(_signum, _frame):
+        raise RegexTimeout
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _serve(conn) -> None:
+    """Worker loop: scan each job's rows, sending (spans, seconds) as every row finishes."""
+    conn.send("ready")
+    while True:
+        try:
+            compiled, strings = conn.recv()
+        except EOFError:
+            return
+        for seq in strings:
+            started = time.perf_counter()
+            spans = [m.span() for m in compiled.finditer(seq)] if seq else []
+            conn.send((spans, time.perf_counter() - started))
+
+
+class _RegexWorker:
+    """A process running backtracking scans for a thread SIGALRM cannot interrupt."""
+
+    _local = threading.local()
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), name="regex-worker", daemon=True)
+        self.process.start()
+        child.close()
+        self.conn.recv()  # Started and imported: its start-up is not charged to a budget
+
+    @classmethod
+    def for_thread(cls) -> "_RegexWorker":
+        """The calling thread's worker, started on first use (and again after a kill)."""
+        worker = getattr(cls._local, "worker", None)
+        if worker is None:
+            worker = cls._local.worker = cls()
+        return worker
+
+    def scan(self, compiled: re.Pattern, strings: list, spans: list, row_seconds: np.ndarray, seconds: float):
+        """Fill `spans` and `row_seconds`; the row running when `seconds` ran out (the worker
+        is then killed), or None."""
+        deadline = time.perf_counter() + seconds
+        self.conn.send((compiled, strings))
+        for i in range(len(strings)):
+            if not self.conn.poll(max(0.0, deadline - time.perf_counter())):
+                self._local.worker = None
+                self.process.kill()
+                self.process.join()
+                self.conn.close()
+                return i
+            spans[i], row_seconds[i] = self.conn.recv()
+        return None
+
+
+@dataclass
+class RegexBudget:
+    """Time allowance for backtracking custom regexes over one job (None: unlimited).
+
+    Worker processes fill a spawn() of the budget, drawing on what remained when they
+    started, and the parent absorb()s it back.
+    """
+
+    seconds: float | None = DEFAULT_TIME_BUDGET_SECONDS
+    on_timeout: str = "fail"
+    spent: float = 0.0
+    skipped: set[str] = field(default_factory=set)
+    spawned_at: float = 0.0  # `spent` of the parent when spawned
+
+    @property
+    def remaining(self) -> float | None:
+        return None if self.seconds is None else self.seconds - self.spent
+
+    def spawn(self) -> "RegexBudget":
+        return RegexBudget(self.seconds, self.on_timeout, self.spent, set(self.skipped), spawned_at=self.spent)
+
+    def absorb(self, other: "RegexBudget") -> None:
+        if other is not self:
+            self.spent += other.spent - other.spawned_at
+            self.skipped |= other.skipped
+
+    def _timed_out(self, name: str, where: str, row: int, length: int) -> None:
+        if self.on_timeout == "fail":
+            raise RegexTimeout(
+                f"Custom liability '{name}' exhausted the {self.seconds:g} s budget for backtracking regexes"
+                f" in {where} (row {row}, length {length}). Simplify the pattern so the linear-time engine"
+                " can run it, raise the regex time budget, or choose to skip on timeout."
+            )
+        if name not in self.skipped:
+            print(
+                f"Warning: custom liability '{name}' exhausted the regex time budget in {where} (row {row});"
+                " it is skipped for the rest of the job, hits found before are kept.",
+                file=sys.stderr,
+            )
+        self.skipped.add(name)
+
+    def scan(self, name: str, where: str, compiled: re.Pattern, strings: list) -> tuple[list[list], np.ndarray]:
+        """(match spans per row, seconds per row) of a backtracking pattern; empty rows are not scanned.
+
+        Rows from the one the budget ran out on are left without matches when skipping.
+        """
+        spans: list[list] = [[] for _ in strings]
+        row_seconds = np.zeros(len(strings), dtype=np.float64)
+        remaining = self.remaining
+        if name in self.skipped:
+            return spans, row_seconds
+        if remaining is not None and remaining <= 0:
+            self._timed_out(name, where, 0, len(strings[0] or "") if strings else 0)
+            return spans, row_seconds
+        worker = _RegexWorker.for_thread() if remaining is not None and not _can_alarm() else None
+        i = 0
+        started = time.perf_counter()
+        try:
+            if worker is not None:
+                i = worker.scan(compiled, strings, spans, row_seconds, remaining)
+                if i is not None:
+                    raise RegexTimeout
+            else:
+                with _alarm(remaining):
+                    for i, seq in enumerate(strings):
+                        if not seq:
+                            continue
+                        row_started = time.perf_counter()
+                        spans[i] = [m.span() for m in compiled.finditer(seq)]
+                        row_seconds[i] = time.perf_counter() - row_started
+        except RegexTimeout:
+            self.spent += time.perf_counter() - started
+            spans[i:] = [[] for _ in strings[i:]]
+            self._timed_out(name, where, i, len(strings[i] or ""))
+            return spans, row_seconds
+        self.spent += time.perf_counter() - started
+        return spans, row_seconds
+
+
+def linear_match_offsets(series: pl.Series, custom: CustomPattern, counts: np.ndarray) -> list[list[int]]:
+    """0-based offsets of every match in each row of `series`, found by the linear engine.
+
+    The engine returns match texts; for context-free patterns each text's offset is the
+    first occurrence at or after the previous match's end (any earlier occurrence would
+    have been the leftmost match). Anchored patterns keep Python's offsets, but only rows
+    the engine found hits in are searched.
+    """
+    offsets: list[list[int]] = [[] for _ in range(len(series))]
+    hit_rows = np.flatnonzero(counts > 0)
+    if not len(hit_rows):
+        return offsets
+    hit_seqs = series.gather(hit_rows).to_list()
+    if not custom.context_free:
+        for r, seq in zip(hit_rows.tolist(), hit_seqs):
+            offsets[r] = [m.start() for m in custom.compiled.finditer(seq)]
+        return offsets
+    texts = series.gather(hit_rows).str.extract_all(custom.pattern).to_list()
+    for r, seq, row_texts in zip(hit_rows.tolist(), hit_seqs, texts):
+        end = 0
+        for text in row_texts:
+            start = seq.find(text, end)
+            offsets[r].append(start)
+            end = start + len(text)
+    return offsets
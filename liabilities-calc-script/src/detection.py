@@ -1,6 +1,17 @@
 import re
+import time
+from typing import TYPE_CHECKING
 
+import numpy as np
+import polars as pl
+
+from custom_regex import CustomPattern, RegexBudget
 from definitions import Fixability, PerRegionRisk, RiskLevel
+from motif_kernel import PackedColumn, compile_motif
+from scan_stats import ScanStats
+
+if TYPE_CHECKING:
+    from chain_scan import ChainRegion
 
 
 # Cysteine position helpers
@@ -98,12 +109,230 @@ def identify_liabilities(
     if active_custom_defs:
         for name, custom_def in active_custom_defs.items():
             if region in custom_def["regions"]:
-                if custom_def["pattern"].search(seq):
+                if custom_def["pattern"].compiled.search(seq):
                     liabilities_found.append(name)
 
     return ", ".join(sorted(set(liabilities_found))) if liabilities_found else "None"
 
 
+def _evaluate_cys_liabilities_packed(packed: PackedColumn, expected_positions: list, expected_count: int):
+    """Column-wise _evaluate_cys_liabilities: (missing_cys, extra_cys) boolean arrays, one entry per row."""
+    if not packed.is_ascii:
+        # Byte offsets are not character positions in non-ASCII rows; check row by row instead.
+        flags = [_evaluate_cys_liabilities(seq or "", expected_positions, expected_count) for seq in packed.strings()]
+        missing_cys = np.array([missing for missing, _extra, _count in flags], dtype=bool)
+        extra_cys = np.array([extra for _missing, extra, _count in flags], dtype=bool)
+        return missing_cys, extra_cys
+    actual_cys_count = packed.residue_count("C")
+    any_allowed = np.zeros(len(packed), dtype=bool)
+    any_cys_at_allowed = np.zeros(len(packed), dtype=bool)
+    for p in expected_positions:
+        in_range, is_cys = packed.residue_at("C", p)
+        any_allowed |= in_range
+        any_cys_at_allowed |= is_cys
+    missing_cys = any_allowed & ~any_cys_at_allowed
+    extra_cys = (actual_cys_count > expected_count) | (missing_cys & (actual_cys_count >= expected_count))
+    return missing_cys, extra_cys
+
+
+def _motif_for(packed: PackedColumn, pattern: str | re.Pattern | CustomPattern):
+    if isinstance(pattern, CustomPattern):
+        pattern = pattern.compiled
+    pattern_str = pattern.pattern if isinstance(pattern, re.Pattern) else pattern
+    flags_ok = not isinstance(pattern, re.Pattern) or pattern.flags == re.UNICODE
+    return compile_motif(pattern_str) if flags_ok and packed.is_ascii else None
+
+
+def _custom_row_matches(
+    packed: PackedColumn, name: str, custom: CustomPattern, budget: RegexBudget | None, where: str
+) -> tuple[np.ndarray, np.ndarray | None, str]:
+    """(matches per row, seconds per row or None, engine) of a custom pattern the motif kernel cannot run."""
+    if custom.linear:
+        counts = packed.upper.str.count_matches(custom.pattern).fill_null(0).to_numpy().astype(np.int64)
+        counts[~packed.valid] = 0
+        return counts, None, custom.engine
+    budget = budget if budget is not None else RegexBudget(seconds=None)
+    spans, row_seconds = budget.scan(name, where, custom.compiled, packed.strings())
+    return np.fromiter((len(s) for s in spans), dtype=np.int64, count=len(spans)), row_seconds, custom.engine
+
+
+def _pattern_row_hits(packed: PackedColumn, pattern: str | re.Pattern) -> np.ndarray:
+    """Per-row presence of a pattern: motif kernel when expressible, regex search otherwise."""
+    motif = _motif_for(packed, pattern)
+    if motif is not None:
+        return motif.row_hits(packed)
+    compiled = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+    return np.fromiter(
+        (bool(seq) and compiled.search(seq) is not None for seq in packed.strings()), dtype=bool, count=len(packed)
+    )
+
+
+def _pattern_row_matches(packed: PackedColumn, pattern: str | re.Pattern) -> tuple[np.ndarray, np.ndarray | None, str]:
+    """Stats-mode counterpart of _pattern_row_hits: (matches per row, seconds per row or None, engine).
+
+    Regex-fallback rows are timed one by one with finditer, so their time covers the full
+    scan of each row; kernel rules are evaluated column-wise and have no per-row time.
+    """
+    motif = _motif_for(packed, pattern)
+    if motif is not None:
+        if motif.fixed_length is not None:
+            rows, _offsets = motif.match_positions(packed)
+            return np.bincount(rows, minlength=len(packed)), None, "motif kernel"
+        return packed.row_count(motif.hit_mask(packed)), None, "motif kernel"
+    compiled = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+    counts = np.zeros(len(packed), dtype=np.int64)
+    row_seconds = np.zeros(len(packed), dtype=np.float64)
+    for i, seq in enumerate(packed.strings()):
+        if not seq:
+            continue
+        started = time.perf_counter()
+        counts[i] = sum(1 for _ in compiled.finditer(seq))
+        row_seconds[i] = time.perf_counter() - started
+    return counts, row_seconds, "regex"
+
+
+def pattern_match_positions(packed: PackedColumn, pattern: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(row index, 0-based offset, match length) of every re.finditer match of `pattern` in the column."""
+    motif = compile_motif(pattern) if packed.is_ascii else None
+    if motif is not None and motif.fixed_length is not None:
+        rows, offsets = motif.match_positions(packed)
+        return rows, offsets, np.full(len(rows), motif.fixed_length, dtype=np.int64)
+    rows, offsets, lengths = [], [], []
+    compiled = re.compile(pattern)
+    for i, seq in enumerate(packed.strings()):
+        if not seq:
+            continue
+        for match in compiled.finditer(seq):
+            rows.append(i)
+            offsets.append(match.start())
+            lengths.append(match.end() - match.start())
+    return np.array(rows, dtype=np.int64), np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+
+def _format_liability_hits(packed: PackedColumn, hits: dict[str, np.ndarray]) -> pl.Series:
+    """Render per-rule hit arrays as identify_liabilities strings (sorted names, 'None', 'Unknown')."""
+    valid = pl.Series(packed.valid)
+    names = sorted(hits)
+    if names:
+        frame = pl.DataFrame({f"h{i}": hits[name] for i, name in enumerate(names)})
+        joined = frame.select(
+            pl.concat_list([pl.when(pl.col(f"h{i}")).then(pl.lit(name)) for i, name in enumerate(names)])
+            .list.drop_nulls()
+            .list.join(", ")
+        ).to_series()
+    else:
+        joined = pl.Series([""] * len(packed), dtype=pl.Utf8)
+    return (
+        pl.DataFrame({"valid": valid, "joined": joined})
+        .select(
+            pl.when(~pl.col("valid"))
+            .then(pl.lit("Unknown"))
+            .when(pl.col("joined") == "")
+            .then(pl.lit("None"))
+            .otherwise(pl.col("joined"))
+        )
+        .to_series()
+    )
+
+
+def scan_region_liabilities(
+    seqs: pl.Series,
+    region: str,
+    active_cdr_defs: dict,
+    active_extra_defs: dict,
+    active_cys_defs: dict,
+    expected_cys_map: dict,
+    active_custom_defs: dict | None = None,
+    stats: ScanStats | None = None,
+    regex_budget: RegexBudget | None = None,
+    chain_region: "ChainRegion | None" = None,
+    rule_hits: dict[str, np.ndarray] | None = None,
+) -> pl.Series:
+    """Column-wise identify_liabilities: same rules and output strings, evaluated for all rows at once.
+
+    The column is packed once and every rule expressible as a short motif runs through the
+    NumPy kernel; other custom patterns run on the linear-time regex engine, or with
+    backtracking re per row under `regex_budget` (see custom_regex.py). When the column is a
+    region extracted from a chain, `chain_region` (a chain_scan.ChainRegion) supplies the
+    match counts of the rules it evaluates on the whole chain. With `stats`, every rule
+    evaluation is recorded under the column name (minus " aa"). `rule_hits`, when given,
+    receives per rule the rows whose string lists it (a boolean array).
+    """
+    packed = PackedColumn.from_series(seqs)
+    hits: dict[str, np.ndarray] = {}
+    stats_region = (seqs.name or region).removesuffix(" aa")
+
+    def add(name: str, row_hits: np.ndarray):
+        hits[name] = hits[name] | row_hits if name in hits else row_hits
+
+    def add_pattern(name: str, pattern: str | re.Pattern | CustomPattern):
+        if chain_region is not None:
+            started = time.perf_counter()
+            counts = chain_region.match_counts(pattern)
+            if counts is not None:
+                if stats is not None:
+                    elapsed = time.perf_counter() - started
+                    stats.record(name, stats_region, "motif kernel", packed.valid, counts, elapsed, packed.lengths)
+                add(name, counts > 0)
+                return
+        custom = isinstance(pattern, CustomPattern) and _motif_for(packed, pattern) is None
+        if stats is None and not custom:
+            add(name, _pattern_row_hits(packed, pattern))
+            return
+        started = time.perf_counter()
+        if custom:
+            counts, row_seconds, engine = _custom_row_matches(packed, name, pattern, regex_budget, stats_region)
+        else:
+            counts, row_seconds, engine = _pattern_row_matches(packed, pattern)
+        if stats is None:
+            add(name, counts > 0)
+            return
+        elapsed = time.perf_counter() - started
+        stats.record(name, stats_region, engine, packed.valid, counts, elapsed, packed.lengths, row_seconds)
+        add(name, counts > 0)
+
+    for name, pattern in active_extra_defs.items():
+        add_pattern(name, pattern)
+
+    if region.startswith("CDR"):
+        w_oxidation_name = "Tryptophan Oxidation (W)"
+        for name, (pattern, *_rest) in active_cdr_defs.items():
+            if name == w_oxidation_name and region == "CDR3":
+                pattern = r"W(?!$)"  # Suppress terminal W in CDR3
+            add_pattern(name, pattern)
+
+    if active_cys_defs and (region.startswith("CDR") or region.startswith("FR")):
+        expected_positions, expected_count, should_check = _get_expected_cys_positions(region, expected_cys_map)
+        if should_check:
+            started = time.perf_counter()
+            missing_cys, extra_cys = _evaluate_cys_liabilities_packed(packed, expected_positions, expected_count)
+            elapsed = time.perf_counter() - started
+            cys_flags = {"Missing Cysteines": missing_cys, "Extra Cysteines": extra_cys}
+            cys_flags = {name: flagged for name, flagged in cys_flags.items() if name in active_cys_defs}
+            for name, flagged in cys_flags.items():
+                add(name, flagged)
+                if stats is not None:
+                    # Both checks come from one column-wise pass; its time is split between them.
+                    stats.record(
+                        name,
+                        stats_region,
+                        "vectorised",
+                        packed.valid,
+                        flagged.astype(np.int64),
+                        elapsed / len(cys_flags),
+                        packed.lengths,
+                    )
+
+    if active_custom_defs:
+        for name, custom_def in active_custom_defs.items():
+            if region in custom_def["regions"]:
+                add_pattern(name, custom_def["pattern"])
+
+    if rule_hits is not None:
+        rule_hits.update({name: flagged & packed.valid for name, flagged in hits.items()})
+    return _format_liability_hits(packed, hits).alias(seqs.name)
+
+
 def classify_risk(
     liabilities_str: str | None,
     fixability_map: dict[str, Fixability],
@@ -0,0 +1,91 @@
+"""Aggregated input warnings (--diagnostics-output, --verbose-warnings).
+
+Malformed annotation parts and out-of-bounds segments are per-row conditions: on a messy
+input a line per occurrence means millions of stderr lines, and more time writing them
+than scanning. The collector counts each warning category and keeps its first examples;
+one summary is printed at the end of the run, and can be written as JSON. With `verbose`
+every occurrence is also printed as it happens, as before.
+
+Collectors are plain picklable objects: worker processes fill their own (see spawn())
+and the parent merges them, in job order, so the kept examples do not depend on timing.
+"""
+
+import json
+import sys
+from dataclasses import dataclass, field
+
+UNDECODABLE_PART = "undecodable annotation part"
+SEGMENT_OUT_OF_BOUNDS = "segment out of bounds"
+
+
+@dataclass
+class WarningCategory:
+    count: int = 0
+    examples: list[str] = field(default_factory=list)
+
+
+class Diagnostics:
+    def __init__(self, max_examples: int = 5, verbose: bool = False):
+        self.max_examples = max_examples
+        self.verbose = verbose
+        self.categories: dict[str, WarningCategory] = {}
+
+    def spawn(self) -> "Diagnostics":
+        """An empty collector with the same settings, for a worker to fill."""
+        return Diagnostics(self.max_examples, self.verbose)
+
+    def warn(self, category: str, message: str) -> None:
+        entry = self.categories.get(category)
+        if entry is None:
+            entry = self.categories[category] = WarningCategory()
+        entry.count += 1
+        if len(entry.examples) < self.max_examples:
+            entry.examples.append(message)
+        if self.verbose:
+            print(f"Warning: {message}", file=sys.stderr)
+
+    @classmethod
+    def from_dict(cls, document: dict, max_examples: int = 5) -> "Diagnostics":
+        """A collector holding a to_dict() document's counts and examples."""
+        diagnostics = cls(max_examples)
+        for category in document["categories"]:
+            diagnostics.categories[category["category"]] = WarningCategory(category["count"], category["examples"])
+        return diagnostics
+
+    def merge(self, other: "Diagnostics") -> None:
+        for category, theirs in other.categories.items():
+            entry = self.categories.setdefault(category, WarningCategory())
+            entry.count += theirs.count
+            entry.examples.extend(theirs.examples[: self.max_examples - len(entry.examples)])
+
+    @property
+    def total(self) -> int:
+        return sum(entry.count for entry in self.categories.values())
+
+    def to_dict(self) -> dict:
+        categories = [
+            {"category": category, "count": entry.count, "examples": list(entry.examples)}
+            for category, entry in self.categories.items()
+        ]
+        categories.sort(key=lambda c: (-c["count"], c["category"]))
+        return {"total": self.total, "categories": categories}
+
+    def summary(self) -> str:
+        """The end-of-run report: one line per category, then its kept examples."""
+        n = len(self.categories)
+        lines = [f"Warnings: {self.total} in {n} {'category' if n == 1 else 'categories'}"]
+        for category in self.to_dict()["categories"]:
+            lines.append(f"  {category['category']}: {category['count']}")
+            lines.extend(f"    e.g. {example}" for example in category["examples"])
+        if not self.verbose:
+            lines.append("  (--verbose-warnings prints every occurrence)")
+        return "\n".join(lines)
+
+    def report(self) -> None:
+        """Print the summary to stderr, if anything was collected."""
+        if self.categories:
+            print(self.summary(), file=sys.stderr)
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,119 @@
+"""Resource projections for --estimate.
+
+Only the header and the first rows of a plain-text input are read: the row count is
+projected from the file size and the sample's mean line length. Compressed inputs say
+little through their size, so their lines are counted by streaming through them.
+Per-row memory and time costs come from running the real scan on the sample, so the
+projection follows whatever engine (NumPy motif kernel or regex fallback) the active
+rules end up on. The runtime projection is for a single worker; `suggested_threads`
+says how many CPUs the run can actually use.
+"""
+
+import os
+import time
+from collections.abc import Callable
+
+import polars as pl
+
+import batching
+import tsv_io
+from annotations import parse_annotations
+from diagnostics import Diagnostics
+
+
+def _head_bytes(path: str, n_rows: int) -> tuple[int, int]:
+    """(header bytes, bytes of the next n_rows lines), measured on the decompressed text."""
+    with tsv_io.open_input(path) as f:
+        header = len(f.readline())
+        sample = 0
+        for _ in range(n_rows):
+            line = f.readline()
+            if not line:
+                break
+            sample += len(line)
+    return header, sample
+
+
+def _count_lines(path: str) -> int:
+    """Data rows of a compressed input, counted by streaming through the decompressed text."""
+    lines, last = 0, b"\n"
+    with tsv_io.open_input(path) as f:
+        while block := f.read(4 * 1024 * 1024):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    lines += last != b"\n"  # Unterminated final line
+    return max(0, lines - 1)
+
+
+def mean_lengths(sample: pl.DataFrame, columns: list[str]) -> dict[str, float]:
+    """Mean character length of the non-null values of each column."""
+    lengths = {}
+    for col in columns:
+        mean = sample[col].cast(pl.Utf8).str.len_chars().mean()
+        lengths[col] = round(float(mean), 1) if mean is not None else 0.0
+    return lengths
+
+
+def mean_region_lengths(sample: pl.DataFrame, ann_cols: list[str], region_map: dict) -> dict[str, float]:
+    """Mean length of the annotated segments of each region, keyed "<chain> <region>".
+
+    Regions are named through `region_map` (the --label-map); unnamed codes are kept as is.
+    """
+    region_map = {str(k): str(v) for k, v in region_map.items()}
+    diagnostics = Diagnostics()  # Malformed annotations are reported by the scan, not here
+    totals: dict[str, list[int]] = {}
+    for col in ann_cols:
+        chain = col[: -len("annotations")].strip()
+        for ann in sample[col].cast(pl.Utf8).drop_nulls():
+            for lab, _start, length in parse_annotations(ann, diagnostics):
+                key = f"{chain} {region_map.get(lab, lab)}".strip()
+                totals.setdefault(key, []).append(length)
+    return {key: round(sum(lengths) / len(lengths), 1) for key, lengths in totals.items()}
+
+
+def build_estimate(
+    input_path: str,
+    sample: pl.DataFrame,
+    process: Callable[[pl.DataFrame], pl.DataFrame],
+    suggested_threads: int,
+    rows_per_thread: int | None = None,
+    **details,
+) -> dict:
+    """Project a full run of `process` over `input_path` from its cost on `sample`, the file's first rows.
+
+    With `rows_per_thread`, the suggested threads are capped at one per that many projected rows.
+    """
+    input_bytes = os.path.getsize(input_path)
+    compression = tsv_io.detect_compression(input_path)
+    header_bytes, sample_bytes = _head_bytes(input_path, len(sample))
+    if compression is not None:
+        # Compressed size says little about the row count; decompressing is cheap next to a scan.
+        estimated_rows = _count_lines(input_path)
+    elif len(sample) and sample_bytes:
+        estimated_rows = round((input_bytes - header_bytes) * len(sample) / sample_bytes)
+    else:
+        estimated_rows = 0
+
+    # The traced run also warms regex and lookup-table caches before the timed run.
+    row_bytes = batching.measure_row_bytes(process, sample)
+    started = time.perf_counter()
+    process(sample)
+    seconds_per_row = (time.perf_counter() - started) / max(1, len(sample))
+    baseline = batching.peak_rss_bytes()
+    peak = baseline + estimated_rows * row_bytes
+    if rows_per_thread:
+        suggested_threads = max(1, min(suggested_threads, -(-estimated_rows // rows_per_thread)))
+
+    return {
+        **details,
+        "input_bytes": input_bytes,
+        "input_compression": compression,
+        "sample_rows": len(sample),
+        "estimated_rows": estimated_rows,
+        "bytes_per_row": round(row_bytes),
+        "baseline_memory_bytes": baseline,
+        "projected_peak_memory_bytes": round(peak),
+        "projected_peak_memory_gib": round(peak / 1024**3, 2),
+        "projected_runtime_seconds": round(estimated_rows * seconds_per_row, 1),
+        "suggested_threads": suggested_threads,
+    }
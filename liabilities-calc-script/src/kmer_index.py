@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""k-mer inverted index over the scanned region columns (--kmer-index), and motif queries on it.
+
+While main.py scans, every region column (e.g. "CDR3 aa", "Heavy CDR1 aa") is indexed:
+for k = 2..4, each k-mer maps to the sorted ids of the rows containing it. The index
+file (a compressed .npz) also keeps the uppercased region sequences, packed as in
+motif_kernel, and the clonotypeKey of every row, so queries need neither the input nor
+a rescan:
+
+    index = KmerIndex.load("repertoire.kmers.npz")
+    rows = index.query("N[^P][ST]", "CDR3 aa")
+    keys = index.keys(rows)
+
+A pattern the motif kernel can express (literals, '.', [...] / [^...] classes, '|') is
+cut into k-mer windows; windows whose classes expand to at most MAX_WINDOW_KMERS k-mers
+are looked up and their row lists intersected, and only the surviving candidate rows are
+matched against the pattern. Other regexes are matched against every row. Residues map
+to 5-bit codes (A-Z, '*', '_', '-', '.'; anything else shares one code), so a lookup can
+only over-select, never miss a row.
+
+Row ids are input row numbers (shards and batches keep the numbering of the full input).
+"""
+
+import argparse
+import itertools
+import json
+import re
+import sys
+
+import numpy as np
+import polars as pl
+
+from motif_kernel import PackedColumn, compile_motif
+
+K_VALUES = (2, 3, 4)
+MAX_WINDOW_KMERS = 256
+INDEX_VERSION = 1
+
+_BITS = 5
+_OTHER_CODE = 31
+_CODES = np.full(256, _OTHER_CODE, dtype=np.uint32)
+_CODES[0] = 0  # Row separator: windows over it are not indexed
+_CODES[np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ*_-.", dtype=np.uint8)] = np.arange(1, 31, dtype=np.uint32)
+
+
+def _window_codes(buf: np.ndarray, starts: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """(k-mer code, row) of every k-window of a packed buffer that stays inside one row."""
+    n = len(buf) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    symbols = _CODES[buf]
+    codes = np.zeros(n, dtype=np.uint64)
+    inside = np.ones(n, dtype=bool)
+    for j in range(k):
+        window = symbols[j : j + n]
+        codes = (codes << np.uint64(_BITS)) | window.astype(np.uint64)
+        inside &= window != 0
+    positions = np.flatnonzero(inside)
+    rows = np.searchsorted(starts, positions, side="right") - 1
+    return codes[positions], rows
+
+
+class _ColumnParts:
+    """Packed sequences and (k-mer, row) pairs of one column, gathered batch by batch."""
+
+    def __init__(self):
+        self.bufs: list[np.ndarray] = []
+        self.lengths: list[np.ndarray] = []
+        self.valid: list[np.ndarray] = []
+        self.pairs: dict[int, list[np.ndarray]] = {k: [] for k in K_VALUES}
+        self.n_rows = 0
+
+    def add(self, series: pl.Series) -> None:
+        packed = PackedColumn.from_series(series)
+        for k in K_VALUES:
+            codes, rows = _window_codes(packed.buf, packed.starts, k)
+            # One key per (k-mer, row), ordered by k-mer then row
+            self.pairs[k].append(np.unique((codes << np.uint64(32)) | (rows + self.n_rows).astype(np.uint64)))
+        self.bufs.append(packed.buf)
+        self.lengths.append(packed.lengths)
+        self.valid.append(packed.valid)
+        self.n_rows += len(packed)
+
+
+class KmerIndexBuilder:
+    """Collects the region columns of every scanned frame, in input order; save() writes the index."""
+
+    def __init__(self, first_row: int = 0):
+        self.first_row = first_row
+        self.columns: dict[str, _ColumnParts] = {}
+        self.keys: list[pl.Series] = []
+        self.n_rows = 0
+
+    def add(self, regions: pl.DataFrame, keys: pl.Series | None = None) -> None:
+        """Add one frame's region columns (and clonotypeKey column, if any)."""
+        height = regions.height
+        for name in regions.columns:
+            if name not in self.columns:
+                self.columns[name] = _ColumnParts()
+                if self.n_rows:  # Column first seen in a later batch: earlier rows have no sequence
+                    self.columns[name].add(pl.Series([None] * self.n_rows, dtype=pl.Utf8))
+        for name, parts in self.columns.items():
+            parts.add(regions[name] if name in regions.columns else pl.Series([None] * height, dtype=pl.Utf8))
+        self.keys.append(keys.cast(pl.Utf8) if keys is not None else pl.Series([None] * height, dtype=pl.Utf8))
+        self.n_rows += height
+
+    def save(self, path: str) -> None:
+        if self.n_rows >= 2**32:
+            raise ValueError(f"k-mer index supports up to 2^32 rows, got {self.n_rows}")
+        arrays = {}
+        for i, parts in enumerate(self.columns.values()):
+            lengths = np.concatenate(parts.lengths)
+            arrays[f"c{i}_buf"] = np.concatenate(parts.bufs)
+            arrays[f"c{i}_lengths"] = lengths.astype(np.uint32)
+            arrays[f"c{i}_valid"] = np.concatenate(parts.valid)
+            for k in K_VALUES:
+                pairs = np.sort(np.concatenate(parts.pairs[k]))  # By k-mer, then row
+                kmers, first = np.unique(pairs >> np.uint64(32), return_index=True)
+                arrays[f"c{i}_k{k}_kmers"] = kmers.astype(np.uint32)
+                arrays[f"c{i}_k{k}_offsets"] = np.append(first, len(pairs)).astype(np.int64)
+                arrays[f"c{i}_k{k}_rows"] = (pairs & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        keys = pl.concat(self.keys) if self.keys else pl.Series([], dtype=pl.Utf8)
+        meta = {
+            "version": INDEX_VERSION,
+            "columns": list(self.columns),
+            "k": list(K_VALUES),
+            "first_row": self.first_row,
+            "n_rows": self.n_rows,
+            "has_keys": bool(keys.is_not_null().any()),
+        }
+        arrays["keys"] = np.array(keys.fill_null("").to_list(), dtype=np.str_)
+        arrays["meta"] = np.array(json.dumps(meta))
+        with open(path, "wb") as f:  # A file object keeps numpy from appending ".npz"
+            np.savez_compressed(f, **arrays)
+
+
+class KmerIndex:
+    """A saved k-mer index; see the module docstring."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        meta = json.loads(str(arrays["meta"]))
+        if meta["version"] != INDEX_VERSION:
+            raise ValueError(f"unsupported k-mer index version {meta['version']}")
+        self.columns: list[str] = meta["columns"]
+        self.first_row: int = meta["first_row"]
+        self.n_rows: int = meta["n_rows"]
+        self._has_keys = meta["has_keys"]
+        self._arrays = arrays
+        self._column_ids = {name: i for i, name in enumerate(self.columns)}
+
+    @classmethod
+    def load(cls, path: str) -> "KmerIndex":
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def _array(self, column: str, name: str) -> np.ndarray:
+        if column not in self._column_ids:
+            raise KeyError(f"column {column!r} is not indexed; indexed columns: {self.columns}")
+        return self._arrays[f"c{self._column_ids[column]}_{name}"]
+
+    def postings(self, column: str, kmer: str) -> np.ndarray:
+        """Sorted local row ids of the rows containing `kmer` (2 to 4 residues, in either case)."""
+        code = 0
+        for byte in kmer.upper().encode("ascii"):
+            code = (code << _BITS) | int(_CODES[byte])
+        return self._code_postings(column, len(kmer), code)
+
+    def _code_postings(self, column: str, k: int, code: int) -> np.ndarray:
+        kmers = self._array(column, f"k{k}_kmers")
+        i = int(np.searchsorted(kmers, code))
+        if i == len(kmers) or kmers[i] != code:
+            return np.zeros(0, dtype=np.uint32)
+        offsets = self._array(column, f"k{k}_offsets")
+        return self._array(column, f"k{k}_rows")[offsets[i] : offsets[i + 1]]
+
+    def _window_rows(self, column: str, classes: tuple[np.ndarray, ...]) -> np.ndarray | None:
+        """Rows holding some k-mer of a run of residue classes; None when it expands too far."""
+        options = [np.unique(_CODES[np.flatnonzero(lut)]) for lut in classes]
+        options = [o[o != 0] for o in options]
+        if np.prod([len(o) for o in options], dtype=np.float64) > MAX_WINDOW_KMERS:
+            return None
+        lists = []
+        for combination in itertools.product(*options):
+            code = 0
+            for symbol in combination:
+                code = (code << _BITS) | int(symbol)
+            lists.append(self._code_postings(column, len(classes), code))
+        return np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype=np.uint32)
+
+    def candidates(self, pattern: str, column: str) -> np.ndarray:
+        """Local row ids that may match `pattern`: the index lookup before verification."""
+        all_rows = np.flatnonzero(self._array(column, "valid"))
+        motif = compile_motif(pattern.upper())
+        if motif is None:
+            return all_rows
+        found = []
+        for alt in motif.alternatives:
+            rows = None
+            for k in range(min(len(alt), max(K_VALUES)), min(K_VALUES) - 1, -1):
+                for offset in range(len(alt) - k + 1):
+                    window = self._window_rows(column, alt[offset : offset + k])
+                    if window is not None:
+                        rows = window if rows is None else np.intersect1d(rows, window, assume_unique=True)
+                if rows is not None:
+                    break  # The longest usable windows are the most selective
+            found.append(all_rows if rows is None else rows.astype(np.int64))
+        return np.unique(np.concatenate(found))
+
+    def query(self, pattern: str, column: str) -> np.ndarray:
+        """Sorted input row numbers whose `column` sequence matches `pattern` (a regex searched
+        in the uppercased sequence, as the scanner does).
+
+        The index holds uppercase residues only, so letters in `pattern` match in either case:
+        a pattern the motif kernel runs is uppercased (kernel patterns have no letter escapes to
+        break), any other regex is searched case-insensitively.
+        """
+        rows = self.candidates(pattern, column)
+        buf, lengths = self._array(column, "buf"), self._array(column, "lengths").astype(np.int64)
+        starts = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1] + 1, out=starts[1:])
+        seqs = pl.Series([buf[starts[r] : starts[r] + lengths[r]].tobytes().decode() for r in rows], dtype=pl.Utf8)
+        motif = compile_motif(pattern.upper())
+        if motif is not None:
+            hits = motif.row_hits(PackedColumn.from_series(seqs))
+        else:
+            compiled = re.compile(pattern, re.IGNORECASE)
+            hits = np.array([compiled.search(s) is not None for s in seqs], dtype=bool)
+        return rows[hits] + self.first_row
+
+    def keys(self, rows: np.ndarray) -> list[str | None]:
+        """clonotypeKey of each input row number (None when the input had no clonotypeKey)."""
+        if not self._has_keys:
+            return [None] * len(rows)
+        return self._arrays["keys"][np.asarray(rows, dtype=np.int64) - self.first_row].tolist()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query a k-mer index written by main.py --kmer-index.")
+    p.add_argument("index", help="Index file (.npz)")
+    p.add_argument("pattern", help="Motif or regex, e.g. 'N[^P][ST]'")
+    p.add_argument("--column", default="CDR3 aa", help="Indexed region column (default: %(default)s)")
+    args = p.parse_args()
+    index = KmerIndex.load(args.index)
+    try:
+        rows = index.query(args.pattern, args.column)
+    except (KeyError, re.error) as e:
+        sys.exit(f"Error: {e}")
+    print(f"{len(index.candidates(args.pattern, args.column))} candidate rows, {len(rows)} matches", file=sys.stderr)
+    for row, key in zip(rows.tolist(), index.keys(rows)):
+        print(f"{row}\t{key}" if key is not None else row)
+
+
+if __name__ == "__main__":
+    main()
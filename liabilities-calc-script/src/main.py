@@ -1,14 +1,37 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import hashlib
+import io
 import json
+import multiprocessing
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
 
+import numpy as np
 import polars as pl
 from polars.exceptions import ShapeError
 
-from annotations import base36_encode, extract_cdrs_fr1, parse_annotations
+import batching
+import checkpoint
+import estimate
+import preview
+import translation
+import tsv_io
+from annotations import base36_encode, extract_cdrs_fr1, load_label_map, parse_annotations
+from chain_scan import ChainScan
+from custom_regex import (
+    DEFAULT_TIME_BUDGET_SECONDS,
+    ON_TIMEOUT,
+    CustomPattern,
+    RegexBudget,
+    RegexTimeout,
+    compile_custom,
+    describe_engine,
+)
 from definitions import (
     FIXABILITY_MAP,
     ORIG_CYS_LIABILITIES,
@@ -20,15 +43,31 @@ from definitions import (
 )
 from detection import (
     _build_risk_level_map,
-    _evaluate_cys_liabilities,
+    _evaluate_cys_liabilities_packed,
     _get_expected_cys_positions,
     classify_risk,
-    identify_liabilities,
+    pattern_match_positions,
+    scan_region_liabilities,
 )
-from scoring import (
-    classify_developability_risk,
-    compute_developability_score,
+from diagnostics import Diagnostics
+from kmer_index import KmerIndexBuilder
+from match_matrix import MatchMatrix, WeightProfile, cost_column, load_weight_profiles
+from motif_kernel import PackedColumn
+from repertoire_summary import RepertoireSummary
+from scan_stats import ScanStats
+from scoring import classify_developability_risk
+from top_k import RISK_ORDER, TopK
+
+_GLOBAL_OUTPUT_COLS = (
+    "Is Productive",
+    "Structural liabilities",
+    "Developability risk",
+    "Developability cost",
+    "Sequence liabilities summary",
 )
+_BOUNDARY_MOTIFS_SUFFIX = "boundary-spanning motifs"
+# Input columns that are scanned or may pass through to the output (besides clonotypeKey)
+_INPUT_COLUMN_SUFFIXES = ("annotations", "aa", translation.NT_SUFFIX, " liabilities", " risk")
 
 
 def _is_productive_expr(liab_cols: list[str], fixability_map: dict[str, str]) -> pl.Expr:
@@ -58,10 +97,10 @@ def _structural_risk_expr(liab_cols: list[str], fixability_map: dict[str, str])
 
 
 def _combine_heavy_light_prefixed_columns(
-    df: pl.DataFrame, suffix: str, prefixes: tuple = ("Heavy", "Light")
-) -> pl.DataFrame:
+    df: pl.LazyFrame, suffix: str, prefixes: tuple = ("Heavy", "Light")
+) -> pl.LazyFrame:
     prefixed_cols_map = {prefix: {} for prefix in prefixes}
-    current_df_columns = df.columns
+    current_df_columns = df.collect_schema().names()
     for col_name in current_df_columns:
         if col_name.endswith(f" {suffix}"):
             for prefix_val in prefixes:
@@ -82,6 +121,7 @@ def _combine_heavy_light_prefixed_columns(
     else:
         common_bases = set()
     cols_to_drop = []
+    combined_exprs = []
     for base_name in common_bases:
         if not base_name:
             continue
@@ -104,15 +144,343 @@ def _combine_heavy_light_prefixed_columns(
                 all_chains_present_for_base = False
                 break
         if all_chains_present_for_base and concat_expressions:
-            if combined_col_name not in df.columns:
-                df = df.with_columns(pl.concat_str(concat_expressions).alias(combined_col_name))
+            if combined_col_name not in current_df_columns:
+                combined_exprs.append(pl.concat_str(concat_expressions).alias(combined_col_name))
                 cols_to_drop.extend(temp_cols_to_drop_for_base)
-    final_cols_to_drop = [col for col in cols_to_drop if col in df.columns]
+    if combined_exprs:
+        df = df.with_columns(combined_exprs)
+    final_cols_to_drop = [col for col in cols_to_drop if col in current_df_columns]
     if final_cols_to_drop:
         df = df.drop(final_cols_to_drop)
     return df
 
 
+def _is_region_fragment_col(col_name: str) -> bool:
+    """True for extracted/pre-fragmented region columns such as 'Heavy CDR1 aa' (FR4 and full chains excluded)."""
+    lowered = col_name.lower()
+    return (
+        lowered.endswith(" aa")
+        and any(k in lowered for k in ["cdr1", "cdr2", "cdr3", "fr1", "fr2", "fr3"])
+        and not lowered.endswith("sequence aa")
+    )
+
+
+def _fragment_region(col_name: str) -> str:
+    """Core region name (e.g. 'CDR1') of a fragment column, or 'UNKNOWN_REGION'."""
+    match = re.search(r"(FR[1-4]|CDR[1-3])", col_name, re.IGNORECASE)
+    return match.group(1).upper() if match else "UNKNOWN_REGION"
+
+
+def _label_map_regions(region_map: dict[str, str]) -> list[str]:
+    """Region names extract_cdrs_fr1 can produce for a label map, in label-map order."""
+    region_names = list(dict.fromkeys(region_map.values()))
+    if "CDR1" in region_names and "FR1" not in region_names:
+        region_names.append("FR1")
+    return region_names
+
+
+def _extract_and_scan_chain(
+    seqs: list,
+    anns: list,
+    prefix_for_frag_col: str,
+    region_map: dict[str, str],
+    calculate_liabilities: bool,
+    active_cys_defs: dict,
+    active_liability_regex: dict,
+    expected_cys_map: dict,
+    region_scan_kwargs: dict | None = None,
+    stats_template: ScanStats | None = None,
+    regex_budget: RegexBudget | None = None,
+    boundary_motifs: bool = False,
+    diagnostics_template: Diagnostics | None = None,
+) -> tuple[list, list, pl.DataFrame | None, dict, ScanStats | None, RegexBudget | None, Diagnostics | None]:
+    """Path A worker for one chain: extract regions from annotations and scan them for liabilities.
+
+    Returns the original annotation parts per row (None when the row is skipped), the
+    liability hits per row as (name, global_start, length) in discovery order (the untouched
+    annotation value for skipped rows), and a DataFrame of the extracted fragment columns.
+    When region_scan_kwargs is given, the fragment DataFrame also carries the per-region
+    "... aa liabilities" columns, whose per-rule row hits are returned next (liabilities
+    column → rule → rows), and with boundary_motifs a "<prefix>boundary-spanning
+    motifs" column. Kernel motif rules run once over the whole chain (chain_scan.ChainScan)
+    and their matches are attributed to the regions. Label-map codes are not assigned here
+    so chains can run in separate processes. With stats_template, the rule statistics of that scan are
+    collected in a fresh collector for the caller to merge; likewise the time spent from a
+    spawn of regex_budget, and the input warnings in a spawn of diagnostics_template.
+    """
+    stats = stats_template.spawn() if stats_template is not None else None
+    budget = regex_budget.spawn() if regex_budget is not None else None
+    diagnostics = diagnostics_template.spawn() if diagnostics_template is not None else None
+    row_ann_parts, row_hits = [], []
+    # Per region: row-aligned fragment, start coordinate and rank in the row's extraction order.
+    region_frags: dict[str, list] = {}
+    region_starts: dict[str, list] = {}
+    region_ends: dict[str, list] = {}
+    region_ranks: dict[str, list] = {}
+    n_rows = len(seqs)
+    for i, (seq_data, ann_data) in enumerate(zip(seqs, anns)):
+        if seq_data is None or ann_data is None:
+            row_ann_parts.append(None)
+            row_hits.append(ann_data)
+            continue
+
+        parsed_segments = parse_annotations(ann_data, diagnostics)
+        extracted_frags, frag_coords = extract_cdrs_fr1(seq_data, parsed_segments, region_map, diagnostics)
+        row_ann_parts.append([p for p in (ann_data.split("|") if ann_data and ann_data.strip() else []) if p])
+        row_hits.append([])
+        for rank, (region_name, fragment_seq) in enumerate(extracted_frags.items()):
+            if region_name not in region_frags:
+                region_frags[region_name] = [None] * n_rows
+                region_starts[region_name] = [-1] * n_rows
+                region_ends[region_name] = [-1] * n_rows
+                region_ranks[region_name] = [0] * n_rows
+            region_frags[region_name][i] = fragment_seq
+            region_start, region_length = frag_coords[region_name]
+            region_starts[region_name][i] = region_start
+            region_ends[region_name][i] = region_start + region_length
+            region_ranks[region_name][i] = rank
+
+    chain = None
+    if calculate_liabilities:
+        spans = {
+            name: (np.array(region_starts[name], dtype=np.int64), np.array(region_ends[name], dtype=np.int64))
+            for name in region_frags
+        }
+        chain = ChainScan([s if isinstance(s, str) else None for s in seqs], spans)
+
+    if calculate_liabilities:
+        # Each region column is scanned at once with the motif kernel. Hits carry a
+        # (region rank, rule index, offset) key so every row lists them in the same order
+        # as a per-fragment scan would discover them: cysteine check first, then each
+        # regex rule's matches left to right.
+        keyed_hits: dict[int, list] = {}
+        for region_name, fragments in region_frags.items():
+            packed = PackedColumn.from_series(pl.Series(fragments, dtype=pl.Utf8))
+            present = np.array([f is not None for f in fragments], dtype=bool)
+            starts, ranks = region_starts[region_name], region_ranks[region_name]
+            if active_cys_defs and region_name in {"FR1", "FR2", "FR3", "CDR1", "CDR2", "CDR3"}:
+                expected_positions, expected_count, should_check = _get_expected_cys_positions(
+                    region_name, expected_cys_map
+                )
+                if should_check:
+                    missing_cys, extra_cys = _evaluate_cys_liabilities_packed(
+                        packed, expected_positions, expected_count
+                    )
+                    for cys_liability_name, flagged in (
+                        ("Missing Cysteines", missing_cys),
+                        ("Extra Cysteines", extra_cys & ~missing_cys),
+                    ):
+                        if cys_liability_name not in active_cys_defs:
+                            continue
+                        for r in np.flatnonzero(flagged & present):
+                            # Length 0 for point annotation
+                            keyed_hits.setdefault(r, []).append((ranks[r], -1, 0, cys_liability_name, starts[r], 0))
+            if region_name != "FR1":  # For CDRs and other non-FR1 regions from extraction
+                for rule_idx, (liability_name, pattern) in enumerate(active_liability_regex.items()):
+                    chain_matches = chain.region_matches(pattern, region_name)
+                    if chain_matches is not None:
+                        rows, offsets = chain_matches
+                        lengths = np.full(len(rows), chain.motif(pattern).fixed_length, dtype=np.int64)
+                    else:
+                        rows, offsets, lengths = pattern_match_positions(packed, pattern)
+                    for r, offset, length in zip(rows.tolist(), offsets.tolist(), lengths.tolist()):
+                        keyed_hits.setdefault(r, []).append(
+                            (ranks[r], rule_idx, offset, liability_name, starts[r] + offset, length)
+                        )
+        for r, hits in keyed_hits.items():
+            hits.sort()
+            row_hits[r] = [(name, global_start, length) for _rank, _rule, _offset, name, global_start, length in hits]
+
+    # The fragment columns follow the label map rather than the rows that happen to be present,
+    # so every shard or batch of the same input produces the same schema (rows missing a
+    # region get null, which scans as "Unknown").
+    frag_df = None
+    region_names = _label_map_regions(region_map)
+    if region_names:
+        frag_df = pl.DataFrame(
+            {
+                f"{prefix_for_frag_col}{region_name} aa": pl.Series(
+                    region_frags.get(region_name, [None] * n_rows), dtype=pl.Utf8
+                )
+                for region_name in region_names
+            }
+        )
+    column_hits: dict[str, dict[str, np.ndarray]] = {}
+    if frag_df is not None and region_scan_kwargs is not None:
+        chain_regions = {name: chain.region(name) for name in chain.spans} if chain is not None else {}
+        frag_df = frag_df.with_columns(
+            [
+                scan_region_liabilities(
+                    frag_df[frag_col],
+                    _fragment_region(frag_col),
+                    **region_scan_kwargs,
+                    stats=stats,
+                    regex_budget=budget,
+                    chain_region=chain_regions.get(region_name),
+                    rule_hits=column_hits.setdefault(f"{frag_col} liabilities", {}),
+                ).alias(f"{frag_col} liabilities")
+                for region_name, frag_col in zip(region_names, frag_df.columns)
+                if _is_region_fragment_col(frag_col)
+            ]
+        )
+    if frag_df is not None and chain is not None and boundary_motifs:
+        frag_df = frag_df.with_columns(
+            chain.boundary_hits(active_liability_regex).alias(f"{prefix_for_frag_col}{_BOUNDARY_MOTIFS_SUFFIX}")
+        )
+    return row_ann_parts, row_hits, frag_df, column_hits, stats, budget, diagnostics
+
+
+def _run_chain_jobs(
+    jobs: list[tuple[list, list, str]], chain_kwargs: dict, parallel: bool = True
+) -> list[tuple[list, list, pl.DataFrame | None, dict, ScanStats | None, RegexBudget | None, Diagnostics | None]]:
+    """Run _extract_and_scan_chain for every chain, concurrently when there is more than one.
+
+    Heavy and Light chains are independent until their columns are combined, so paired
+    single-cell input is processed in one worker process per chain. Python regex holds the
+    GIL, hence processes rather than threads; "spawn" avoids forking Polars' thread pool.
+    Falls back to in-process execution when only one CPU is available to this job or
+    when `parallel` is False.
+    """
+    max_workers = min(len(jobs), batching.available_cpus()) if parallel else 1
+    if max_workers <= 1:
+        return [_extract_and_scan_chain(*job, **chain_kwargs) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(_extract_and_scan_chain, *job, **chain_kwargs) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def _parse_shard(spec: str) -> tuple[int, int]:
+    """Parse a '--shard i/n' value into (i, n) with 0 <= i < n."""
+    try:
+        index_str, count_str = spec.split("/")
+        index, count = int(index_str), int(count_str)
+    except ValueError:
+        raise ValueError(f"--shard must look like 'i/n', got {spec!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"--shard index must satisfy 0 <= i < n, got {spec!r}")
+    return index, count
+
+
+def _shard_bounds(n_rows: int, index: int, count: int) -> tuple[int, int]:
+    """Deterministic contiguous [start, end) row range of shard `index` out of `count`."""
+    return n_rows * index // count, n_rows * (index + 1) // count
+
+
+def _input_columns(columns: list[str]) -> list[str]:
+    """The (normalized) input columns the scan reads or may carry to the output; all of
+    them when none is recognised. Other columns are dropped as they are read."""
+    kept = [
+        c
+        for c in columns
+        if c == "clonotypeKey" or c.lower().endswith(_INPUT_COLUMN_SUFFIXES) or c in _GLOBAL_OUTPUT_COLS
+    ]
+    return kept or columns
+
+
+def _scan_input(input_tsv: str) -> pl.LazyFrame:
+    """Lazy read of the input TSV with normalized column names, projected to _input_columns."""
+    lf = pl.scan_csv(input_tsv, separator="\t", ignore_errors=True, infer_schema_length=1000)
+    normalized = {c: " ".join(c.strip().split()) for c in lf.collect_schema().names()}
+    return lf.rename(normalized).select(_input_columns(list(normalized.values())))
+
+
+def _read_shard(input_tsv: str, index: int, count: int) -> tuple[pl.DataFrame, int]:
+    """Read one shard's rows and its first row's index in the input. The schema is inferred
+    from the head of the whole file (as a full read would), so every shard parses columns
+    identically."""
+    lf = _scan_input(input_tsv)
+    n_rows = lf.select(pl.len()).collect().item()
+    start, end = _shard_bounds(n_rows, index, count)
+    print(f"Shard {index}/{count}: rows {start}..{end} of {n_rows}")
+    return lf.slice(start, end - start).collect(), start
+
+
+@dataclass
+class ScanConfig:
+    """Active rule set and scoring maps for one run, shared by every batch."""
+
+    active_cdr_defs: dict
+    active_extra_defs: dict
+    active_cys_defs: dict
+    active_liability_regex: dict
+    active_extra_defs_full_seq: dict
+    active_custom_defs: dict
+    expected_cys_map: dict
+    calculate_liabilities: bool
+    combined_fixability_map: dict
+    combined_risk_level_map: dict
+    initial_region_map: dict
+    regex_budget: RegexBudget
+    weight_profiles: dict[str, WeightProfile] = field(default_factory=dict)  # --weights: one cost column each
+    boundary_motifs: bool = False  # Path A: report motifs spanning a region boundary
+
+    def liability_names(self) -> list[str]:
+        """The active rules in code-table order: predefined (definition order), custom, cysteine."""
+        if not self.calculate_liabilities:
+            return []
+        names = list(self.active_liability_regex) + list(self.active_custom_defs) + list(self.active_cys_defs)
+        return list(dict.fromkeys(names))
+
+    def rule_set_hash(self) -> str:
+        """SHA-256 of everything here that decides the output (rules, maps, weights, label map;
+        not the regex time budget). Outputs of runs with equal hashes can be combined."""
+        document = {f.name: getattr(self, f.name) for f in fields(self) if f.name != "regex_budget"}
+        return hashlib.sha256(json.dumps(document, default=_rule_set_json).encode()).hexdigest()
+
+
+def _rule_set_json(value):
+    """JSON form of the non-JSON values in a ScanConfig (compiled patterns, weight profiles)."""
+    if isinstance(value, CustomPattern):
+        return value.pattern
+    if isinstance(value, re.Pattern):
+        return [value.pattern, value.flags]
+    if isinstance(value, WeightProfile):
+        return asdict(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} is not part of a rule set")
+
+
+class LiabilityCodes:
+    """Liability name → annotation code, numbered after the largest numeric --label-map key.
+
+    Codes are assigned up front from the ordered rule set, not in the order hits turn up,
+    so every partitioning of the input (batches, shards) yields the same annotations and
+    label map.
+    """
+
+    def __init__(self, initial_region_map: dict, liability_names: list[str] = ()):
+        existing_numeric_keys = [int(k) for k in initial_region_map.keys() if str(k).isdigit()]
+        self.next_code = max(existing_numeric_keys or [-1]) + 1
+        self.codes: dict[str, str] = {}
+        for name in liability_names:
+            self.code_for(name)
+
+    @classmethod
+    def for_config(cls, config: ScanConfig) -> "LiabilityCodes":
+        return cls(config.initial_region_map, config.liability_names())
+
+    def code_for(self, liability_name: str) -> str:
+        if liability_name not in self.codes:
+            self.codes[liability_name] = str(self.next_code)
+            self.next_code += 1
+        return self.codes[liability_name]
+
+
+@dataclass
+class FrameResult:
+    """Output of _process_frame; `header` is what to write when df_out has no columns."""
+
+    df_out: pl.DataFrame
+    header: list[str]
+    cols_for_liability_analysis: list[str]
+    has_input_ann_cols: bool
+    liabilities_calculated: bool
+    match_matrix: MatchMatrix | None = None
+    # Output liabilities column → rule → the rows it lists the rule in, from the scan itself
+    rule_hits: dict[str, dict[str, np.ndarray]] | None = None
+
+
 def _output_final_label_map(base_map: dict, liability_map: dict, output_path: str | None, description: str):
     final_map_all_strings = {}
     for key, value in base_map.items():
@@ -226,60 +594,47 @@ def _create_sequence_liabilities_summary_str(row_dict: dict) -> str:
     return " | ".join(final_summary_elements)
 
 
-# ——— MAIN SCRIPT —————————————————————————————————————
-def main():
-    p = argparse.ArgumentParser(description="Extract CDRs/FR1, analyze liabilities, compute risk.")
-    p.add_argument("input_tsv", help="Input TSV")
-    p.add_argument("output_tsv", help="Output TSV")
-    p.add_argument("-m", "--label-map", help="JSON file or string for numeric region labels to names.")
-    p.add_argument(
-        "-o",
-        "--output-label-map",
-        help="Where to write JSON label map. Empty map if no input annotations or no liabilities calculated.",
-    )
-    p.add_argument(
-        "--include-liabilities",
-        type=str,
-        help=(
-            "A comma-delimited string of specific liability names to calculate"
-            ' (e.g., "Deamidation (N[GS]),Methionine Oxidation (M)").'
-            " If not provided, no liabilities or risks are calculated."
-        ),
-    )
-    p.add_argument(
-        "--output-regions-found", type=str, help="Path to output a JSON list of found regions (CDR1, CDR2, CDR3, FR1)."
-    )
-    p.add_argument(
-        "--numbering-schema",
-        type=str,
-        help="Optional numbering schema name (e.g., imgt, kabat, chothia) to adjust conserved cysteine coordinates.",
-    )
-    p.add_argument(
-        "--custom-liabilities",
-        type=str,
-        help="Path to a JSON file containing an array of custom liability definitions.",
-    )
-    p.add_argument(
-        "--use-predefined-liabilities",
-        type=str,
-        default="true",
-        help="Whether to apply predefined liability definitions (default: true).",
-    )
-    p.add_argument(
-        "--disabled-predefined-liabilities",
-        type=str,
-        help="Path to a JSON file containing an array of predefined liability names to disable.",
-    )
-    args = p.parse_args()
-
-    use_predefined = str(args.use_predefined_liabilities).strip().lower() not in ("false", "0", "no")
-
+def _silent(*_args, **_kwargs) -> None:
+    pass
+
+
+def compile_custom_liabilities(custom_list: list[dict]) -> dict[str, dict]:
+    """Custom liability entries ({name, pattern, riskLevel, fixability, regions}) keyed by name,
+    patterns compiled. Raises KeyError for a missing field, re.error for an invalid pattern."""
+    return {
+        entry["name"]: {
+            "pattern": compile_custom(entry["pattern"]),
+            "riskLevel": entry["riskLevel"],
+            "fixability": entry["fixability"],
+            "regions": entry["regions"],
+        }
+        for entry in custom_list
+    }
+
+
+def build_scan_config(
+    use_predefined: bool = True,
+    include_liabilities: set[str] | None = None,
+    disabled_liabilities: set[str] = frozenset(),
+    active_custom_defs: dict[str, dict] | None = None,
+    numbering_schema: str | None = None,
+    initial_region_map: dict | None = None,
+    regex_budget: RegexBudget | None = None,
+    weight_profiles: dict[str, WeightProfile] | None = None,
+    boundary_motifs: bool = False,
+) -> ScanConfig:
+    """Active rule set and scoring maps from the rule selection.
+
+    `include_liabilities` limits the predefined rules (default: all of them), then
+    `disabled_liabilities` removes names; `active_custom_defs` comes from
+    compile_custom_liabilities. Each of `weight_profiles` adds a cost column, and
+    `boundary_motifs` a column of region-boundary-spanning motifs per Path A chain.
+    """
     # When --include-liabilities is absent, default to all predefined names.
     # The exclude-list (--disabled-predefined-liabilities) then trims specific entries.
     CALCULATE_LIABILITIES = True
-    if args.include_liabilities is not None:
-        raw_names = args.include_liabilities.split(",")
-        USER_REQUESTED_LIABILITIES = {name.strip() for name in raw_names if name.strip()}
+    if include_liabilities is not None:
+        USER_REQUESTED_LIABILITIES = set(include_liabilities)
     else:
         USER_REQUESTED_LIABILITIES = set(ORIG_REGEX_LIABILITIES) | set(ORIG_EXTRA_PATTERNS) | set(ORIG_CYS_LIABILITIES)
 
@@ -288,16 +643,11 @@ def main():
             USER_REQUESTED_LIABILITIES
         )
         # Apply disabled predefined liabilities
-        if args.disabled_predefined_liabilities:
-            try:
-                with open(args.disabled_predefined_liabilities) as f:
-                    disabled_names = set(json.load(f))
-                active_cdr_defs = {n: d for n, d in active_cdr_defs.items() if n not in disabled_names}
-                active_extra_defs = {n: p for n, p in active_extra_defs.items() if n not in disabled_names}
-                active_cys_defs = {n: d for n, d in active_cys_defs.items() if n not in disabled_names}
-                active_liability_regex = {n: p for n, p in active_liability_regex.items() if n not in disabled_names}
-            except Exception as e:
-                print(f"Warning: Could not load --disabled-predefined-liabilities: {e}", file=sys.stderr)
+        if disabled_liabilities:
+            active_cdr_defs = {n: d for n, d in active_cdr_defs.items() if n not in disabled_liabilities}
+            active_extra_defs = {n: p for n, p in active_extra_defs.items() if n not in disabled_liabilities}
+            active_cys_defs = {n: d for n, d in active_cys_defs.items() if n not in disabled_liabilities}
+            active_liability_regex = {n: p for n, p in active_liability_regex.items() if n not in disabled_liabilities}
     else:
         active_cdr_defs, active_extra_defs, active_cys_defs, active_liability_regex = {}, {}, {}, {}
 
@@ -306,25 +656,9 @@ def main():
     # data) rather than per-region fragments, where MiXCR's boundary artifacts cause false
     # positives. See active_extra_defs_for_per_region below for the routing decision.
     active_extra_defs_full_seq = dict(ORIG_EXTRA_PATTERNS)
+    active_custom_defs = dict(active_custom_defs or {})
 
-    # Load custom liabilities
-    active_custom_defs: dict[str, dict] = {}
-    if args.custom_liabilities:
-        try:
-            with open(args.custom_liabilities) as f:
-                custom_list = json.load(f)
-            for entry in custom_list:
-                name = entry["name"]
-                active_custom_defs[name] = {
-                    "pattern": re.compile(entry["pattern"]),
-                    "riskLevel": entry["riskLevel"],
-                    "fixability": entry["fixability"],
-                    "regions": entry["regions"],
-                }
-        except Exception as e:
-            print(f"Warning: Could not load --custom-liabilities: {e}", file=sys.stderr)
-
-    expected_cys_map = build_expected_cys_map(args.numbering_schema)
+    expected_cys_map = build_expected_cys_map(numbering_schema)
 
     if not (
         active_cdr_defs or active_extra_defs or active_cys_defs or active_custom_defs or active_extra_defs_full_seq
@@ -342,40 +676,134 @@ def main():
     combined_risk_level_map = _build_risk_level_map(active_cdr_defs, active_cys_defs)
     combined_risk_level_map.update({name: d["riskLevel"] for name, d in active_custom_defs.items()})
 
-    initial_region_map = {}
-    if args.label_map:
+    return ScanConfig(
+        active_cdr_defs=active_cdr_defs,
+        active_extra_defs=active_extra_defs,
+        active_cys_defs=active_cys_defs,
+        active_liability_regex=active_liability_regex,
+        active_extra_defs_full_seq=active_extra_defs_full_seq,
+        active_custom_defs=active_custom_defs,
+        expected_cys_map=expected_cys_map,
+        calculate_liabilities=CALCULATE_LIABILITIES,
+        combined_fixability_map=combined_fixability_map,
+        combined_risk_level_map=combined_risk_level_map,
+        initial_region_map=dict(initial_region_map or {}),
+        regex_budget=regex_budget if regex_budget is not None else RegexBudget(),
+        weight_profiles=dict(weight_profiles or {}),
+        boundary_motifs=boundary_motifs,
+    )
+
+
+def _build_scan_config(args) -> ScanConfig:
+    use_predefined = str(args.use_predefined_liabilities).strip().lower() not in ("false", "0", "no")
+    include_liabilities = None
+    if args.include_liabilities is not None:
+        raw_names = args.include_liabilities.split(",")
+        include_liabilities = {name.strip() for name in raw_names if name.strip()}
+
+    disabled_names: set[str] = set()
+    if use_predefined and args.disabled_predefined_liabilities:
         try:
-            if os.path.isfile(args.label_map):
-                with open(args.label_map, "r") as f:
-                    initial_region_map = json.load(f)
-            else:
-                initial_region_map = json.loads(args.label_map)
-            if not isinstance(initial_region_map, dict):
-                initial_region_map = {}
+            with open(args.disabled_predefined_liabilities) as f:
+                disabled_names = set(json.load(f))
         except Exception as e:
-            print(f"Error loading --label-map: {e}", file=sys.stderr)
-            initial_region_map = {}
+            print(f"Warning: Could not load --disabled-predefined-liabilities: {e}", file=sys.stderr)
 
-    liability_codes = {}
-    existing_numeric_keys = (
-        [int(k) for k in initial_region_map.keys() if str(k).isdigit()] if isinstance(initial_region_map, dict) else []
+    # Load custom liabilities
+    active_custom_defs: dict[str, dict] = {}
+    if args.custom_liabilities:
+        try:
+            with open(args.custom_liabilities) as f:
+                active_custom_defs = compile_custom_liabilities(json.load(f))
+        except Exception as e:
+            print(f"Warning: Could not load --custom-liabilities: {e}", file=sys.stderr)
+            active_custom_defs = {}
+        for name, custom_def in active_custom_defs.items():
+            print(describe_engine(name, custom_def["pattern"]))
+
+    weight_profiles = {}
+    if args.weights:
+        try:
+            weight_profiles = load_weight_profiles(args.weights)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Error loading --weights '{args.weights}': {e}")
+
+    return build_scan_config(
+        use_predefined,
+        include_liabilities,
+        disabled_names,
+        active_custom_defs,
+        args.numbering_schema,
+        load_label_map(args.label_map),
+        RegexBudget(args.regex_time_budget or None, args.on_regex_timeout),
+        weight_profiles,
+        args.boundary_motifs,
     )
-    next_code = max(existing_numeric_keys or [-1]) + 1
 
-    try:
-        df = pl.read_csv(args.input_tsv, separator="\t", ignore_errors=True, infer_schema_length=1000)
-        df.columns = [" ".join(col.strip().split()) for col in df.columns]  # Normalize column names
-    except Exception as e:
-        sys.exit(f"Error reading input TSV '{args.input_tsv}': {e}")
+
+def _process_frame(
+    df: pl.DataFrame,
+    config: ScanConfig,
+    codes: LiabilityCodes,
+    parallel_chains: bool = True,
+    stats: ScanStats | None = None,
+    explain: bool = False,
+    verbose: bool = True,
+    kmer_index: KmerIndexBuilder | None = None,
+    diagnostics: Diagnostics | None = None,
+) -> FrameResult:
+    """Extract regions, scan liabilities and score one input frame (the whole input or a batch).
+
+    Region extraction and the liability scans run eagerly (NumPy kernel, chain workers);
+    everything after them (full-chain checks, summary, risks, global columns, Heavy/Light
+    combination, output selection) is a single lazy Polars plan collected once, printed
+    first when `explain` is set; only the liability columns are collected before it, into
+    the match matrix the cost columns are scored from (FrameResult.match_matrix, local row
+    numbers). Rule statistics are added to `stats` when given; its
+    row_offset must be the frame's first input row. The region columns are added to
+    `kmer_index` when given. Progress messages go to stdout only when `verbose`; warnings
+    always go to stderr, except the per-row input warnings, which are counted in
+    `diagnostics` when given.
+    """
+    log = print if verbose else _silent
+    active_cdr_defs = config.active_cdr_defs
+    active_extra_defs = config.active_extra_defs
+    active_cys_defs = config.active_cys_defs
+    active_liability_regex = config.active_liability_regex
+    active_extra_defs_full_seq = config.active_extra_defs_full_seq
+    active_custom_defs = config.active_custom_defs
+    expected_cys_map = config.expected_cys_map
+    combined_fixability_map = config.combined_fixability_map
+    combined_risk_level_map = config.combined_risk_level_map
+    initial_region_map = config.initial_region_map
+    CALCULATE_LIABILITIES = config.calculate_liabilities
+
     df_processed = df.clone()
+    # Nucleotide columns ("Heavy sequence nt", "CDR3 nt", ...) without an amino-acid
+    # counterpart are translated in one frame, so the stop codon / out-of-frame checks
+    # below see the real reading frame.
+    df_processed, translated_cols = translation.translate_nt_columns(df_processed)
+    if translated_cols:
+        log(f"Translated nucleotide columns: {translated_cols}")
 
     ann_cols = [c for c in df_processed.columns if c.lower().endswith("annotations")]
     # Path A: input has annotation columns (MiXCR-origin data — regions extracted from annotations).
     # Path B: no annotation columns (pre-fragmented user data — CDR/FR columns already present).
     has_input_ann_cols = bool(ann_cols)
+    # MiXCR places * at CDR/FR boundaries (split codons at V-D-J junctions), so per-region
+    # stop codon / OOF detection produces false positives on MiXCR-origin data. Annotation
+    # columns identify MiXCR-origin data — strip these patterns and rely on the full-sequence
+    # check instead. Pre-fragmented input (Path B, no annotations) contains genuine sequences.
+    active_extra_defs_for_per_region = (
+        {n: p for n, p in active_extra_defs.items() if n not in ORIG_EXTRA_PATTERNS}
+        if has_input_ann_cols  # MiXCR data: per-region seqs may have boundary artifacts
+        else active_extra_defs  # pre-fragmented user data: stop codon/OOF in fragments is real
+    )
+
     all_seq_cols = [c for c in df_processed.columns if c.lower().endswith("aa")]  # All potential sequence columns
     TARGET_REGION_KEYS = ["cdr1 aa", "cdr2 aa", "cdr3 aa", "fr1 aa", "fr2 aa", "fr3 aa"]  # For Path B
     cols_for_liability_analysis = []
+    column_hits: dict[str, dict[str, np.ndarray]] = {}  # Liabilities column → rule → rows listing it
     skip_extraction_due_to_preexisting_regions = False
 
     # Collect full-chain AA columns (e.g. "Heavy sequence aa") for stop codon / OOF detection.
@@ -403,7 +831,7 @@ def main():
                     expected_col_name = " ".join(f"{prefix_for_col_lookup}{region_base} aa".split())
                     if expected_col_name not in df_processed.columns:
                         current_prefix_all_regions_found = False
-                        print(f"Pre-existing check: '{expected_col_name}' not found for prefix '{ann_prefix_raw}'.")
+                        log(f"Pre-existing check: '{expected_col_name}' not found for prefix '{ann_prefix_raw}'.")
                         break
                     temp_cols_for_liability_if_skipping.append(expected_col_name)
                 if not current_prefix_all_regions_found:
@@ -413,12 +841,12 @@ def main():
                 skip_extraction_due_to_preexisting_regions = True
                 cols_for_liability_analysis.extend(temp_cols_for_liability_if_skipping)
                 cols_for_liability_analysis = sorted(list(set(cols_for_liability_analysis)))
-                print(f"Pre-existing CDR/FR columns found. Skipping extraction. Using: {cols_for_liability_analysis}")
+                log(f"Pre-existing CDR/FR columns found. Skipping extraction. Using: {cols_for_liability_analysis}")
 
     if skip_extraction_due_to_preexisting_regions:
-        print(f"Proceeding with pre-existing columns: {cols_for_liability_analysis}")
+        log(f"Proceeding with pre-existing columns: {cols_for_liability_analysis}")
     elif has_input_ann_cols:  # Path A: Annotation-based extraction
-        print(
+        log(
             "Path A: Extracting regions and updating annotations"
             " (with FR1 specific logic if liabilities are calculated)."
         )
@@ -433,6 +861,9 @@ def main():
         processed_frag_dfs = []
         str_key_initial_region_map = {str(k): str(v) for k, v in initial_region_map.items()}
 
+        # Resolve every annotation column to its chain sequence column up front, so that each
+        # chain can be extracted and scanned independently (and concurrently) below.
+        chain_jobs = []
         for ann_col_name in ann_cols:
             current_prefix_raw = ann_col_name[: -len("annotations")].strip().rstrip("_")
             seq_col_name_to_find = (
@@ -449,92 +880,77 @@ def main():
                     file=sys.stderr,
                 )
                 continue
+            prefix_for_frag_col = (
+                f"{current_prefix_raw.capitalize()} " if current_prefix_raw and multiple_chains_present else ""
+            )
+            chain_jobs.append((ann_col_name, matched_seq_cols[0], prefix_for_frag_col))
+
+        chain_kwargs = dict(
+            region_map=str_key_initial_region_map,
+            calculate_liabilities=CALCULATE_LIABILITIES,
+            active_cys_defs=active_cys_defs,
+            active_liability_regex=active_liability_regex,
+            expected_cys_map=expected_cys_map,
+            region_scan_kwargs=(
+                dict(
+                    active_cdr_defs=active_cdr_defs,
+                    active_extra_defs=active_extra_defs_for_per_region,
+                    active_cys_defs=active_cys_defs,
+                    expected_cys_map=expected_cys_map,
+                    active_custom_defs=active_custom_defs,
+                )
+                if CALCULATE_LIABILITIES
+                else None
+            ),
+            stats_template=stats,
+            regex_budget=config.regex_budget,
+            boundary_motifs=config.boundary_motifs,
+            diagnostics_template=diagnostics,
+        )
+        chain_results = _run_chain_jobs(
+            [
+                (df_processed[seq_col_name].to_list(), df_processed[ann_col_name].to_list(), prefix_for_frag_col)
+                for ann_col_name, seq_col_name, prefix_for_frag_col in chain_jobs
+            ],
+            chain_kwargs,
+            parallel=parallel_chains,
+        )
 
-            seq_col_name = matched_seq_cols[0]
-            updated_annotations_for_col, fragment_rows_for_col = [], []
-
-            for seq_data, ann_data in zip(df_processed[seq_col_name].to_list(), df_processed[ann_col_name].to_list()):
-                if seq_data is None or ann_data is None:
-                    updated_annotations_for_col.append(ann_data)
-                    fragment_rows_for_col.append({})
+        # Codes come from the rule-set code table, so annotations do not depend on chain or
+        # row order, nor on how the input was partitioned.
+        updated_annotation_cols = []
+        for (ann_col_name, _seq_col_name, _prefix), (
+            row_ann_parts,
+            row_hits,
+            frag_df,
+            chain_column_hits,
+            chain_stats,
+            chain_budget,
+            chain_diagnostics,
+        ) in zip(chain_jobs, chain_results):
+            if chain_stats is not None:
+                stats.merge(chain_stats)
+            if chain_budget is not None:
+                config.regex_budget.absorb(chain_budget)
+            if chain_diagnostics is not None:
+                diagnostics.merge(chain_diagnostics)
+            updated_annotations_for_col = []
+            for current_ann_parts, hits in zip(row_ann_parts, row_hits):
+                if current_ann_parts is None:
+                    updated_annotations_for_col.append(hits)  # Null sequence/annotation: original value
                     continue
-
-                parsed_segments = parse_annotations(ann_data)
-                extracted_frags, frag_coords = extract_cdrs_fr1(seq_data, parsed_segments, str_key_initial_region_map)
-                current_ann_parts = [p for p in (ann_data.split("|") if ann_data and ann_data.strip() else []) if p]
-
-                if CALCULATE_LIABILITIES:
-                    for region_name, fragment_seq in extracted_frags.items():
-                        # Uppercase locally for case-sensitive detection (MiXCR lowercases
-                        # germline-imputed residues). Exported fragments below use the
-                        # original-case values, so this stays confined to scanning.
-                        fragment_seq = fragment_seq.upper()
-                        start_coord, _ = frag_coords[region_name]
-                        if active_cys_defs and region_name in {"FR1", "FR2", "FR3", "CDR1", "CDR2", "CDR3"}:
-                            expected_positions, expected_count, should_check = _get_expected_cys_positions(
-                                region_name, expected_cys_map
-                            )
-                            if should_check:
-                                missing_cys, extra_cys, _ = _evaluate_cys_liabilities(
-                                    fragment_seq, expected_positions, expected_count
-                                )
-                                cys_liability_name = None
-                                if missing_cys:
-                                    cys_liability_name = "Missing Cysteines"
-                                elif extra_cys:
-                                    cys_liability_name = "Extra Cysteines"
-
-                                if cys_liability_name and cys_liability_name in active_cys_defs:
-                                    if cys_liability_name not in liability_codes:
-                                        liability_codes[cys_liability_name] = str(next_code)
-                                        next_code += 1
-                                    code = liability_codes[cys_liability_name]
-                                    current_ann_parts.append(
-                                        f"{code}:{base36_encode(start_coord)}+{base36_encode(0)}"
-                                    )  # Length 0 for point annotation
-                        if region_name != "FR1":  # For CDRs and other non-FR1 regions from extraction
-                            for liability_name, pattern in active_liability_regex.items():
-                                for match in re.finditer(pattern, fragment_seq):
-                                    global_start, global_length = (
-                                        start_coord + match.start(),
-                                        match.end() - match.start(),
-                                    )
-                                    if liability_name not in liability_codes:
-                                        liability_codes[liability_name] = str(next_code)
-                                        next_code += 1
-                                    code = liability_codes[liability_name]
-                                    current_ann_parts.append(
-                                        f"{code}:{base36_encode(global_start)}+{base36_encode(global_length)}"
-                                    )
-
+                for liability_name, global_start, global_length in hits:
+                    code = codes.code_for(liability_name)
+                    current_ann_parts.append(f"{code}:{base36_encode(global_start)}+{base36_encode(global_length)}")
                 updated_annotations_for_col.append("|".join(sorted(list(set(current_ann_parts)))))
-                row_dict = {}
-                prefix_for_frag_col = (
-                    f"{current_prefix_raw.capitalize()} " if current_prefix_raw and multiple_chains_present else ""
-                )
-                for r_name, r_seq in extracted_frags.items():
-                    row_dict[f"{prefix_for_frag_col}{r_name} aa"] = r_seq
-                fragment_rows_for_col.append(row_dict)
-
-            df_processed = df_processed.with_columns(pl.Series(name=ann_col_name, values=updated_annotations_for_col))
-            if fragment_rows_for_col:
-                schema_for_frag_df = None
-                first_valid_row = next((item for item in fragment_rows_for_col if item), None)
-                if first_valid_row:
-                    schema_for_frag_df = {col_name: pl.Utf8 for col_name in first_valid_row.keys()}
-                if schema_for_frag_df:
-                    filled_rows = [
-                        {key: row.get(key) for key in schema_for_frag_df} for row in fragment_rows_for_col
-                    ]  # Ensure all rows have all keys
-                    try:
-                        processed_frag_dfs.append(pl.DataFrame(filled_rows, schema=schema_for_frag_df))
-                    except ShapeError:  # If df_processed is empty, zip makes empty lists, then this fails.
-                        print(
-                            f"Warning: Could not create DataFrame from fragments for {ann_col_name},"
-                            " possibly due to empty input or processing issue.",
-                            file=sys.stderr,
-                        )
 
+            updated_annotation_cols.append(pl.Series(name=ann_col_name, values=updated_annotations_for_col))
+            if frag_df is not None:
+                processed_frag_dfs.append(frag_df)
+                column_hits.update(chain_column_hits)
+
+        if updated_annotation_cols:
+            df_processed = df_processed.with_columns(updated_annotation_cols)
         if processed_frag_dfs:
             expected_height = len(df_processed)
             aligned_frag_dfs = [df_frag for df_frag in processed_frag_dfs if len(df_frag) == expected_height]
@@ -558,53 +974,45 @@ def main():
                         file=sys.stderr,
                     )
 
-        path_a_frag_cols = [
-            c
-            for c in df_processed.columns
-            if c.lower().endswith(" aa")
-            and any(k in c.lower() for k in ["cdr1", "cdr2", "cdr3", "fr1", "fr2", "fr3"])
-            and not c.lower().endswith("sequence aa")
-        ]
+        path_a_frag_cols = [c for c in df_processed.columns if _is_region_fragment_col(c)]
         cols_for_liability_analysis.extend(path_a_frag_cols)
         cols_for_liability_analysis = sorted(list(set(cols_for_liability_analysis)))
 
     elif not has_input_ann_cols:  # Path B: No annotations, use direct sequence columns
-        print(
+        log(
             "Path B (No Annotations Mode): Using direct sequence columns ending with predefined keys (e.g., 'CDR1 aa')."
         )
         candidate_seq_cols_for_path_b = [
             c for c in all_seq_cols if any(key_suffix in c.lower() for key_suffix in TARGET_REGION_KEYS)
         ]
         if not candidate_seq_cols_for_path_b:
-            print("Path B: No standard FR/CDR sequence columns (e.g., 'CDR1 aa') found.")
+            log("Path B: No standard FR/CDR sequence columns (e.g., 'CDR1 aa') found.")
         # Don't return early - continue to generate expected output columns even without liabilities
         cols_for_liability_analysis.extend(candidate_seq_cols_for_path_b)
         cols_for_liability_analysis = sorted(list(set(cols_for_liability_analysis)))
 
     if not cols_for_liability_analysis and CALCULATE_LIABILITIES:
-        print(
+        log(
             "Warning: No columns identified for liability analysis, but liabilities were requested."
             " Skipping liability calculation."
         )
         CALCULATE_LIABILITIES = False  # Force skip if no columns to act on
     elif not cols_for_liability_analysis and not CALCULATE_LIABILITIES:
-        print("No columns identified for liability analysis (and no liabilities were requested).")
+        log("No columns identified for liability analysis (and no liabilities were requested).")
 
+    if kmer_index is not None:
+        kmer_index.add(
+            df_processed.select([c for c in cols_for_liability_analysis if c in df_processed.columns]),
+            df_processed["clonotypeKey"] if "clonotypeKey" in df_processed.columns else None,
+        )
+
+    lf = df_processed.lazy()
+    match_matrix = None
     if CALCULATE_LIABILITIES and cols_for_liability_analysis:  # Ensure CALCULATE_LIABILITIES is still true
-        print(f"Generating liabilities for columns: {cols_for_liability_analysis}")
-        liability_expressions, risk_expressions = [], []
+        log(f"Generating liabilities for columns: {cols_for_liability_analysis}")
+        liability_expressions, risk_expressions, scanned_columns = [], [], []
         generated_liability_summary_col_names, generated_risk_col_names = [], []
 
-        # MiXCR places * at CDR/FR boundaries (split codons at V-D-J junctions), so per-region
-        # stop codon / OOF detection produces false positives on MiXCR-origin data. Annotation
-        # columns identify MiXCR-origin data — strip these patterns and rely on the full-sequence
-        # check instead. Pre-fragmented input (Path B, no annotations) contains genuine sequences.
-        active_extra_defs_for_per_region = (
-            {n: p for n, p in active_extra_defs.items() if n not in ORIG_EXTRA_PATTERNS}
-            if has_input_ann_cols  # MiXCR data: per-region seqs may have boundary artifacts
-            else active_extra_defs  # pre-fragmented user data: stop codon/OOF in fragments is real
-        )
-
         # Stop codon / OOF check on the full chain sequence. Only runs when a non-fragmented
         # chain column exists (e.g. "Heavy sequence aa" from non-scFv MiXCR upstreams).
         # The scFv upstream provides only CDR/FR columns, so this block is skipped — scFv
@@ -621,6 +1029,11 @@ def main():
                 _col = pl.col(full_seq_col).cast(pl.Utf8)
                 _stop = _col.str.contains(r"\*", literal=False)
                 _oof = _col.str.contains(r"_", literal=False)
+                seq = df_processed[full_seq_col].cast(pl.Utf8)
+                column_hits[liab_col_name] = {
+                    "Contains stop codon": seq.str.contains(r"\*").fill_null(False).to_numpy(),
+                    "Out of frame": seq.str.contains("_").fill_null(False).to_numpy(),
+                }
                 liability_expressions.append(
                     pl.when(_col.is_null())
                     .then(pl.lit("None"))
@@ -637,48 +1050,47 @@ def main():
         for frag_seq_col in cols_for_liability_analysis:
             if frag_seq_col not in df_processed.columns:
                 continue  # Should not happen if logic is correct
-            match = re.search(r"(FR[1-4]|CDR[1-3])", frag_seq_col, re.IGNORECASE)  # More specific match
-            core_region_name = match.group(1).upper() if match else "UNKNOWN_REGION"
+            core_region_name = _fragment_region(frag_seq_col)
             new_liab_col = f"{frag_seq_col} liabilities"  # e.g. "Heavy CDR1 aa liabilities"
             generated_liability_summary_col_names.append(new_liab_col)
-            liability_expressions.append(
-                pl.col(frag_seq_col)
-                .cast(pl.Utf8)
-                .map_elements(
-                    lambda s, crn=core_region_name: identify_liabilities(
-                        s,
-                        crn,
-                        active_cdr_defs,
-                        active_extra_defs_for_per_region,
-                        active_cys_defs,
-                        expected_cys_map,
-                        active_custom_defs=active_custom_defs,
-                    ),
-                    return_dtype=pl.Utf8,
-                    skip_nulls=False,
-                )
-                .fill_null("Unknown")
-                .alias(new_liab_col)
+            if new_liab_col in df_processed.columns:
+                continue  # Already computed by the Path A chain worker
+            scanned_columns.append(
+                scan_region_liabilities(
+                    df_processed[frag_seq_col],
+                    core_region_name,
+                    active_cdr_defs,
+                    active_extra_defs_for_per_region,
+                    active_cys_defs,
+                    expected_cys_map,
+                    active_custom_defs=active_custom_defs,
+                    stats=stats,
+                    regex_budget=config.regex_budget,
+                    rule_hits=column_hits.setdefault(new_liab_col, {}),
+                ).alias(new_liab_col)
             )
+        # The scanned columns join the frame without copying; from here on, only the plan grows.
+        lf = df_processed.hstack(scanned_columns).lazy()
         if liability_expressions:
-            df_processed = df_processed.with_columns(liability_expressions)
+            lf = lf.with_columns(liability_expressions)
+        columns = lf.collect_schema().names()
 
         # ---- START: New section to create "Sequence liabilities summary" ----
-        summary_struct_cols = [c for c in generated_liability_summary_col_names if c in df_processed.columns]
+        summary_struct_cols = [c for c in generated_liability_summary_col_names if c in columns]
         if summary_struct_cols:
-            print(f"Generating sequence liabilities summary from columns: {summary_struct_cols}")
-            df_processed = df_processed.with_columns(
+            log(f"Generating sequence liabilities summary from columns: {summary_struct_cols}")
+            lf = lf.with_columns(
                 pl.struct(summary_struct_cols)
                 .map_elements(_create_sequence_liabilities_summary_str, return_dtype=pl.Utf8, skip_nulls=False)
                 .fill_null("None")
                 .alias("Sequence liabilities summary")
             )
-        elif "Sequence liabilities summary" not in df_processed.columns:
-            df_processed = df_processed.with_columns(pl.lit("None").cast(pl.Utf8).alias("Sequence liabilities summary"))
+        elif "Sequence liabilities summary" not in columns:
+            lf = lf.with_columns(pl.lit("None").cast(pl.Utf8).alias("Sequence liabilities summary"))
         # ---- END: New section ----
 
         for liab_col in generated_liability_summary_col_names:  # These are the individual "... aa liabilities" cols
-            if liab_col not in df_processed.columns:
+            if liab_col not in columns:
                 continue
             new_risk_col = liab_col.replace(" liabilities", " risk")
             generated_risk_col_names.append(new_risk_col)
@@ -696,14 +1108,28 @@ def main():
                 .alias(new_risk_col)
             )
         if risk_expressions:
-            df_processed = df_processed.with_columns(risk_expressions)
+            lf = lf.with_columns(risk_expressions)
 
         # Global classification columns: replace the old "Liabilities risk" with four new columns
-        liab_cols_for_global = [c for c in generated_liability_summary_col_names if c in df_processed.columns]
+        liab_cols_for_global = [c for c in generated_liability_summary_col_names if c in columns]
+        # Costs are products of the rule x region match matrix with each profile's weights; the
+        # liability columns are collected on their own for it (the full-chain checks are cheap).
+        match_matrix = MatchMatrix.from_liability_frame(
+            lf.select(liab_cols_for_global).collect(),
+            combined_fixability_map,
+            config.liability_names() + list(active_extra_defs_full_seq),
+            df_processed["clonotypeKey"] if "clonotypeKey" in df_processed.columns else None,
+            df_processed.height,
+        )
+        profiles = {"Developability cost": WeightProfile()}
+        profiles.update({cost_column(name): profile for name, profile in config.weight_profiles.items()})
+        cost_columns = [
+            pl.lit(pl.Series(name, match_matrix.score(profile), dtype=pl.Float64)) for name, profile in profiles.items()
+        ]
         if liab_cols_for_global:
             cfm = combined_fixability_map
             rlm = combined_risk_level_map
-            df_processed = df_processed.with_columns(
+            lf = lf.with_columns(
                 [
                     _is_productive_expr(liab_cols_for_global, cfm).alias("Is Productive"),
                     _structural_risk_expr(liab_cols_for_global, cfm).alias("Structural liabilities"),
@@ -715,49 +1141,39 @@ def main():
                     )
                     .fill_null("None")
                     .alias("Developability risk"),
-                    pl.struct(liab_cols_for_global)
-                    .map_elements(
-                        lambda row, _cfm=cfm: compute_developability_score(row, _cfm),
-                        return_dtype=pl.Float64,
-                        skip_nulls=False,
-                    )
-                    .fill_null(0.0)
-                    .alias("Developability cost"),
+                    *cost_columns,
                 ]
             )
         else:
-            df_processed = df_processed.with_columns(
+            lf = lf.with_columns(
                 [
                     pl.lit("Pass").cast(pl.Utf8).alias("Is Productive"),
                     pl.lit("None").cast(pl.Utf8).alias("Structural liabilities"),
                     pl.lit("None").cast(pl.Utf8).alias("Developability risk"),
-                    pl.lit(0.0).cast(pl.Float64).alias("Developability cost"),
+                    *cost_columns,
                 ]
             )
 
-        df_processed = _combine_heavy_light_prefixed_columns(df_processed, "risk")
-        df_processed = _combine_heavy_light_prefixed_columns(df_processed, "liabilities")
+        lf = _combine_heavy_light_prefixed_columns(lf, "risk")
+        lf = _combine_heavy_light_prefixed_columns(lf, "liabilities")
 
-    # Output Column Selection & Final Write
+    # Output Column Selection & Final Write (from the plan's schema; nothing is computed yet)
+    columns = lf.collect_schema().names()
     # Include clonotypeKey if it exists, otherwise use empty list
-    output_cols_core = ["clonotypeKey"] if "clonotypeKey" in df_processed.columns else []
+    output_cols_core = ["clonotypeKey"] if "clonotypeKey" in columns else []
     final_annotation_cols_list = ann_cols if has_input_ann_cols else []
     final_annotation_cols = sorted(list(set(final_annotation_cols_list)))
 
     # Handle CDR3 sequence columns
     final_cdr3_seq_cols = []
-    if df_processed.width > 0:  # Normal case - find existing columns
-        heavy_light_cdr3 = sorted(
-            [c for c in df_processed.columns if re.search(r"^(heavy|light) cdr3 aa$", c, re.IGNORECASE)]
-        )
+    if len(columns) > 0:  # Normal case - find existing columns
+        heavy_light_cdr3 = sorted([c for c in columns if re.search(r"^(heavy|light) cdr3 aa$", c, re.IGNORECASE)])
         general_cdr3 = sorted(
-            [c for c in df_processed.columns if re.search(r"cdr3 aa$", c, re.IGNORECASE) and c not in heavy_light_cdr3]
+            [c for c in columns if re.search(r"cdr3 aa$", c, re.IGNORECASE) and c not in heavy_light_cdr3]
         )
         final_cdr3_seq_cols = heavy_light_cdr3 + general_cdr3
         if not final_cdr3_seq_cols:
-            potential_cdr3 = sorted(
-                [c for c in df_processed.columns if "cdr3" in c.lower() and c.lower().endswith("aa")]
-            )
+            potential_cdr3 = sorted([c for c in columns if "cdr3" in c.lower() and c.lower().endswith("aa")])
             if potential_cdr3:
                 final_cdr3_seq_cols = potential_cdr3
     else:  # Empty input case - generate expected column names
@@ -766,13 +1182,14 @@ def main():
 
     individual_frag_liabs, individual_frag_risks = [], []
     combined_chain_liabs, combined_chain_risks = [], []
+    boundary_motif_cols = sorted(c for c in columns if c.endswith(_BOUNDARY_MOTIFS_SUFFIX))
     combined_region_liabs, combined_region_risks = [], []
 
     overall_summary_cols = []  # Renamed from overall_liab_risk_col for clarity
     if CALCULATE_LIABILITIES:
-        if df_processed.width > 0:  # Normal case - find existing columns
-            all_liab_cols = [c for c in df_processed.columns if c.endswith(" liabilities")]
-            all_risk_cols = [c for c in df_processed.columns if c.endswith(" risk")]
+        if len(columns) > 0:  # Normal case - find existing columns
+            all_liab_cols = [c for c in columns if c.endswith(" liabilities")]
+            all_risk_cols = [c for c in columns if c.endswith(" risk")]
 
             individual_frag_liabs = sorted(
                 [c for c in all_liab_cols if " aa liabilities" in c.lower() and c != "Sequence liabilities summary"]
@@ -817,10 +1234,11 @@ def main():
             _new_global = [
                 c
                 for c in ["Is Productive", "Structural liabilities", "Developability risk", "Developability cost"]
-                if c in df_processed.columns
+                + [cost_column(name) for name in config.weight_profiles]
+                if c in columns
             ]
             overall_summary_cols = _new_global
-            if "Sequence liabilities summary" in df_processed.columns:
+            if "Sequence liabilities summary" in columns:
                 overall_summary_cols = overall_summary_cols + ["Sequence liabilities summary"]
         else:  # Empty input case - generate expected column names
             expected_regions = ["CDR1", "CDR2", "CDR3", "FR1"]
@@ -837,7 +1255,7 @@ def main():
                 "Sequence liabilities summary",
             ]
     else:  # Liabilities not calculated
-        if df_processed.width == 0:
+        if len(columns) == 0:
             expected_regions = ["CDR1", "CDR2", "CDR3", "FR1"]
             for region in expected_regions:
                 individual_frag_liabs.append(f"{region} aa liabilities")
@@ -860,6 +1278,7 @@ def main():
             + individual_frag_liabs
             + combined_region_liabs
             + combined_chain_liabs
+            + boundary_motif_cols
             + individual_frag_risks
             + combined_region_risks
             + combined_chain_risks
@@ -871,12 +1290,12 @@ def main():
     # Check if we have insufficient columns (only core + annotations, no liability/risk columns)
     has_insufficient_columns = len(output_cols_ordered) <= 2
 
-    if df_processed.width == 0 or (not CALCULATE_LIABILITIES and has_insufficient_columns):
+    if len(columns) == 0 or (not CALCULATE_LIABILITIES and has_insufficient_columns):
         # Force generate all expected bulk columns
         expected_bulk_columns = []
 
         # Add clonotypeKey if it exists in input
-        if "clonotypeKey" in df_processed.columns:
+        if "clonotypeKey" in columns:
             expected_bulk_columns.append("clonotypeKey")
 
         # Add annotation columns if they exist in input
@@ -904,92 +1323,790 @@ def main():
         )
 
         # Create missing columns with empty/default values
-        missing_columns = [c for c in expected_bulk_columns if c not in df_processed.columns]
+        missing_columns = [c for c in expected_bulk_columns if c not in columns]
         if missing_columns:
-            # Add empty columns for missing ones
-            for col in missing_columns:
-                df_processed = df_processed.with_columns(pl.lit("").alias(col))
+            lf = lf.with_columns([pl.lit("").alias(col) for col in missing_columns])
 
         output_cols_existing = expected_bulk_columns
     else:
-        output_cols_existing = [c for c in output_cols_ordered if c in df_processed.columns]
+        output_cols_existing = [c for c in output_cols_ordered if c in columns]
 
-    df_out = (
-        df_processed.select(output_cols_existing) if output_cols_existing else df_processed.clone()
-    )  # Clone if no selection to avoid issues with empty df_out if df_processed has columns
+    if output_cols_existing:
+        lf = lf.select(output_cols_existing)
+    if explain:
+        print(f"Optimized query plan:\n{lf.explain()}")
+    df_out = lf.collect()
 
-    if not output_cols_existing and df_processed.width > 0:
+    if not output_cols_existing and len(columns) > 0:
         print(
             "No columns selected for final output based on defined order criteria. Writing entire processed DataFrame.",
             file=sys.stderr,
         )
-    elif not output_cols_existing and df_processed.width == 0:
+    elif not output_cols_existing and len(columns) == 0:
         print("Input was empty and no columns processed or selected.", file=sys.stderr)
 
-    if df_out.width == 0 and df_processed.width > 0:
-        print(
-            "Output selection resulted in an empty DataFrame, but processed data exists."
-            " Writing full processed DataFrame instead."
-        )
-        df_out = df_processed
-    elif df_out.width == 0:
+    if df_out.width == 0:
         print("Processed DataFrame is empty or output selection is empty. Nothing to write to TSV.", file=sys.stderr)
 
-    if df_out.width > 0:
+    if output_cols_existing:
+        header = output_cols_existing
+    else:
+        header = columns  # Even if width is 0, columns might exist
+    return FrameResult(
+        df_out=df_out,
+        header=header,
+        cols_for_liability_analysis=cols_for_liability_analysis,
+        has_input_ann_cols=has_input_ann_cols,
+        liabilities_calculated=CALCULATE_LIABILITIES,
+        match_matrix=match_matrix,
+        rule_hits=_output_column_hits(column_hits, df_out.columns),
+    )
+
+
+def _write_output_table(
+    result: FrameResult, output_tsv: str, compression: str | None = None, compression_threads: int = 1
+) -> None:
+    if result.df_out.width > 0:
         try:
-            df_out.write_csv(args.output_tsv, separator="\t", quote_style="never")
-            print(f"Output table written to {args.output_tsv}")
+            tsv_io.write_tsv(result.df_out, output_tsv, compression, compression_threads, quote_style="never")
+            print(f"Output table written to {output_tsv}")
         except Exception as e:
             print(f"Error writing output TSV: {e}", file=sys.stderr)
-    else:  # df_out.width == 0
-        if args.output_tsv:  # If output path is given, write empty file with headers
+    else:  # result.df_out.width == 0
+        if output_tsv:  # If output path is given, write empty file with headers
             try:
-                with open(args.output_tsv, "w") as f_empty:
+                with tsv_io.open_output(output_tsv, compression, compression_threads) as f_empty:
                     # Always write headers if they could be determined, even for empty input
-                    if output_cols_existing:
-                        f_empty.write("\t".join(output_cols_existing) + "\n")
-                    elif df_processed.width > 0:
-                        f_empty.write("\t".join(df_processed.columns) + "\n")
-                    elif df_processed.columns:  # Even if width is 0, columns might exist
-                        f_empty.write("\t".join(df_processed.columns) + "\n")
+                    if result.header:
+                        f_empty.write(("\t".join(result.header) + "\n").encode())
                     # else, an empty file is created (no headers possible)
                 print(
-                    f"Empty output table with headers written to {args.output_tsv}"
-                    " as no data rows were processed/selected."
+                    f"Empty output table with headers written to {output_tsv} as no data rows were processed/selected."
                 )
             except Exception as e:
-                print(f"Error writing empty output TSV to '{args.output_tsv}': {e}", file=sys.stderr)
-
-    if args.output_regions_found:
-        found_regions_set = set()
-        CANONICAL_REGIONS = ["CDR1", "CDR2", "CDR3", "FR1", "FR2", "FR3", "FR4"]  # Expanded
-        if cols_for_liability_analysis:  # Based on what was analyzed
-            for col_name in cols_for_liability_analysis:
-                for region_canonical_name in CANONICAL_REGIONS:
-                    # Use regex to match whole word region name to avoid FR1 matching in e.g. "MYFR10Sequence"
-                    if re.search(r"\b" + re.escape(region_canonical_name) + r"\b", col_name, re.IGNORECASE):
-                        found_regions_set.add(region_canonical_name)
-                        break  # Found one canonical region in this col_name
-            list_of_found_regions = sorted(list(found_regions_set), key=lambda x: REGION_ORDER_MAP.get(x, 99))
+                print(f"Error writing empty output TSV to '{output_tsv}': {e}", file=sys.stderr)
+
+
+def _output_column_hits(
+    column_hits: dict[str, dict[str, np.ndarray]], output_columns: list[str]
+) -> dict[str, dict[str, np.ndarray]]:
+    """The scanned columns' rule hits keyed by the output column listing them: a Heavy/Light
+    pair combined into one column (_combine_heavy_light_prefixed_columns) lists a rule where
+    either chain does; columns left out of the output are dropped."""
+    output_hits: dict[str, dict[str, np.ndarray]] = {}
+    for column, hits in column_hits.items():
+        target = column
+        if target not in output_columns and column.startswith(("Heavy ", "Light ")):
+            target = column.split(" ", 1)[1]
+        if target not in output_columns:
+            continue
+        merged = output_hits.setdefault(target, {})
+        for name, rows in hits.items():
+            merged[name] = merged[name] | rows if name in merged else rows
+    return output_hits
+
+
+def _rule_hits(result: FrameResult, config: ScanConfig) -> dict[str, dict[str, np.ndarray]]:
+    """Per rule, the output rows each region's liabilities column (e.g. "CDR3 aa" for
+    "CDR3 aa liabilities") lists it in, as the scan found them (FrameResult.rule_hits)."""
+    names = config.liability_names()
+    if config.calculate_liabilities:
+        names = list(dict.fromkeys(names + list(config.active_extra_defs_full_seq)))
+    columns = [c for c in result.df_out.columns if c.endswith(" liabilities") and c not in _GLOBAL_OUTPUT_COLS]
+    column_hits = result.rule_hits or {}
+    none = np.zeros(result.df_out.height, dtype=bool)
+    return {
+        name: {c.removesuffix(" liabilities"): column_hits.get(c, {}).get(name, none) for c in columns}
+        for name in names
+    }
+
+
+def _preview_report(result: FrameResult, config: ScanConfig, total_rows: int, seed: int) -> dict:
+    """--preview: per-rule prevalence over the sampled rows' liability columns."""
+    key = "clonotypeKey" if "clonotypeKey" in result.df_out.columns else "row number"
+    return preview.prevalence_report(_rule_hits(result, config), result.df_out.height, total_rows, seed, key)
+
+
+def _write_regions_found(cols_for_liability_analysis: list[str], output_path: str) -> None:
+    found_regions_set = set()
+    CANONICAL_REGIONS = ["CDR1", "CDR2", "CDR3", "FR1", "FR2", "FR3", "FR4"]  # Expanded
+    if cols_for_liability_analysis:  # Based on what was analyzed
+        for col_name in cols_for_liability_analysis:
+            for region_canonical_name in CANONICAL_REGIONS:
+                # Use regex to match whole word region name to avoid FR1 matching in e.g. "MYFR10Sequence"
+                if re.search(r"\b" + re.escape(region_canonical_name) + r"\b", col_name, re.IGNORECASE):
+                    found_regions_set.add(region_canonical_name)
+                    break  # Found one canonical region in this col_name
+        list_of_found_regions = sorted(list(found_regions_set), key=lambda x: REGION_ORDER_MAP.get(x, 99))
+    else:
+        list_of_found_regions = []
+    try:
+        with open(output_path, "w") as f:
+            json.dump(list_of_found_regions, f, indent=2)  # sort_keys=True for dicts, not lists
+        print(f"List of found regions {list_of_found_regions} written to {output_path}")
+    except IOError as e:
+        print(f"Error writing found regions list to '{output_path}': {e}", file=sys.stderr)
+
+
+def _output_metadata_path(output_tsv: str) -> str:
+    return f"{output_tsv}.meta.json"
+
+
+def _write_output_metadata(path: str, config: ScanConfig) -> None:
+    """Record the rule-set hash of a run, so a later --previous-output run can reuse its rows."""
+    with open(path, "w") as f:
+        json.dump({"rule_set": config.rule_set_hash()}, f, indent=2)
+
+
+def _read_text_table(source) -> pl.DataFrame:
+    """A TSV (path or bytes) with every column as text, so rows written back are byte-identical."""
+    if isinstance(source, str):
+        with tsv_io.open_input(source) as f:
+            source = f.read()
+    return pl.read_csv(io.BytesIO(source), separator="\t", infer_schema_length=0, quote_char=None)
+
+
+def _process_delta(
+    df: pl.DataFrame,
+    previous_output: str,
+    previous_metadata: str,
+    config: ScanConfig,
+    codes: LiabilityCodes,
+    diagnostics: Diagnostics | None = None,
+) -> FrameResult | None:
+    """--previous-output: scan only the rows whose clonotypeKey the previous output lacks.
+
+    The previous output's rows are reused, as text, for every other input row, and the
+    result keeps the input's row order, so it is the output a full scan would write. The
+    previous run's rule-set hash is read from `previous_metadata`. None (scan everything)
+    when the previous output cannot stand in for a scan: no metadata,
+    another rule set or output columns, or no unique clonotypeKey to match rows on.
+    """
+    key = "clonotypeKey"
+    try:
+        with open(previous_metadata) as f:
+            rule_set = json.load(f).get("rule_set")
+        previous = _read_text_table(previous_output)
+    except (OSError, ValueError, pl.exceptions.PolarsError) as e:
+        print(f"--previous-output: cannot reuse '{previous_output}' ({e}); scanning every row")
+        return None
+    reason = None
+    if rule_set != config.rule_set_hash():
+        reason = "the rule set or label map changed"
+    elif key not in df.columns or key not in previous.columns:
+        reason = f"no {key} column to match rows on"
+    elif previous[key].is_duplicated().any():
+        reason = f"its {key} values are not unique"
+    elif _process_frame(df.clear(), config, codes, False, verbose=False).df_out.columns != previous.columns:
+        reason = "its columns differ from this run's"
+    if reason is not None:
+        print(f"--previous-output: cannot reuse '{previous_output}' ({reason}); scanning every row")
+        return None
+
+    fresh = (~df[key].cast(pl.Utf8).is_in(previous[key].implode())).fill_null(True)
+    result = _process_frame(df.filter(fresh), config, codes, diagnostics=diagnostics)
+    print(f"--previous-output: {int(fresh.sum())} of {df.height} rows scanned, the rest reused")
+    row = pl.Series("_row", np.arange(df.height, dtype=np.int64))
+    scanned = _read_text_table(result.df_out.write_csv(separator="\t", quote_style="never").encode())
+    reused = (
+        pl.DataFrame([row, df[key].cast(pl.Utf8)])
+        .filter(~fresh)
+        .join(previous, on=key, how="left")
+        .select(["_row"] + previous.columns)
+    )
+    result.df_out = (
+        pl.concat([reused, scanned.with_columns(row.filter(fresh)).select(reused.columns)], how="vertical")
+        .sort("_row")
+        .drop("_row")
+    )
+    result.match_matrix = result.rule_hits = None  # Cover the scanned rows only
+    return result
+
+
+def _run_batched(
+    input_tsv: str,
+    output_tsv: str,
+    max_memory: int,
+    shard: tuple[int, int] | None,
+    config: ScanConfig,
+    codes: LiabilityCodes,
+    compression: str | None = None,
+    compression_threads: int = 1,
+    stats: ScanStats | None = None,
+    explain: bool = False,
+    kmer_index: KmerIndexBuilder | None = None,
+    top_k: TopK | None = None,
+    summary: RepertoireSummary | None = None,
+    diagnostics: Diagnostics | None = None,
+    checkpoint_dir: str | None = None,
+) -> list[FrameResult]:
+    """Process the input in memory-bounded batches, spilling each batch's output to a part file.
+
+    Parts are plain text; compression, if any, is applied once while they are concatenated.
+    Reading, scanning and writing of consecutive batches overlap (batching.run_pipeline).
+    With `explain`, the plan is printed for the first batch (every batch runs the same plan).
+    With `checkpoint_dir` the parts are kept there (checkpoint.Checkpoint) and a run
+    interrupted before the end resumes after its last recorded batch; `stats`, `kmer_index`,
+    `top_k` and `summary` only see the batches scanned in this call, so they must not be
+    combined with it.
+    """
+    schema = batching.infer_schema(input_tsv, infer_schema_length=1000, ignore_errors=True)
+    start, stop = 0, None
+    if shard is not None:
+        n_rows = batching.count_data_rows(input_tsv)
+        start, stop = _shard_bounds(n_rows, *shard)
+        print(f"Shard {shard[0]}/{shard[1]}: rows {start}..{stop} of {n_rows}")
+    if kmer_index is not None:
+        kmer_index.first_row = start
+    if top_k is not None:
+        top_k.next_row = start
+
+    run_checkpoint = None
+    if checkpoint_dir is not None:
+        label_map = {str(k): str(v) for k, v in config.initial_region_map.items()}
+        label_map.update({code: name for name, code in codes.codes.items()})
+        run = {
+            "input": checkpoint.input_fingerprint(input_tsv),
+            "rule_set": config.rule_set_hash(),
+            "label_map": label_map,
+            "shard": list(shard) if shard is not None else None,
+        }
+        run_checkpoint = checkpoint.Checkpoint.open(checkpoint_dir, run)
+
+    def read_batches(batch_rows, first_row=start):
+        for batch in batching.iter_tsv_batches(input_tsv, batch_rows, schema, True, first_row, stop):
+            if first_row > start and batch.height == 0:
+                continue  # Every row was scanned before the interruption: no trailing empty part
+            batch.columns = [" ".join(col.strip().split()) for col in batch.columns]  # Normalize column names
+            yield batch.select(_input_columns(batch.columns))
+
+    results = []
+    if run_checkpoint is not None and run_checkpoint.batch_rows is not None:
+        batch_rows = run_checkpoint.batch_rows  # Same batches as the interrupted run
+        for index, recorded in enumerate(run_checkpoint.batches):
+            if diagnostics is not None:
+                diagnostics.merge(Diagnostics.from_dict(recorded["diagnostics"]))
+            matrix_path = run_checkpoint.path(index, ".npz")
+            results.append(
+                FrameResult(
+                    pl.DataFrame(),
+                    recorded["header"],
+                    recorded["cols_for_liability_analysis"],
+                    recorded["has_input_ann_cols"],
+                    recorded["liabilities_calculated"],
+                    MatchMatrix.load(matrix_path) if os.path.basename(matrix_path) in recorded["files"] else None,
+                )
+            )
+        done = f"{len(run_checkpoint.batches)} batches ({run_checkpoint.done_rows} rows)"
+        print(f"Resuming from {checkpoint_dir}: {done} already written")
+    else:
+        # Measure on a throwaway code table, in-process (so tracemalloc sees the chain work), quietly.
+        sample = next(read_batches(batching.SAMPLE_ROWS))
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            row_bytes = batching.measure_row_bytes(
+                lambda df: _process_frame(df, config, LiabilityCodes.for_config(config), False).df_out, sample
+            )
+        batch_rows = batching.choose_batch_rows(max_memory, row_bytes, batching.peak_rss_bytes())
+        print(f"--max-memory {max_memory} bytes: ~{row_bytes:.0f} bytes/row, batches of {batch_rows} rows")
+        if run_checkpoint is not None:
+            run_checkpoint.start(batch_rows)
+
+    done_batches = len(results)
+    first_row = next_row = start + (run_checkpoint.done_rows if run_checkpoint is not None else 0)
+    # Per batch in flight: input rows and input warnings, until the part is recorded.
+    pending: dict[int, tuple[int, Diagnostics]] = {}
+
+    def process(batch_index: int, batch: pl.DataFrame) -> FrameResult:
+        nonlocal next_row
+        batch_index += done_batches
+        print(f"Batch {batch_index}: {len(batch)} rows")
+        if stats is not None:
+            stats.row_offset = next_row
+        batch_diagnostics = diagnostics.spawn() if diagnostics is not None else Diagnostics()
+        pending[batch_index] = (len(batch), batch_diagnostics)
+        result = _process_frame(
+            batch,
+            config,
+            codes,
+            stats=stats,
+            explain=explain and batch_index == 0,
+            kmer_index=kmer_index,
+            diagnostics=batch_diagnostics,
+        )
+        if diagnostics is not None:
+            diagnostics.merge(batch_diagnostics)
+        if result.match_matrix is not None:
+            result.match_matrix.first_row = next_row
+        next_row += len(batch)
+        if top_k is not None:
+            top_k.add(result.df_out)
+        if summary is not None:
+            summary.add(result.df_out, _rule_hits(result, config))
+        results.append(result)
+        return result
+
+    def write(batch_index: int, result: FrameResult) -> None:
+        batch_index += done_batches
+        input_rows, batch_diagnostics = pending.pop(batch_index)
+        if run_checkpoint is None:
+            _write_output_table(result, batching.part_path(spill_dir, batch_index))
+        else:
+            files = [run_checkpoint.path(batch_index, ".tsv")]
+            _write_output_table(result, files[0])
+            if result.match_matrix is not None:
+                files.append(run_checkpoint.path(batch_index, ".npz"))
+                result.match_matrix.save(files[-1])
+            meta = {
+                "header": result.header,
+                "cols_for_liability_analysis": result.cols_for_liability_analysis,
+                "has_input_ann_cols": result.has_input_ann_cols,
+                "liabilities_calculated": result.liabilities_calculated,
+                "diagnostics": batch_diagnostics.to_dict(),
+            }
+            run_checkpoint.record(batch_index, input_rows, meta, files)
+        result.df_out = result.df_out.clear()  # Keep only the metadata of finished batches
+
+    spill = batching.spill_dir_for(output_tsv) if run_checkpoint is None else contextlib.nullcontext(checkpoint_dir)
+    with spill as spill_dir:
+        n_batches = done_batches + batching.run_pipeline(read_batches(batch_rows, first_row), process, write)
+        if run_checkpoint is None:
+            part_paths = [batching.part_path(spill_dir, i) for i in range(n_batches)]
         else:
-            list_of_found_regions = []
+            part_paths = [run_checkpoint.path(i, ".tsv") for i in range(n_batches)]
+        batching.combine_parts(part_paths, output_tsv, compression, compression_threads)
+    if run_checkpoint is not None:
+        run_checkpoint.remove()
+    print(f"Output table written to {output_tsv} ({len(part_paths)} batches)")
+    return results
+
+
+def _estimate_run(input_tsv: str, config: ScanConfig) -> dict:
+    """--estimate: project a full run's peak memory and runtime from the input's first rows."""
+    schema = batching.infer_schema(input_tsv, infer_schema_length=1000, ignore_errors=True)
+    sample = next(batching.iter_tsv_batches(input_tsv, batching.SAMPLE_ROWS, schema, True))
+    sample.columns = [" ".join(col.strip().split()) for col in sample.columns]  # Normalize column names
+    sample = sample.select(_input_columns(sample.columns))
+
+    ann_cols = [c for c in sample.columns if c.lower().endswith("annotations")]
+    seq_cols = [c for c in sample.columns if c.lower().endswith(" aa")]
+    if ann_cols:
+        region_lengths = estimate.mean_region_lengths(sample, ann_cols, config.initial_region_map)
+        annotation_lengths = {"mean_annotation_lengths": estimate.mean_lengths(sample, ann_cols)}
+    else:
+        region_lengths, annotation_lengths = estimate.mean_lengths(sample, seq_cols), {}
+    # Path A scans each chain in its own worker process; Path B runs in one process.
+    suggested_threads = max(1, min(len(ann_cols), batching.available_cpus())) if ann_cols else 1
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return estimate.build_estimate(
+            input_tsv,
+            sample,
+            lambda df: _process_frame(df, config, LiabilityCodes.for_config(config), False).df_out,
+            suggested_threads,
+            path="A" if ann_cols else "B",
+            chains=len(ann_cols),
+            mean_sequence_lengths=estimate.mean_lengths(sample, seq_cols),
+            **annotation_lengths,
+            mean_region_lengths=region_lengths,
+        )
+
+
+# ——— MAIN SCRIPT —————————————————————————————————————
+def main():
+    p = argparse.ArgumentParser(description="Extract CDRs/FR1, analyze liabilities, compute risk.")
+    p.add_argument("input_tsv", help="Input TSV")
+    p.add_argument("output_tsv", nargs="?", help="Output TSV (not needed with --estimate)")
+    p.add_argument("-m", "--label-map", help="JSON file or string for numeric region labels to names.")
+    p.add_argument(
+        "-o",
+        "--output-label-map",
+        help="Where to write JSON label map. Empty map if no input annotations or no liabilities calculated.",
+    )
+    p.add_argument(
+        "--include-liabilities",
+        type=str,
+        help=(
+            "A comma-delimited string of specific liability names to calculate"
+            ' (e.g., "Deamidation (N[GS]),Methionine Oxidation (M)").'
+            " If not provided, no liabilities or risks are calculated."
+        ),
+    )
+    p.add_argument(
+        "--output-regions-found", type=str, help="Path to output a JSON list of found regions (CDR1, CDR2, CDR3, FR1)."
+    )
+    p.add_argument(
+        "--numbering-schema",
+        type=str,
+        help="Optional numbering schema name (e.g., imgt, kabat, chothia) to adjust conserved cysteine coordinates.",
+    )
+    p.add_argument(
+        "--custom-liabilities",
+        type=str,
+        help="Path to a JSON file containing an array of custom liability definitions.",
+    )
+    p.add_argument(
+        "--use-predefined-liabilities",
+        type=str,
+        default="true",
+        help="Whether to apply predefined liability definitions (default: true).",
+    )
+    p.add_argument(
+        "--disabled-predefined-liabilities",
+        type=str,
+        help="Path to a JSON file containing an array of predefined liability names to disable.",
+    )
+    p.add_argument(
+        "--shard",
+        type=str,
+        help=(
+            "Process only one contiguous slice of the input rows, given as 'i/n' (0-based shard i of n)."
+            " Shard outputs are recombined in order with merge_shards.py."
+        ),
+    )
+    p.add_argument(
+        "--max-memory",
+        type=str,
+        help=(
+            "Memory budget such as '4GiB'. The input is processed in batches sized from a measured sample"
+            " so that the run stays under the budget; per-batch results are spilled to temp files next to"
+            " the output and concatenated in order."
+        ),
+    )
+    p.add_argument(
+        "--estimate",
+        action="store_true",
+        help=(
+            "Do not scan; read the header and a sample of rows and print a JSON projection of row count,"
+            " peak memory, runtime and suggested threads for the full input."
+        ),
+    )
+    p.add_argument(
+        "--compression",
+        choices=("none",) + tsv_io.COMPRESSIONS,
+        help="Compress the output TSV (default: from the output suffix, .gz or .zst). Inputs are detected.",
+    )
+    p.add_argument(
+        "--compression-threads",
+        type=int,
+        default=batching.available_cpus(),
+        help="Threads for output compression (default: all CPUs available to the job).",
+    )
+    p.add_argument(
+        "--stats-output",
+        type=str,
+        help=(
+            "Path to write a JSON report of per-rule, per-region scan statistics: rows evaluated, hits,"
+            " total matches, cumulative time and the slowest rows of regex-evaluated rules."
+        ),
+    )
+    p.add_argument(
+        "--stats-slowest",
+        type=int,
+        default=5,
+        help="Number of slowest rows to keep per rule and region in --stats-output (default: 5).",
+    )
+    p.add_argument(
+        "--diagnostics-output",
+        type=str,
+        help=(
+            "Path to write a JSON report of input warnings (malformed annotation parts, out-of-bounds"
+            " segments): the count of each category and its first examples."
+        ),
+    )
+    p.add_argument(
+        "--diagnostics-examples",
+        type=int,
+        default=5,
+        help="Number of examples to keep per warning category (default: 5).",
+    )
+    p.add_argument(
+        "--verbose-warnings",
+        action="store_true",
+        help="Also print every input warning to stderr as it occurs, not only the end-of-run summary.",
+    )
+    p.add_argument(
+        "--regex-time-budget",
+        type=float,
+        default=DEFAULT_TIME_BUDGET_SECONDS,
+        help=(
+            "Seconds the whole job may spend on custom liability patterns that need a backtracking regex"
+            " engine (look-around, backreferences, ...); 0 for no limit (default: %(default)s)."
+        ),
+    )
+    p.add_argument(
+        "--on-regex-timeout",
+        choices=ON_TIMEOUT,
+        default="fail",
+        help="When the regex time budget runs out: fail the job, or skip the rule with a warning (default: fail).",
+    )
+    p.add_argument(
+        "--kmer-index",
+        help=(
+            "Path to write a k-mer (k=2..4) inverted index of the region columns (.npz) for fast"
+            " motif queries (see kmer_index.py)."
+        ),
+    )
+    p.add_argument(
+        "--preview",
+        type=int,
+        metavar="N",
+        help=(
+            "Scan only a deterministic sample of N rows (smallest seeded hash of clonotypeKey) and write"
+            " per-rule prevalence, extrapolated to the whole input, to --preview-report."
+        ),
+    )
+    p.add_argument("--preview-seed", type=int, default=0, help="Hash seed of the --preview sample (default: 0).")
+    p.add_argument(
+        "--preview-report", help="Path of the --preview prevalence JSON (default: <output_tsv>.preview.json)."
+    )
+    p.add_argument(
+        "--top-k",
+        type=int,
+        metavar="K",
+        help=(
+            "Also write the K best lead candidates (Is Productive, then Developability risk, then"
+            " Developability cost; ties by clonotypeKey), ranked, to --top-k-output."
+        ),
+    )
+    p.add_argument("--top-k-output", help="Path of the --top-k ranked TSV (default: <output_tsv>.top-k.tsv).")
+    p.add_argument(
+        "--summary-report",
+        help=(
+            "Path to write a repertoire summary gathered during the scan: per rule x region prevalence,"
+            " Developability risk and cost histograms, rule co-occurrence (.parquet for Parquet, else JSON)."
+        ),
+    )
+    p.add_argument(
+        "--weights",
+        help=(
+            "JSON file of named weight profiles (fixability, region and per-rule weights; see"
+            " match_matrix.py). Each adds a 'Developability cost (<name>)' column."
+        ),
+    )
+    p.add_argument(
+        "--match-matrix",
+        help=(
+            "Path to write the sparse rule x region match matrix of the scanned rows (.npz), which"
+            " match_matrix.py re-weights into new cost columns without rescanning."
+        ),
+    )
+    p.add_argument(
+        "--boundary-motifs",
+        action="store_true",
+        help=(
+            "Path A: also report, per chain, the motifs that start in one region and end in the next"
+            " (e.g. 'Deamidation (N[GS]) (CDR1/FR2)'), which per-region liabilities cannot contain."
+        ),
+    )
+    p.add_argument(
+        "--checkpoint-dir",
+        help=(
+            "With --max-memory: keep each finished batch's output in this directory, with a manifest of"
+            " the run (input fingerprint, rule-set hash, label map). Re-running the same command after an"
+            " interruption skips the finished batches; the directory is emptied once the output is written."
+        ),
+    )
+    p.add_argument(
+        "--previous-output",
+        metavar="OLD_TSV",
+        help=(
+            "Output of an earlier run on a subset of this input: rows whose clonotypeKey it already has"
+            " are copied from it and only the others are scanned. Used only when its metadata"
+            " (see --previous-metadata) shows the same rule set; otherwise every row is scanned."
+            " The metadata of this run is written to OUTPUT_TSV.meta.json unless --output-metadata is given."
+        ),
+    )
+    p.add_argument(
+        "--previous-metadata",
+        metavar="OLD_META_JSON",
+        help="Metadata of the --previous-output run (default: OLD_TSV.meta.json).",
+    )
+    p.add_argument(
+        "--output-metadata",
+        metavar="META_JSON",
+        help="Write the rule-set hash of this run to META_JSON, for use as --previous-metadata of a later run.",
+    )
+    p.add_argument(
+        "--explain",
+        action="store_true",
+        help="Print the optimized Polars query plan of the post-scan stages (first batch with --max-memory).",
+    )
+    args = p.parse_args()
+    if not args.output_tsv and not args.estimate:
+        p.error("the following arguments are required: output_tsv")
+    max_memory = None
+    if args.max_memory:
         try:
-            with open(args.output_regions_found, "w") as f:
-                json.dump(list_of_found_regions, f, indent=2)  # sort_keys=True for dicts, not lists
-            print(f"List of found regions {list_of_found_regions} written to {args.output_regions_found}")
-        except IOError as e:
-            print(f"Error writing found regions list to '{args.output_regions_found}': {e}", file=sys.stderr)
+            max_memory = batching.parse_memory_size(args.max_memory)
+        except ValueError as e:
+            p.error(f"--max-memory: {e}")
+    shard = None
+    if args.shard:
+        try:
+            shard = _parse_shard(args.shard)
+        except ValueError as e:
+            p.error(str(e))
+    if args.preview is not None:
+        if args.preview < 1:
+            p.error("--preview must be a positive row count")
+        if shard or max_memory or args.estimate:
+            p.error("--preview cannot be combined with --shard, --max-memory or --estimate")
+    if args.top_k is not None and args.top_k < 1:
+        p.error("--top-k must be a positive row count")
+    if args.previous_metadata and not args.previous_output:
+        p.error("--previous-metadata requires --previous-output")
+    if args.previous_output and (
+        max_memory or shard or args.preview is not None or args.estimate or args.checkpoint_dir
+    ):
+        p.error(
+            "--previous-output cannot be combined with --max-memory, --shard, --preview, --estimate or --checkpoint-dir"
+        )
+    if args.previous_output and (
+        args.stats_output or args.kmer_index or args.top_k is not None or args.summary_report or args.match_matrix
+    ):
+        p.error(
+            "--previous-output cannot be combined with --stats-output, --kmer-index, --top-k, --summary-report"
+            " or --match-matrix (they would cover the scanned rows only)"
+        )
+    if args.checkpoint_dir:
+        if not max_memory:
+            p.error("--checkpoint-dir requires --max-memory (batches are the unit of checkpointing)")
+        if args.stats_output or args.kmer_index or args.top_k is not None or args.summary_report:
+            p.error(
+                "--checkpoint-dir cannot be combined with --stats-output, --kmer-index, --top-k or --summary-report"
+            )
+
+    if args.estimate:
+        # Keep stdout to the JSON document.
+        with contextlib.redirect_stdout(sys.stderr):
+            config = _build_scan_config(args)
+        try:
+            print(json.dumps(_estimate_run(args.input_tsv, config), indent=2))
+        except (OSError, pl.exceptions.PolarsError, RegexTimeout) as e:
+            sys.exit(f"Error estimating input TSV '{args.input_tsv}': {e}")
+        return
+
+    config = _build_scan_config(args)
+    codes = LiabilityCodes.for_config(config)
+    compression = tsv_io.compression_for(args.output_tsv, args.compression)
+    stats = ScanStats(slowest_n=args.stats_slowest) if args.stats_output else None
+    diagnostics = Diagnostics(args.diagnostics_examples, args.verbose_warnings)
+    kmer_index = KmerIndexBuilder() if args.kmer_index else None
+    top_k = TopK(args.top_k) if args.top_k is not None else None
+    summary = (
+        RepertoireSummary("Developability risk", "Developability cost", RISK_ORDER) if args.summary_report else None
+    )
+
+    if max_memory is None:
+        try:
+            if args.preview is not None:
+                df, total_rows = preview.sample_frame(
+                    _scan_input(args.input_tsv), args.preview, "clonotypeKey", args.preview_seed
+                )
+                print(f"Preview: {len(df)} sampled rows of {total_rows}")
+            elif shard is None:
+                df = _scan_input(args.input_tsv).collect()
+            else:
+                df, shard_start = _read_shard(args.input_tsv, *shard)
+                if stats is not None:
+                    stats.row_offset = shard_start
+                if kmer_index is not None:
+                    kmer_index.first_row = shard_start
+                if top_k is not None:
+                    top_k.next_row = shard_start
+        except Exception as e:
+            sys.exit(f"Error reading input TSV '{args.input_tsv}': {e}")
+        try:
+            result = None
+            if args.previous_output:
+                previous_metadata = args.previous_metadata or _output_metadata_path(args.previous_output)
+                result = _process_delta(df, args.previous_output, previous_metadata, config, codes, diagnostics)
+            if result is None:
+                result = _process_frame(
+                    df, config, codes, stats=stats, explain=args.explain, kmer_index=kmer_index, diagnostics=diagnostics
+                )
+            if shard is not None and result.match_matrix is not None:
+                result.match_matrix.first_row = shard_start
+            if top_k is not None:
+                top_k.add(result.df_out)
+            if summary is not None:
+                summary.add(result.df_out, _rule_hits(result, config))
+        except (RegexTimeout, ValueError) as e:
+            sys.exit(f"Error: {e}")
+        _write_output_table(result, args.output_tsv, compression, args.compression_threads)
+        results = [result]
+    else:
+        try:
+            results = _run_batched(
+                args.input_tsv,
+                args.output_tsv,
+                max_memory,
+                shard,
+                config,
+                codes,
+                compression,
+                args.compression_threads,
+                stats,
+                args.explain,
+                kmer_index,
+                top_k,
+                summary,
+                diagnostics,
+                args.checkpoint_dir,
+            )
+        except (OSError, pl.exceptions.PolarsError) as e:
+            sys.exit(f"Error processing input TSV '{args.input_tsv}' in batches: {e}")
+        except (RegexTimeout, ValueError) as e:
+            sys.exit(f"Error: {e}")
+
+    if args.output_metadata:
+        _write_output_metadata(args.output_metadata, config)
+    elif args.previous_output:
+        _write_output_metadata(_output_metadata_path(args.output_tsv), config)
+    if stats is not None:
+        stats.write(args.stats_output)
+        print(f"Scan statistics written to {args.stats_output}")
+    diagnostics.report()
+    if args.diagnostics_output:
+        diagnostics.write(args.diagnostics_output)
+        print(f"Diagnostics written to {args.diagnostics_output}")
+    if args.preview is not None:
+        report_path = args.preview_report or f"{args.output_tsv}.preview.json"
+        preview.write_report(_preview_report(results[0], config, total_rows, args.preview_seed), report_path)
+        print(f"Preview prevalence report written to {report_path}")
+    if top_k is not None:
+        top_k_path = args.top_k_output or f"{args.output_tsv}.top-k.tsv"
+        ranked = top_k.ranked()
+        tsv_io.write_tsv(ranked, top_k_path, tsv_io.compression_for(top_k_path, None), quote_style="never")
+        print(f"Top {ranked.height} lead candidates written to {top_k_path}")
+    if summary is not None:
+        summary.write(args.summary_report)
+        print(f"Repertoire summary of {summary.rows} rows written to {args.summary_report}")
+    if kmer_index is not None:
+        kmer_index.save(args.kmer_index)
+        print(f"k-mer index of {list(kmer_index.columns)} written to {args.kmer_index}")
+    if args.match_matrix:
+        matrix = MatchMatrix.concat([r.match_matrix for r in results if r.match_matrix is not None])
+        matrix.save(args.match_matrix)
+        print(f"Match matrix of {matrix.n_rows} rows x {len(matrix.rules)} rules written to {args.match_matrix}")
+
+    has_input_ann_cols = any(r.has_input_ann_cols for r in results)
+    liabilities_calculated = any(r.liabilities_calculated for r in results)
+    if args.output_regions_found:
+        cols_for_liability_analysis = sorted({c for r in results for c in r.cols_for_liability_analysis})
+        _write_regions_found(cols_for_liability_analysis, args.output_regions_found)
 
-    if not has_input_ann_cols and not CALCULATE_LIABILITIES:  # No annotations and no calculation attempt
+    if not has_input_ann_cols and not liabilities_calculated:  # No annotations and no calculation attempt
         _output_final_label_map(
             {}, {}, args.output_label_map, "Empty Label Map (No annotations and no liabilities calculated)"
         )
-    elif not CALCULATE_LIABILITIES:  # Annotations might exist, but no calculation
+    elif not liabilities_calculated:  # Annotations might exist, but no calculation
         _output_final_label_map(
-            initial_region_map, {}, args.output_label_map, "Label Map (Regions Only; No Liabilities Calculated)"
+            config.initial_region_map, {}, args.output_label_map, "Label Map (Regions Only; No Liabilities Calculated)"
         )
     else:  # Liabilities were calculated (or attempted)
-        _output_final_label_map(initial_region_map, liability_codes, args.output_label_map, "Final Combined Label Map")
+        _output_final_label_map(
+            config.initial_region_map, codes.codes, args.output_label_map, "Final Combined Label Map"
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Sparse rule × region match matrix of the scanned rows, and the weight profiles that score it.
+
+The "... liabilities" columns of a scanned frame are read once into a sparse matrix
+(coordinate form): one entry per (row, rule, region column) listing the rule, holding how
+many times it is listed there. Developability cost is then a matrix product: entry count ×
+the profile's weight of its rule (from the rule's fixability) and of its region (CDR3,
+FR1, ... read once per column name, not per row), summed per row. Several profiles
+(--weights) score the same matrix, each into its own "Developability cost (<name>)"
+column, and a saved matrix (--match-matrix, a compressed .npz) is re-weighted without
+rescanning:
+
+    matrix = MatchMatrix.load("repertoire.matches.npz")
+    costs = matrix.score(load_weight_profiles("weights.json")["cdr3-heavy"])
+
+    python match_matrix.py repertoire.matches.npz --weights weights.json --output costs.tsv
+
+A weights file maps profile names to partial overrides of the default weights
+(definitions.FIXABILITY_WEIGHTS and REGION_WEIGHTS):
+
+    {"cdr3-heavy": {"fixability": {"fixable": 5.0},          # per fixability class
+                    "regions": {"CDR3": 3.0, "FR1": 0.2},    # per canonical region
+                    "other_regions": 0.5,                    # columns without a region name
+                    "rules": {"Deamidation (N[GS])": 10.0}}} # per rule, replacing its fixability weight
+
+Disqualifying rules never add to the cost, whatever the profile; they fail Is Productive
+instead. Rows are numbered from the frame's first input row, as in kmer_index.
+"""
+
+import argparse
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import get_args
+
+import numpy as np
+import polars as pl
+
+from definitions import FIXABILITY_WEIGHTS, REGION_WEIGHTS, Fixability
+
+COST_COLUMN = "Developability cost"
+DEFAULT_OTHER_REGION_WEIGHT = 0.5
+MATRIX_VERSION = 1
+
+_REGION_RE = re.compile(r"\b(CDR[1-3]|FR[1-4])\b", re.IGNORECASE)
+_NOT_A_RULE = ["", "None", "Unknown"]
+_PROFILE_KEYS = {"fixability", "regions", "other_regions", "rules"}
+
+
+def region_of(column: str) -> str:
+    """Canonical region named in a column ('Heavy CDR1 aa liabilities' → 'CDR1'), else the column."""
+    match = _REGION_RE.search(column)
+    return match.group(1).upper() if match else column
+
+
+def cost_column(profile_name: str) -> str:
+    return f"{COST_COLUMN} ({profile_name})"
+
+
+@dataclass(frozen=True)
+class WeightProfile:
+    """Weights of one cost column; the defaults reproduce Developability cost."""
+
+    fixability: dict[str, float] = field(default_factory=lambda: dict(FIXABILITY_WEIGHTS))
+    regions: dict[str, float] = field(default_factory=lambda: dict(REGION_WEIGHTS))
+    other_regions: float = DEFAULT_OTHER_REGION_WEIGHT
+    rules: dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_json(cls, entry: dict) -> "WeightProfile":
+        """Profile from a weights-file entry; raises ValueError on unknown keys or non-numeric weights."""
+        if not isinstance(entry, dict):
+            raise ValueError(f"expected an object, got {entry!r}")
+        unknown = sorted(set(entry) - _PROFILE_KEYS)
+        if unknown:
+            raise ValueError(f"unknown key(s) {unknown}; expected {sorted(_PROFILE_KEYS)}")
+        fixability = _weights(entry.get("fixability", {}), "fixability")
+        bad = sorted(set(fixability) - set(get_args(Fixability)))
+        if bad:
+            raise ValueError(f"unknown fixability class(es) {bad}")
+        regions = {name.upper(): w for name, w in _weights(entry.get("regions", {}), "regions").items()}
+        other_regions = entry.get("other_regions", DEFAULT_OTHER_REGION_WEIGHT)
+        _check_weight(other_regions, "other_regions")
+        return cls(
+            fixability={**FIXABILITY_WEIGHTS, **fixability},
+            regions={**REGION_WEIGHTS, **regions},
+            other_regions=float(other_regions),
+            rules=_weights(entry.get("rules", {}), "rules"),
+        )
+
+    def rule_weight(self, rule: str, fixability: str | None) -> float:
+        if fixability == "disqualifying":
+            return 0.0
+        if rule in self.rules:
+            return self.rules[rule]
+        return self.fixability.get(fixability, 0.0)
+
+    def region_weight(self, column: str) -> float:
+        return self.regions.get(region_of(column), self.other_regions)
+
+
+def _check_weight(value, where: str) -> None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{where}: weight must be a number, got {value!r}")
+
+
+def _weights(mapping, where: str) -> dict[str, float]:
+    if not isinstance(mapping, dict):
+        raise ValueError(f"{where}: expected an object of name → weight, got {mapping!r}")
+    for name, value in mapping.items():
+        _check_weight(value, f"{where}.{name}")
+    return {name: float(value) for name, value in mapping.items()}
+
+
+def load_weight_profiles(path: str) -> dict[str, WeightProfile]:
+    """Profile name → WeightProfile from a --weights JSON file; raises ValueError on bad content."""
+    with open(path) as f:
+        document = json.load(f)
+    if not isinstance(document, dict) or not document:
+        raise ValueError("expected a non-empty object of profile name → weights")
+    profiles = {}
+    for name, entry in document.items():
+        if not name.strip():
+            raise ValueError("profile names must not be empty")
+        try:
+            profiles[name] = WeightProfile.from_json(entry)
+        except ValueError as e:
+            raise ValueError(f"profile {name!r}: {e}") from None
+    return profiles
+
+
+class MatchMatrix:
+    """Sparse count matrix of rows × (rule, region column); see the module docstring."""
+
+    def __init__(
+        self,
+        rules: list[str],
+        columns: list[str],
+        fixability: dict[str, str | None],
+        rows: np.ndarray,
+        rule_ids: np.ndarray,
+        column_ids: np.ndarray,
+        counts: np.ndarray,
+        n_rows: int,
+        keys: pl.Series | None = None,
+        first_row: int = 0,
+    ):
+        self.rules = rules
+        self.columns = columns
+        self.fixability = fixability
+        self.rows = rows
+        self.rule_ids = rule_ids
+        self.column_ids = column_ids
+        self.counts = counts
+        self.n_rows = n_rows
+        self.keys = keys
+        self.first_row = first_row
+
+    @classmethod
+    def from_liability_frame(
+        cls,
+        df: pl.DataFrame,
+        fixability_map: dict[str, str],
+        rules: list[str] = (),
+        keys: pl.Series | None = None,
+        n_rows: int | None = None,
+    ) -> "MatchMatrix":
+        """Matrix of a frame of "... liabilities" columns (comma-separated rule names per cell).
+
+        `n_rows` gives the row count of a frame without columns. Rule ids follow `rules`, then
+        names not in it in order of appearance. Entries are
+        ordered by row, then column, then position in the cell, so scores add up in the
+        same order as the per-row scorer (scoring.compute_developability_score).
+        """
+        parts = [
+            pl.DataFrame({"name": df[column].cast(pl.Utf8).str.split(",")})
+            .with_row_index("row")
+            .with_columns(pl.lit(j, dtype=pl.UInt32).alias("column"))
+            for j, column in enumerate(df.columns)
+        ]
+        schema = {"row": pl.UInt32, "name": pl.List(pl.Utf8), "column": pl.UInt32}
+        long = (
+            (pl.concat(parts) if parts else pl.DataFrame(schema=schema))
+            .explode("name")
+            .with_columns(pl.col("name").str.strip_chars())
+            .filter(pl.col("name").is_not_null() & ~pl.col("name").is_in(_NOT_A_RULE))
+            .sort("row", "column", maintain_order=True)
+            .group_by("row", "column", "name", maintain_order=True)
+            .len()
+        )
+        names = list(dict.fromkeys(list(rules) + long["name"].unique(maintain_order=True).to_list()))
+        rule_ids = long["name"].replace_strict({name: i for i, name in enumerate(names)}, return_dtype=pl.UInt32)
+        return cls(
+            names,
+            [c.removesuffix(" liabilities") for c in df.columns],
+            {name: fixability_map.get(name) for name in names},
+            long["row"].to_numpy().astype(np.int64),
+            rule_ids.to_numpy().astype(np.uint32),
+            long["column"].to_numpy(),
+            long["len"].to_numpy().astype(np.uint32),
+            df.height if n_rows is None else n_rows,
+            keys.cast(pl.Utf8) if keys is not None else None,
+        )
+
+    @classmethod
+    def concat(cls, parts: list["MatchMatrix"]) -> "MatchMatrix":
+        """Consecutive frames' matrices as one, with the union of their rules and columns."""
+        rules = list(dict.fromkeys(r for part in parts for r in part.rules))
+        columns = list(dict.fromkeys(c for part in parts for c in part.columns))
+        fixability = {rule: fix for part in parts for rule, fix in part.fixability.items()}
+        rule_index, column_index = {r: i for i, r in enumerate(rules)}, {c: i for i, c in enumerate(columns)}
+        rows, rule_ids, column_ids, counts, keys = [], [], [], [], []
+        n_rows = 0
+        for part in parts:
+            rule_map = np.array([rule_index[r] for r in part.rules], dtype=np.uint32)
+            column_map = np.array([column_index[c] for c in part.columns], dtype=np.uint32)
+            rows.append(part.rows + n_rows)
+            rule_ids.append(rule_map[part.rule_ids] if len(part.rule_ids) else part.rule_ids)
+            column_ids.append(column_map[part.column_ids] if len(part.column_ids) else part.column_ids)
+            counts.append(part.counts)
+            keys.append(part.keys if part.keys is not None else pl.Series([None] * part.n_rows, dtype=pl.Utf8))
+            n_rows += part.n_rows
+
+        def stack(arrays: list[np.ndarray], dtype) -> np.ndarray:
+            return np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+
+        all_keys = pl.concat(keys) if keys else pl.Series([], dtype=pl.Utf8)
+        return cls(
+            rules,
+            columns,
+            fixability,
+            stack(rows, np.int64),
+            stack(rule_ids, np.uint32),
+            stack(column_ids, np.uint32),
+            stack(counts, np.uint32),
+            n_rows,
+            all_keys if all_keys.is_not_null().any() else None,
+            parts[0].first_row if parts else 0,
+        )
+
+    def weights(self, profile: WeightProfile) -> np.ndarray:
+        """The profile's rule × column weight table."""
+        rule_w = np.array([profile.rule_weight(r, self.fixability.get(r)) for r in self.rules], dtype=np.float64)
+        column_w = np.array([profile.region_weight(c) for c in self.columns], dtype=np.float64)
+        return np.outer(rule_w, column_w)
+
+    def score(self, profile: WeightProfile) -> np.ndarray:
+        """Cost of every row under `profile`: the matrix times the flattened weight table."""
+        values = self.weights(profile)[self.rule_ids, self.column_ids] * self.counts
+        return np.bincount(self.rows, weights=values, minlength=self.n_rows)
+
+    def save(self, path: str) -> None:
+        meta = {
+            "version": MATRIX_VERSION,
+            "rules": self.rules,
+            "columns": self.columns,
+            "fixability": self.fixability,
+            "first_row": self.first_row,
+            "n_rows": self.n_rows,
+            "has_keys": self.keys is not None,
+        }
+        keys = self.keys if self.keys is not None else pl.Series([], dtype=pl.Utf8)
+        with open(path, "wb") as f:  # A file object keeps numpy from appending ".npz"
+            np.savez_compressed(
+                f,
+                rows=self.rows,
+                rule_ids=self.rule_ids,
+                column_ids=self.column_ids,
+                counts=self.counts,
+                keys=np.array(keys.fill_null("").to_list(), dtype=np.str_),
+                meta=np.array(json.dumps(meta)),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "MatchMatrix":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != MATRIX_VERSION:
+                raise ValueError(f"unsupported match matrix version {meta['version']}")
+            keys = pl.Series(data["keys"].tolist(), dtype=pl.Utf8) if meta["has_keys"] else None
+            return cls(
+                meta["rules"],
+                meta["columns"],
+                meta["fixability"],
+                data["rows"],
+                data["rule_ids"],
+                data["column_ids"],
+                data["counts"],
+                meta["n_rows"],
+                keys,
+                meta["first_row"],
+            )
+
+    def cost_frame(self, profiles: dict[str, WeightProfile]) -> pl.DataFrame:
+        """clonotypeKey (or input row number), Developability cost and one column per profile."""
+        if self.keys is not None:
+            index = self.keys.alias("clonotypeKey")
+        else:
+            index = pl.Series("row", np.arange(self.first_row, self.first_row + self.n_rows, dtype=np.int64))
+        scored = {COST_COLUMN: WeightProfile(), **{cost_column(name): p for name, p in profiles.items()}}
+        return pl.DataFrame([index] + [pl.Series(name, self.score(p)) for name, p in scored.items()])
+
+
+def main():
+    p = argparse.ArgumentParser(description="Re-weight a match matrix written by main.py --match-matrix.")
+    p.add_argument("matrix", help="Match matrix file (.npz)")
+    p.add_argument("--weights", required=True, help="Weight profiles JSON (see match_matrix.py)")
+    p.add_argument("--output", help="Cost table TSV (default: stdout)")
+    args = p.parse_args()
+    try:
+        profiles = load_weight_profiles(args.weights)
+        matrix = MatchMatrix.load(args.matrix)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    costs = matrix.cost_frame(profiles)
+    if args.output:
+        costs.write_csv(args.output, separator="\t")
+        print(f"Costs of {costs.height} rows under {list(profiles)} written to {args.output}", file=sys.stderr)
+    else:
+        sys.stdout.write(costs.write_csv(separator="\t"))
+
+
+if __name__ == "__main__":
+    main()
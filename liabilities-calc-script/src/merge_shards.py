@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Merge the outputs of `main.py --shard i/n` runs back into a single result.
+
+Shard tables are concatenated in the order given (pass them in shard order to restore
+the original row order) and the regions-found lists are unioned. Shards of one run share
+the code table main.py assigns from the rule set, so their headers and label maps are
+identical; shards that differ come from different runs and are rejected.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import tsv_io
+from annotations import load_label_map
+from definitions import REGION_ORDER_MAP
+
+
+def check_label_maps(base_map: dict, shard_maps: list[dict]) -> dict[str, str]:
+    """Return the label map the shards share; ValueError if they differ or contradict `base_map`."""
+    shared = shard_maps[0]
+    for i, shard_map in enumerate(shard_maps[1:], start=1):
+        if shard_map != shared:
+            raise ValueError(f"shard {i} has a different label map from shard 0; the shards come from different runs")
+    for code, name in base_map.items():
+        if str(code) in shared and shared[str(code)] != str(name):
+            raise ValueError(
+                f"label map entry {code!r} is {shared[str(code)]!r} in the shards but {name!r} in --label-map"
+            )
+    return shared
+
+
+def merge_regions_found(paths: list[str]) -> list[str]:
+    found: set[str] = set()
+    for path in paths:
+        with open(path) as f:
+            found.update(json.load(f))
+    return sorted(found, key=lambda x: REGION_ORDER_MAP.get(x, 99))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Merge main.py --shard outputs in original row order.")
+    p.add_argument("output_tsv", help="Merged output TSV")
+    p.add_argument("shard_tsvs", nargs="+", help="Shard output TSVs, in shard order (0/n, 1/n, ...)")
+    p.add_argument("-m", "--label-map", help="The --label-map given to main.py (JSON file or string).")
+    p.add_argument("--shard-label-maps", nargs="*", default=[], help="Per-shard -o label maps, in shard order.")
+    p.add_argument("-o", "--output-label-map", help="Where to write the merged JSON label map.")
+    p.add_argument("--shard-regions-found", nargs="*", default=[], help="Per-shard regions-found JSON files.")
+    p.add_argument("--output-regions-found", help="Where to write the merged regions-found JSON list.")
+    p.add_argument(
+        "--compression",
+        choices=("none",) + tsv_io.COMPRESSIONS,
+        help="Compress the merged TSV (default: from the output suffix, .gz or .zst). Shards may be compressed.",
+    )
+    p.add_argument("--compression-threads", type=int, default=os.cpu_count() or 1, help="Compression threads.")
+    args = p.parse_args()
+
+    if args.shard_label_maps and len(args.shard_label_maps) != len(args.shard_tsvs):
+        p.error("--shard-label-maps must list one label map per shard TSV")
+
+    if args.shard_label_maps:
+        shard_maps = []
+        for path in args.shard_label_maps:
+            with open(path) as f:
+                shard_maps.append({str(k): str(v) for k, v in json.load(f).items()})
+        try:
+            label_map = check_label_maps(load_label_map(args.label_map), shard_maps)
+        except ValueError as e:
+            sys.exit(f"Error merging label maps: {e}")
+        if args.output_label_map:
+            with open(args.output_label_map, "w") as f:
+                json.dump(label_map, f, indent=2, sort_keys=True)
+            print(f"Merged label map written to {args.output_label_map}")
+
+    compression = tsv_io.compression_for(args.output_tsv, args.compression)
+    try:
+        tsv_io.concat_tsvs(args.shard_tsvs, args.output_tsv, compression, args.compression_threads)
+    except ValueError as e:
+        sys.exit(f"Error merging shard tables: {e}; the shards come from different runs")
+    print(f"Merged {len(args.shard_tsvs)} shards into {args.output_tsv}")
+
+    if args.output_regions_found:
+        regions = merge_regions_found(args.shard_regions_found)
+        with open(args.output_regions_found, "w") as f:
+            json.dump(regions, f, indent=2)
+        print(f"Merged regions found {regions} written to {args.output_regions_found}")
+
+
+if __name__ == "__main__":
+    main()
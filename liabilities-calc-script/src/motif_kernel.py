@@ -0,0 +1,274 @@
+"""Vectorised scanning of short fixed-length liability motifs.
+
+A sequence column is packed into one contiguous uint8 buffer (rows separated by a NUL
+byte) plus row offsets, without creating a Python string per row. A motif is a short
+run of residue classes; it is evaluated at every buffer position at once with shifted
+lookup-table gathers, and hits are reduced per row with np.logical_or.reduceat /
+np.add.reduceat. The separator byte never matches a class, so matches cannot span rows.
+
+compile_motif() accepts the subset of regex syntax used by the predefined rules:
+literals, escaped punctuation (e.g. \\*), '.', [...] and [^...] classes, top-level '|'
+alternation and a trailing (?!$). Anything else returns None and the caller falls back
+to the regex engine.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+import polars as pl
+
+_SEPARATOR = 0
+_MAX_COMPARED_BYTES = 4  # Classes this small (or this close to everything) are matched by comparison
+_NOT_AT_END_SUFFIX = "(?!$)"
+_UNSUPPORTED_CHARS = set("()?*+{}^$")
+
+
+@dataclass
+class PackedColumn:
+    """A string column packed into a NUL-separated uint8 buffer.
+
+    Row i occupies buf[starts[i] : starts[i] + lengths[i]] and is followed by a separator,
+    so every row segment is non-empty and reduceat over `starts` is well defined.
+    `valid` marks non-null, non-blank rows (the rows identify_liabilities would scan).
+    """
+
+    buf: np.ndarray
+    starts: np.ndarray
+    lengths: np.ndarray
+    valid: np.ndarray
+    is_ascii: bool
+    upper: pl.Series
+    _class_masks: dict = field(default_factory=dict, repr=False)
+    _strings: list | None = field(default=None, repr=False)
+
+    @classmethod
+    def from_series(cls, series: pl.Series) -> "PackedColumn":
+        series = series.cast(pl.Utf8)
+        # Uppercase for case-sensitive detection (MiXCR lowercases germline-imputed residues).
+        upper = series.str.to_uppercase()
+        valid = (series.is_not_null() & (series.str.strip_chars().str.len_bytes() > 0)).to_numpy()
+        lengths = upper.str.len_bytes().fill_null(0).to_numpy().astype(np.int64)
+        if len(upper):
+            joined = upper.fill_null("").str.join("\x00").item().encode("utf-8") + b"\x00"
+        else:
+            joined = b""
+        buf = np.frombuffer(joined, dtype=np.uint8)
+        starts = np.zeros(len(lengths), dtype=np.int64)
+        if len(lengths) > 1:
+            np.cumsum(lengths[:-1] + 1, out=starts[1:])
+        is_ascii = not bool((buf >= 128).any()) if len(buf) else True
+        return cls(buf=buf, starts=starts, lengths=lengths, valid=valid, is_ascii=is_ascii, upper=upper)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def strings(self) -> list:
+        """Uppercased row strings, materialised on first use (regex fallback only)."""
+        if self._strings is None:
+            self._strings = self.upper.to_list()
+        return self._strings
+
+    def class_mask(self, lut: np.ndarray) -> np.ndarray:
+        """Per-byte membership in a residue class; cached so rules sharing a class reuse it."""
+        key = lut.tobytes()
+        mask = self._class_masks.get(key)
+        if mask is None:
+            # A few byte comparisons are much cheaper than a table gather over the buffer.
+            members = np.flatnonzero(lut)
+            excluded = np.flatnonzero(~lut[1:]) + 1  # Outside the class, besides the separator
+            if len(members) <= _MAX_COMPARED_BYTES:
+                mask = np.zeros(len(self.buf), dtype=bool)
+                for byte in members:
+                    mask |= self.buf == byte
+            elif len(excluded) <= _MAX_COMPARED_BYTES:
+                mask = self.buf != _SEPARATOR
+                for byte in excluded:
+                    mask &= self.buf != byte
+            else:
+                mask = lut[self.buf]
+            self._class_masks[key] = mask
+        return mask
+
+    def row_any(self, mask: np.ndarray) -> np.ndarray:
+        if not len(self):
+            return np.zeros(0, dtype=bool)
+        return np.logical_or.reduceat(mask, self.starts)
+
+    def row_count(self, mask: np.ndarray) -> np.ndarray:
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        return np.add.reduceat(mask.astype(np.int64), self.starts)
+
+    def residue_count(self, residue: str) -> np.ndarray:
+        return self.row_count(self.buf == ord(residue))
+
+    def residue_at(self, residue: str, position: int) -> tuple[np.ndarray, np.ndarray]:
+        """(in_range, is_residue) per row for a 0-based position; negative counts from the row end."""
+        if position >= 0:
+            in_range = position < self.lengths
+            index = self.starts + position
+        else:
+            in_range = -position <= self.lengths
+            index = self.starts + self.lengths + position
+        index = np.where(in_range, index, 0)
+        is_residue = in_range & (self.buf[index] == ord(residue)) if len(self.buf) else in_range
+        return in_range, is_residue
+
+
+@dataclass(frozen=True, eq=False)
+class Motif:
+    """Alternatives of residue-class runs; `not_at_end` encodes a trailing (?!$)."""
+
+    alternatives: tuple[tuple[np.ndarray, ...], ...]
+    not_at_end: bool = False
+
+    @property
+    def fixed_length(self) -> int | None:
+        lengths = {len(alt) for alt in self.alternatives}
+        return lengths.pop() if len(lengths) == 1 else None
+
+    def hit_mask(self, packed: PackedColumn) -> np.ndarray:
+        """Boolean mask over packed.buf marking the start of every (possibly overlapping) match."""
+        n = len(packed.buf)
+        total = np.zeros(n, dtype=bool)
+        for alt in self.alternatives:
+            k = len(alt)
+            m = n - k + 1
+            if m <= 0:
+                continue
+            acc = packed.class_mask(alt[0])[:m].copy()
+            for j in range(1, k):
+                acc &= packed.class_mask(alt[j])[j : j + m]
+            if self.not_at_end:
+                # The byte after the match must not be the row separator.
+                acc[: m - 1] &= packed.buf[k:] != _SEPARATOR
+            total[:m] |= acc
+        return total
+
+    def row_hits(self, packed: PackedColumn) -> np.ndarray:
+        return packed.row_any(self.hit_mask(packed))
+
+    def match_positions(self, packed: PackedColumn) -> tuple[np.ndarray, np.ndarray]:
+        """(row index, 0-based offset) of every match, with re.finditer's non-overlapping semantics.
+
+        Only valid for fixed-length motifs: the leftmost match wins and scanning resumes
+        after it, so overlapping candidates are dropped greedily from the left.
+        """
+        k = self.fixed_length
+        if k is None:
+            raise ValueError("match_positions requires a fixed-length motif")
+        positions = np.flatnonzero(self.hit_mask(packed))
+        rows = np.searchsorted(packed.starts, positions, side="right") - 1
+        keep = non_overlapping(positions, rows, k)
+        positions, rows = positions[keep], rows[keep]
+        return rows, positions - packed.starts[rows]
+
+
+def non_overlapping(positions: np.ndarray, groups: np.ndarray, k: int) -> np.ndarray:
+    """Mask of the matches re.finditer keeps among length-k match starts, sorted by position
+    within each group (a row): the leftmost wins and scanning resumes after it."""
+    keep = np.ones(len(positions), dtype=bool)
+    if k > 1 and len(positions) > 1:
+        close = (np.diff(positions) < k) & (groups[1:] == groups[:-1])
+        if close.any():
+            in_chain = np.zeros(len(positions), dtype=bool)
+            in_chain[1:] |= close
+            in_chain[:-1] |= close
+            last_end = -1
+            # Only members of overlapping runs need the sequential greedy pass.
+            for i in np.flatnonzero(in_chain):
+                if i == 0 or not close[i - 1]:
+                    last_end = positions[i] + k
+                elif positions[i] < last_end:
+                    keep[i] = False
+                else:
+                    last_end = positions[i] + k
+    return keep
+
+
+def _class_lut(members: set[int], negate: bool) -> np.ndarray:
+    lut = np.zeros(256, dtype=bool)
+    lut[list(members)] = True
+    if negate:
+        lut = ~lut
+    lut[_SEPARATOR] = False
+    return lut
+
+
+def _parse_class(pattern: str, i: int) -> tuple[np.ndarray, int] | None:
+    """Parse a [...] class starting after '['; return (lut, index after ']')."""
+    negate = False
+    if i < len(pattern) and pattern[i] == "^":
+        negate = True
+        i += 1
+    members: set[int] = set()
+    first = True
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "]" and not first:
+            return _class_lut(members, negate), i + 1
+        first = False
+        if ch == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                return None  # \d, \w, ... are not simple residue sets
+            ch = pattern[i + 1]
+            i += 1
+        elif ch == "[":
+            return None
+        if i + 2 < len(pattern) and pattern[i + 1] == "-" and pattern[i + 2] != "]":
+            lo, hi = ord(ch), ord(pattern[i + 2])
+            if lo > hi or hi >= 128:
+                return None
+            members.update(range(lo, hi + 1))
+            i += 3
+            continue
+        if ord(ch) >= 128:
+            return None
+        members.add(ord(ch))
+        i += 1
+    return None
+
+
+def compile_motif(pattern: str) -> Motif | None:
+    """Compile a regex into a Motif, or return None when the kernel cannot express it."""
+    if not pattern:
+        return None
+    not_at_end = False
+    if pattern.endswith(_NOT_AT_END_SUFFIX):
+        not_at_end = True
+        pattern = pattern[: -len(_NOT_AT_END_SUFFIX)]
+
+    alternatives: list[tuple[np.ndarray, ...]] = []
+    current: list[np.ndarray] = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "|":
+            if not current:
+                return None
+            alternatives.append(tuple(current))
+            current = []
+            i += 1
+        elif ch == "[":
+            parsed = _parse_class(pattern, i + 1)
+            if parsed is None:
+                return None
+            lut, i = parsed
+            current.append(lut)
+        elif ch == "\\":
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum() or ord(pattern[i + 1]) >= 128:
+                return None
+            current.append(_class_lut({ord(pattern[i + 1])}, negate=False))
+            i += 2
+        elif ch == ".":
+            current.append(_class_lut({ord("\n")}, negate=True))
+            i += 1
+        elif ch in _UNSUPPORTED_CHARS or ch == "]" or ord(ch) >= 128:
+            return None
+        else:
+            current.append(_class_lut({ord(ch)}, negate=False))
+            i += 1
+    if not current:
+        return None
+    alternatives.append(tuple(current))
+    return Motif(alternatives=tuple(alternatives), not_at_end=not_at_end)
@@ -15,22 +15,48 @@ Pipeline differences vs the antibody main.py:
   term (no regions to weight).
 """
 import argparse
+import contextlib
 import json
+import multiprocessing
+import os
 import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import polars as pl
 
+import batching
+import estimate
+import preview
+import tsv_io
 from definitions import (
     FIXABILITY_WEIGHTS,
     ORIG_REGEX_LIABILITIES,
     PEPTIDE_LIABILITY_NAMES,
     _ENGINEERING_FIXABILITIES,
 )
+from custom_regex import (
+    DEFAULT_TIME_BUDGET_SECONDS,
+    ON_TIMEOUT,
+    CustomPattern,
+    RegexBudget,
+    RegexTimeout,
+    compile_custom,
+    describe_engine,
+    linear_match_offsets,
+)
+from repertoire_summary import RepertoireSummary
+from scan_stats import ScanStats
 
 
 _RISK_ORDER = {"None": 0, "Low": 1, "Medium": 2, "High": 3}
 _LEVEL_TO_RISK = {v: k for k, v in _RISK_ORDER.items()}
+# --workers: each frame is cut into about this many contiguous chunks per worker (for load
+# balance), of at least MIN_CHUNK_ROWS rows each.
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_ROWS = 2_000
 
 
 def _build_active_rules(
@@ -72,10 +98,11 @@ def _build_active_rules(
             print(f"peptide_main: custom liability '{name}' collides with predefined; skipping", file=sys.stderr)
             continue
         try:
-            compiled = re.compile(pat)
+            compiled = compile_custom(pat)
         except re.error as e:
             print(f"peptide_main: invalid regex for '{name}': {e}; skipping", file=sys.stderr)
             continue
+        print(f"peptide_main: {describe_engine(name, compiled)}", file=sys.stderr)
         rules[name] = {
             "pattern": compiled,
             "risk_level": risk,
@@ -85,17 +112,25 @@ def _build_active_rules(
     return rules
 
 
-def _scan_sequence(seq: str, rules: dict[str, dict]) -> list[tuple[str, int, str, str]]:
+def _scan_sequence(
+    seq: str, rules: dict[str, dict], rule_costs: dict[str, tuple[float, int]] | None = None
+) -> list[tuple[str, int, str, str]]:
     """Return list of (name, position_1based, risk_level, fixability) for all matches.
 
-    Empty / non-string sequences return [] (caller treats as "Unknown").
+    Empty / non-string sequences return [] (caller treats as "Unknown"). When
+    `rule_costs` is given it is filled with (seconds, match count) per rule.
     """
     if not isinstance(seq, str) or not seq.strip():
         return []
     matches: list[tuple[str, int, str, str]] = []
     for name, defn in rules.items():
+        if rule_costs is not None:
+            started = time.perf_counter()
+            found = len(matches)
         for m in defn["pattern"].finditer(seq):
             matches.append((name, m.start() + 1, defn["risk_level"], defn["fixability"]))
+        if rule_costs is not None:
+            rule_costs[name] = (time.perf_counter() - started, len(matches) - found)
     return matches
 
 
@@ -148,35 +183,100 @@ def _compute_cost(matches: list[tuple[str, int, str, str]]) -> float:
     return total
 
 
-def run(
-    input_tsv: str,
-    output_tsv: str,
-    use_predefined: bool,
-    disabled_predefined: list[str],
-    custom_liabilities: list[dict],
-) -> None:
-    df = pl.read_csv(input_tsv, separator="\t")
-
-    if "variantKey" not in df.columns or "sequence aa" not in df.columns:
-        raise ValueError(
-            f"peptide_main: expected columns 'variantKey' and 'sequence aa'; got {df.columns}"
-        )
-
-    rules = _build_active_rules(use_predefined, disabled_predefined, custom_liabilities)
+def _scan_custom_rules(
+    seqs: list, rules: dict[str, dict], budget: RegexBudget, stats: ScanStats | None
+) -> dict[str, list[list[int]]]:
+    """0-based match offsets per row of every custom rule, evaluated column-wise.
 
+    Rules the linear-time engine accepts run there; the others run with backtracking re
+    under `budget` (see custom_regex.py).
+    """
+    valid = np.array([isinstance(s, str) and bool(s.strip()) for s in seqs], dtype=bool)
+    strings = [s if ok else "" for s, ok in zip(seqs, valid)]
+    offsets: dict[str, list[list[int]]] = {}
+    for name, defn in rules.items():
+        custom = defn["pattern"]
+        started = time.perf_counter()
+        if custom.linear:
+            series = pl.Series(strings, dtype=pl.Utf8)
+            counts = series.str.count_matches(custom.pattern).to_numpy().astype(np.int64)
+            counts[~valid] = 0
+            offsets[name] = linear_match_offsets(series, custom, counts)
+            row_seconds = None
+        else:
+            spans, row_seconds = budget.scan(name, "peptide sequences", custom.compiled, strings)
+            offsets[name] = [[start for start, _end in row] for row in spans]
+            counts = np.array([len(row) for row in spans], dtype=np.int64)
+        if stats is not None:
+            lengths = np.array([len(s) for s in strings], dtype=np.int64)
+            elapsed = time.perf_counter() - started
+            stats.record(name, "sequence", custom.engine, valid, counts, elapsed, lengths, row_seconds)
+    return offsets
+
+
+def _scan_frame(
+    df: pl.DataFrame,
+    rules: dict[str, dict],
+    stats: ScanStats | None = None,
+    budget: RegexBudget | None = None,
+    rule_hits: dict[str, np.ndarray] | None = None,
+) -> pl.DataFrame:
+    """Scan every row of `df` and return the output table for it.
+
+    Predefined rules run row by row; custom rules column-wise (see _scan_custom_rules),
+    backtracking ones under `budget` (unlimited when None). With `stats`, every rule is
+    recorded for region "sequence"; stats.row_offset must be the frame's first input row.
+    `rule_hits`, when given, receives per rule the rows it matches (a boolean array).
+    """
     summaries: list[str] = []
     risks: list[str] = []
     costs: list[float] = []
-    for seq in df["sequence aa"].to_list():
-        matches = _scan_sequence(seq if isinstance(seq, str) else "", rules)
+    seqs = df["sequence aa"].to_list()
+    custom_rules = {name: d for name, d in rules.items() if isinstance(d["pattern"], CustomPattern)}
+    rules = {name: d for name, d in rules.items() if name not in custom_rules}
+    budget = budget if budget is not None else RegexBudget(seconds=None)
+    custom_offsets = _scan_custom_rules(seqs, custom_rules, budget, stats)
+    if rule_hits is not None:
+        flagged = {name: np.zeros(len(seqs), dtype=bool) for name in rules}
+        for name, offsets in custom_offsets.items():
+            flagged[name] = np.array([bool(row) for row in offsets], dtype=bool)
+    if stats is not None:
+        # Rows skipped as empty count as not evaluated.
+        rule_seconds = {name: np.zeros(len(seqs)) for name in rules}
+        rule_matches = {name: np.zeros(len(seqs), dtype=np.int64) for name in rules}
+        evaluated = np.zeros(len(seqs), dtype=bool)
+    for i, seq in enumerate(seqs):
+        rule_costs = {} if stats is not None else None
+        matches = _scan_sequence(seq if isinstance(seq, str) else "", rules, rule_costs)
+        for name, defn in custom_rules.items():
+            matches.extend(
+                (name, offset + 1, defn["risk_level"], defn["fixability"]) for offset in custom_offsets[name][i]
+            )
+        if rule_hits is not None:
+            for name, *_rest in matches:
+                flagged[name][i] = True
         summaries.append(_summarize(matches))
         risks.append(_classify_risk(matches))
         costs.append(_compute_cost(matches))
+        if rule_costs:
+            evaluated[i] = True
+            for name, (seconds, count) in rule_costs.items():
+                rule_seconds[name][i] = seconds
+                rule_matches[name][i] = count
+    if rule_hits is not None:
+        rule_hits.update(flagged)
+    if stats is not None:
+        lengths = np.array([len(s) if isinstance(s, str) else 0 for s in seqs], dtype=np.int64)
+        for name in rules:
+            seconds = rule_seconds[name]
+            stats.record(
+                name, "sequence", "regex", evaluated, rule_matches[name], float(seconds.sum()), lengths, seconds
+            )
 
     # Echo the peptide aa sequence to the output so the table view shows it
     # alongside the liability columns. Renamed to "peptide_aa" (no space) for
     # cleaner TSV column naming.
-    out = df.select(
+    return df.select(
         "variantKey",
         pl.col("sequence aa").alias("peptide_aa"),
     ).with_columns([
@@ -184,7 +284,222 @@ def run(
         pl.Series("developability_risk", risks, dtype=pl.Utf8),
         pl.Series("developability_cost", costs, dtype=pl.Float64),
     ])
-    out.write_csv(output_tsv, separator="\t")
+
+
+# The rule set of a worker process, shipped once by the pool initializer
+_WORKER_RULES: dict[str, dict] = {}
+
+
+def _init_worker(rules: dict[str, dict]) -> None:
+    global _WORKER_RULES
+    _WORKER_RULES = rules
+
+
+def _scan_chunk(
+    chunk: pl.DataFrame, first_row: int, stats: ScanStats | None, budget: RegexBudget
+) -> tuple[pl.DataFrame, dict[str, np.ndarray], ScanStats | None, RegexBudget]:
+    """Worker side of --workers: scan one chunk with the worker's rule set."""
+    if stats is not None:
+        stats.row_offset = first_row
+    rule_hits: dict[str, np.ndarray] = {}
+    return _scan_frame(chunk, _WORKER_RULES, stats, budget, rule_hits), rule_hits, stats, budget
+
+
+@contextlib.contextmanager
+def _frame_scanner(rules: dict[str, dict], workers: int, stats: ScanStats | None, budget: RegexBudget):
+    """Yield scan(df, first_row, rule_hits=None) -> output frame of `df`, whose first row is
+    input row `first_row`; `rule_hits` is filled as by _scan_frame.
+
+    With more than one worker, frames are cut into contiguous chunks scanned in a pool of
+    `workers` processes ("spawn", as for main.py's chain jobs) that receive the rule set
+    once, at start-up. Outputs and rule hits are concatenated in input order; each chunk's
+    statistics and regex budget use are merged back into `stats` and `budget`.
+    """
+    if workers <= 1:
+
+        def scan(df: pl.DataFrame, first_row: int, rule_hits: dict | None = None) -> pl.DataFrame:
+            if stats is not None:
+                stats.row_offset = first_row
+            return _scan_frame(df, rules, stats, budget, rule_hits)
+
+        yield scan
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(rules,),
+    ) as executor:
+
+        def scan(df: pl.DataFrame, first_row: int, rule_hits: dict | None = None) -> pl.DataFrame:
+            if df.is_empty():
+                return _scan_frame(df, rules, budget=budget, rule_hits=rule_hits)
+            chunk_rows = max(MIN_CHUNK_ROWS, -(-len(df) // (workers * CHUNKS_PER_WORKER)))
+            df = df.select("variantKey", "sequence aa")
+            futures = [
+                executor.submit(
+                    _scan_chunk,
+                    df.slice(start, chunk_rows),
+                    first_row + start,
+                    stats.spawn() if stats is not None else None,
+                    budget.spawn(),
+                )
+                for start in range(0, len(df), chunk_rows)
+            ]
+            outs, chunk_hits = [], []
+            for future in futures:
+                out, hits, chunk_stats, chunk_budget = future.result()
+                outs.append(out)
+                chunk_hits.append(hits)
+                if stats is not None:
+                    stats.merge(chunk_stats)
+                budget.absorb(chunk_budget)
+            if rule_hits is not None:
+                rule_hits.update({name: np.concatenate([hits[name] for hits in chunk_hits]) for name in rules})
+            return pl.concat(outs)
+
+        yield scan
+
+
+def _check_columns(df: pl.DataFrame) -> None:
+    if "variantKey" not in df.columns or "sequence aa" not in df.columns:
+        raise ValueError(
+            f"peptide_main: expected columns 'variantKey' and 'sequence aa'; got {df.columns}"
+        )
+
+
+def run(
+    input_tsv: str,
+    output_tsv: str,
+    use_predefined: bool,
+    disabled_predefined: list[str],
+    custom_liabilities: list[dict],
+    max_memory: int | None = None,
+    compression: str | None = None,
+    compression_threads: int = 1,
+    stats: ScanStats | None = None,
+    regex_budget: RegexBudget | None = None,
+    summary: RepertoireSummary | None = None,
+    workers: int = 1,
+) -> None:
+    """Scan `input_tsv` (plain, gzip or zstd) into `output_tsv`.
+
+    With `max_memory` (bytes) the input is processed in batches sized from a measured
+    sample, each batch spilled to a part file next to the output while the next one is read
+    and scanned (see batching.py).
+    `compression` ('gzip'/'zstd') compresses the output on `compression_threads` threads.
+    Per-rule scan statistics are added to `stats` when given. Custom rules that need a
+    backtracking regex engine share `regex_budget` (default: DEFAULT_TIME_BUDGET_SECONDS,
+    then fail). Every scanned frame is added to `summary` when given. With `workers` > 1,
+    frames are scanned in a pool of worker processes (see _frame_scanner).
+    """
+    regex_budget = regex_budget if regex_budget is not None else RegexBudget()
+    if max_memory is None:
+        df = pl.read_csv(input_tsv, separator="\t")
+        _check_columns(df)
+        rules = _build_active_rules(use_predefined, disabled_predefined, custom_liabilities)
+        hits = {} if summary is not None else None
+        with _frame_scanner(rules, workers, stats, regex_budget) as scan:
+            out = scan(df, 0, hits)
+        if summary is not None:
+            summary.add(out, _rule_hits(hits, rules))
+        tsv_io.write_tsv(out, output_tsv, compression, compression_threads)
+        return
+
+    schema = batching.infer_schema(input_tsv, infer_schema_length=100, ignore_errors=False)
+    sample = next(batching.iter_tsv_batches(input_tsv, batching.SAMPLE_ROWS, schema, False))
+    _check_columns(sample)
+    rules = _build_active_rules(use_predefined, disabled_predefined, custom_liabilities)
+    row_bytes = batching.measure_row_bytes(lambda batch: _scan_frame(batch, rules, budget=regex_budget), sample)
+    batch_rows = batching.choose_batch_rows(max_memory, row_bytes, batching.peak_rss_bytes())
+    print(f"peptide_main: ~{row_bytes:.0f} bytes/row, batches of {batch_rows} rows")
+
+    next_row = 0
+
+    def process(_batch_index: int, batch: pl.DataFrame) -> pl.DataFrame:
+        nonlocal next_row
+        hits = {} if summary is not None else None
+        out = scan(batch, next_row, hits)
+        next_row += len(batch)
+        if summary is not None:
+            summary.add(out, _rule_hits(hits, rules))
+        return out
+
+    with (
+        _frame_scanner(rules, workers, stats, regex_budget) as scan,
+        batching.spill_dir_for(output_tsv) as spill_dir,
+    ):
+        n_batches = batching.run_pipeline(
+            batching.iter_tsv_batches(input_tsv, batch_rows, schema, False),
+            process,
+            lambda batch_index, out: out.write_csv(batching.part_path(spill_dir, batch_index), separator="\t"),
+        )
+        part_paths = [batching.part_path(spill_dir, i) for i in range(n_batches)]
+        batching.combine_parts(part_paths, output_tsv, compression, compression_threads)
+
+
+def _rule_hits(hits: dict[str, np.ndarray], rules: dict[str, dict]) -> dict[str, dict[str, np.ndarray]]:
+    """Per rule, the rows _scan_frame found it in (`hits`), as region "sequence" (the region
+    scan statistics use too)."""
+    # Sorted: the predefined peptide rules come from a set
+    return {name: {"sequence": hits[name]} for name in sorted(rules)}
+
+
+def preview_run(
+    input_tsv: str,
+    output_tsv: str,
+    n: int,
+    seed: int,
+    report_path: str,
+    use_predefined: bool,
+    disabled_predefined: list[str],
+    custom_liabilities: list[dict],
+    compression: str | None = None,
+    compression_threads: int = 1,
+    stats: ScanStats | None = None,
+    regex_budget: RegexBudget | None = None,
+    summary: RepertoireSummary | None = None,
+) -> None:
+    """--preview: scan a deterministic sample of `n` rows (see preview.py) into `output_tsv`
+    and write the per-rule prevalence report to `report_path`."""
+    df, total_rows = preview.sample_frame(pl.scan_csv(input_tsv, separator="\t"), n, "variantKey", seed)
+    _check_columns(df)
+    rules = _build_active_rules(use_predefined, disabled_predefined, custom_liabilities)
+    hits: dict[str, np.ndarray] = {}
+    out = _scan_frame(df, rules, stats, regex_budget if regex_budget is not None else RegexBudget(), hits)
+    if summary is not None:
+        summary.add(out, _rule_hits(hits, rules))
+    tsv_io.write_tsv(out, output_tsv, compression, compression_threads)
+    key = "variantKey" if "variantKey" in df.columns else "row number"
+    report = preview.prevalence_report(_rule_hits(hits, rules), len(out), total_rows, seed, key)
+    preview.write_report(report, report_path)
+    print(f"peptide_main: previewed {len(out)} of {total_rows} rows; prevalence report written to {report_path}")
+
+
+def estimate_run(
+    input_tsv: str,
+    use_predefined: bool,
+    disabled_predefined: list[str],
+    custom_liabilities: list[dict],
+) -> dict:
+    """Project a full run's row count, peak memory and runtime from the input's first rows."""
+    schema = batching.infer_schema(input_tsv, infer_schema_length=100, ignore_errors=False)
+    sample = next(batching.iter_tsv_batches(input_tsv, batching.SAMPLE_ROWS, schema, False))
+    _check_columns(sample)
+    rules = _build_active_rules(use_predefined, disabled_predefined, custom_liabilities)
+    regex_budget = RegexBudget()
+    return estimate.build_estimate(
+        input_tsv,
+        sample,
+        lambda batch: _scan_frame(batch, rules, budget=regex_budget),
+        # --workers splits the input into chunks of at least MIN_CHUNK_ROWS rows.
+        suggested_threads=batching.available_cpus(),
+        rows_per_thread=MIN_CHUNK_ROWS,
+        path="peptide",
+        rules=len(rules),
+        mean_sequence_lengths=estimate.mean_lengths(sample, ["sequence aa"]),
+    )
 
 
 def _load_json_list(path: str | None, label: str) -> list:
@@ -200,10 +515,18 @@ def _load_json_list(path: str | None, label: str) -> list:
     return value
 
 
+def _write_reports(args, stats: ScanStats | None, summary: RepertoireSummary | None) -> None:
+    if stats is not None:
+        stats.write(args.stats_output)
+    if summary is not None:
+        summary.write(args.summary_report)
+        print(f"peptide_main: repertoire summary of {summary.rows} rows written to {args.summary_report}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Peptide sequence-liability scanner")
     parser.add_argument("--input_tsv", required=True)
-    parser.add_argument("--output_tsv", required=True)
+    parser.add_argument("--output_tsv", help="Output TSV (not needed with --estimate)")
     parser.add_argument(
         "--use_predefined_liabilities",
         action="store_true",
@@ -219,18 +542,153 @@ def main():
         default=None,
         help="Path to a JSON file containing an array of {name, pattern, riskLevel, fixability} objects.",
     )
+    parser.add_argument(
+        "--max_memory",
+        default=None,
+        help="Memory budget such as '2GiB'; the input is then scanned in batches that fit it.",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=("none",) + tsv_io.COMPRESSIONS,
+        default=None,
+        help="Compress the output TSV (default: from the output suffix, .gz or .zst). Inputs are detected.",
+    )
+    parser.add_argument(
+        "--compression_threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Threads for output compression.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes scanning contiguous chunks of the input in parallel (default: 1, in-process).",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Do not scan; print a JSON projection of row count, peak memory and runtime for the input.",
+    )
+    parser.add_argument(
+        "--preview",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Scan only a deterministic sample of N rows (smallest seeded hash of variantKey) and write"
+        " per-rule prevalence, extrapolated to the whole input, to --preview_report.",
+    )
+    parser.add_argument("--preview_seed", type=int, default=0, help="Hash seed of the --preview sample.")
+    parser.add_argument(
+        "--preview_report",
+        default=None,
+        help="Path of the --preview prevalence JSON (default: <output_tsv>.preview.json).",
+    )
+    parser.add_argument(
+        "--summary_report",
+        default=None,
+        help="Path to write a repertoire summary gathered during the scan: per-rule prevalence, developability"
+        " risk and cost histograms, rule co-occurrence (.parquet for Parquet, else JSON).",
+    )
+    parser.add_argument(
+        "--stats_output",
+        default=None,
+        help="Path to write a JSON report of per-rule scan statistics (rows evaluated, hits, matches, slowest rows).",
+    )
+    parser.add_argument(
+        "--stats_slowest",
+        type=int,
+        default=5,
+        help="Number of slowest rows to keep per rule in --stats_output.",
+    )
+    parser.add_argument(
+        "--regex_time_budget",
+        type=float,
+        default=DEFAULT_TIME_BUDGET_SECONDS,
+        help="Seconds the job may spend on custom patterns that need backtracking regex; 0 for no limit.",
+    )
+    parser.add_argument(
+        "--on_regex_timeout",
+        choices=ON_TIMEOUT,
+        default="fail",
+        help="When the regex time budget runs out: fail the job, or skip the rule with a warning.",
+    )
     args = parser.parse_args()
+    if not args.output_tsv and not args.estimate:
+        parser.error("the following arguments are required: --output_tsv")
 
+    max_memory = None
+    if args.max_memory:
+        try:
+            max_memory = batching.parse_memory_size(args.max_memory)
+        except ValueError as e:
+            parser.error(f"--max_memory: {e}")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.preview is not None:
+        if args.preview < 1:
+            parser.error("--preview must be a positive row count")
+        if max_memory or args.estimate:
+            parser.error("--preview cannot be combined with --max_memory or --estimate")
     disabled = _load_json_list(args.disabled_predefined_liabilities, "--disabled_predefined_liabilities")
     custom = _load_json_list(args.custom_liabilities, "--custom_liabilities")
 
-    run(
-        input_tsv=args.input_tsv,
-        output_tsv=args.output_tsv,
-        use_predefined=args.use_predefined_liabilities,
-        disabled_predefined=disabled,
-        custom_liabilities=custom,
+    if args.estimate:
+        try:
+            projection = estimate_run(args.input_tsv, args.use_predefined_liabilities, disabled, custom)
+        except RegexTimeout as e:
+            sys.exit(f"peptide_main: {e}")
+        print(json.dumps(projection, indent=2))
+        return
+
+    stats = ScanStats(slowest_n=args.stats_slowest) if args.stats_output else None
+    regex_budget = RegexBudget(args.regex_time_budget or None, args.on_regex_timeout)
+    compression = tsv_io.compression_for(args.output_tsv, args.compression)
+    summary = (
+        RepertoireSummary("developability_risk", "developability_cost", tuple(_RISK_ORDER))
+        if args.summary_report
+        else None
     )
+    if args.preview is not None:
+        try:
+            preview_run(
+                args.input_tsv,
+                args.output_tsv,
+                args.preview,
+                args.preview_seed,
+                args.preview_report or f"{args.output_tsv}.preview.json",
+                args.use_predefined_liabilities,
+                disabled,
+                custom,
+                compression,
+                args.compression_threads,
+                stats,
+                regex_budget,
+                summary,
+            )
+        except RegexTimeout as e:
+            sys.exit(f"peptide_main: {e}")
+        _write_reports(args, stats, summary)
+        return
+
+    try:
+        run(
+            input_tsv=args.input_tsv,
+            output_tsv=args.output_tsv,
+            use_predefined=args.use_predefined_liabilities,
+            disabled_predefined=disabled,
+            custom_liabilities=custom,
+            max_memory=max_memory,
+            compression=compression,
+            compression_threads=args.compression_threads,
+            stats=stats,
+            regex_budget=regex_budget,
+            summary=summary,
+            workers=args.workers,
+        )
+    except RegexTimeout as e:
+        sys.exit(f"peptide_main: {e}")
+    _write_reports(args, stats, summary)
 
 
 if __name__ == "__main__":
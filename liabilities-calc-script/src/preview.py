@@ -0,0 +1,91 @@
+"""--preview N: scan a deterministic sample of the input and project per-rule prevalence.
+
+The sample is the N rows whose key (clonotypeKey / variantKey, or the row number when the
+input has no key column) has the smallest seeded hash. It depends on neither row order
+nor file layout, so re-running a preview with other rules scans the same rows, and a
+larger N extends a smaller one's sample. The input is streamed once, keeping only the N
+best rows, so memory and scan time are bounded by N whatever the input size. (Polars
+does not promise stable hashes across its versions; the sample is reproducible for one
+installation.)
+
+For every rule the report gives the sampled rows it flags and the prevalence with a
+Wilson score interval, narrowed by the finite-population correction, extrapolated to
+the full table's row count.
+"""
+
+import json
+from statistics import NormalDist
+
+import numpy as np
+import polars as pl
+
+DEFAULT_CONFIDENCE = 0.95
+_ROW = "__preview_row"
+_HASH = "__preview_hash"
+
+
+def sample_frame(lf: pl.LazyFrame, n: int, key: str, seed: int = 0) -> tuple[pl.DataFrame, int]:
+    """(the n sampled rows in input order, total input rows) of a lazily scanned input."""
+    lf = lf.with_row_index(_ROW)
+    hashed = pl.col(key if key in lf.collect_schema().names() else _ROW).hash(seed)
+    sample = lf.with_columns(hashed.alias(_HASH)).bottom_k(n, by=[_HASH, _ROW]).sort(_ROW).drop(_HASH, _ROW)
+    sample_df, total = pl.collect_all([sample, lf.select(pl.len())], engine="streaming")
+    return sample_df, int(total.item())
+
+
+def wilson_interval(hits: int, n: int, total: int, confidence: float = DEFAULT_CONFIDENCE) -> tuple[float, float]:
+    """Interval for the population share of a property seen in `hits` of `n` rows sampled from `total`."""
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    if total > 1:
+        z *= np.sqrt(max(0.0, (total - n) / (total - 1)))
+    p = hits / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def prevalence_report(
+    rule_hits: dict[str, dict[str, np.ndarray]],
+    n: int,
+    total: int,
+    seed: int,
+    key: str,
+    confidence: float = DEFAULT_CONFIDENCE,
+) -> dict:
+    """Report for rule → (region → flagged sample rows); a row counts once per rule."""
+    rules = []
+    for rule, by_region in rule_hits.items():
+        flagged = np.zeros(n, dtype=bool)
+        for hits in by_region.values():
+            flagged |= hits
+        sample_hits = int(flagged.sum())
+        low, high = wilson_interval(sample_hits, n, total, confidence)
+        prevalence = sample_hits / n if n else 0.0
+        rules.append(
+            {
+                "rule": rule,
+                "sample_hits": sample_hits,
+                "prevalence": round(prevalence, 6),
+                "prevalence_low": round(low, 6),
+                "prevalence_high": round(high, 6),
+                "estimated_rows": round(prevalence * total, 1),
+                "estimated_rows_low": round(low * total, 1),
+                "estimated_rows_high": round(high * total, 1),
+                "sample_hits_by_region": {region: int(hits.sum()) for region, hits in by_region.items()},
+            }
+        )
+    return {
+        "sample_rows": n,
+        "total_rows": total,
+        "sample_key": key,
+        "seed": seed,
+        "confidence": confidence,
+        "rules": rules,
+    }
+
+
+def write_report(report: dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
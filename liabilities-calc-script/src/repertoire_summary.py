@@ -0,0 +1,119 @@
+"""--summary-report: repertoire-level liability statistics gathered while the scan runs.
+
+Every scanned frame (or --max-memory batch) is folded into running counts, so the
+report needs no second read of the output:
+
+- per rule × region: rows flagged and prevalence; per rule: rows flagged in any region;
+- histograms of the developability risk classes and of the developability cost
+  (bins of COST_BIN_WIDTH);
+- rule × rule co-occurrence: rows flagged by both rules (the diagonal is the rule's own
+  row count), accumulated as XᵀX of each frame's rows × rules hit matrix.
+
+A path ending in .parquet gets one long table (a `section` column tells the parts
+apart); anything else gets JSON.
+"""
+
+import json
+
+import numpy as np
+import polars as pl
+
+COST_BIN_WIDTH = 1.0
+
+
+class RepertoireSummary:
+    """Running counts over the scanned rows; add() every output frame, then report()."""
+
+    def __init__(self, risk_column: str, cost_column: str, risk_order: tuple[str, ...] = ()):
+        self.risk_column = risk_column
+        self.cost_column = cost_column
+        self.risk_order = risk_order
+        self.rows = 0
+        self.rules: list[str] = []
+        self.region_hits: dict[tuple[str, str], int] = {}
+        self.co_occurrence = np.zeros((0, 0), dtype=np.int64)
+        self.risk_counts: dict[str, int] = {}
+        self.cost_bins: dict[int, int] = {}
+
+    def _rule_ids(self, names) -> np.ndarray:
+        new = [name for name in names if name not in self.rules]
+        if new:
+            self.rules.extend(new)
+            grown = np.zeros((len(self.rules), len(self.rules)), dtype=np.int64)
+            grown[: len(self.co_occurrence), : len(self.co_occurrence)] = self.co_occurrence
+            self.co_occurrence = grown
+        return np.array([self.rules.index(name) for name in names], dtype=np.int64)
+
+    def add(self, df_out: pl.DataFrame, rule_hits: dict[str, dict[str, np.ndarray]]) -> None:
+        """Fold in one output frame and its rule → (region → flagged rows) hits."""
+        height = df_out.height
+        self.rows += height
+        ids = self._rule_ids(list(rule_hits))
+        flagged = np.zeros((height, len(ids)), dtype=np.int64)
+        for j, (rule, by_region) in enumerate(rule_hits.items()):
+            for region, hits in by_region.items():
+                self.region_hits[(rule, region)] = self.region_hits.get((rule, region), 0) + int(hits.sum())
+                flagged[:, j] |= hits
+        self.co_occurrence[np.ix_(ids, ids)] += flagged.T @ flagged
+
+        if self.risk_column in df_out.columns:
+            counts = df_out.group_by(pl.col(self.risk_column).cast(pl.Utf8).fill_null("None")).len()
+            for risk, n in counts.iter_rows():
+                self.risk_counts[risk] = self.risk_counts.get(risk, 0) + n
+        if self.cost_column in df_out.columns:
+            bins = (pl.col(self.cost_column).cast(pl.Float64).fill_null(0.0) / COST_BIN_WIDTH).floor().cast(pl.Int64)
+            for bin_index, n in df_out.group_by(bins.alias("bin")).len().iter_rows():
+                self.cost_bins[bin_index] = self.cost_bins.get(bin_index, 0) + n
+
+    def report(self) -> dict:
+        def share(n: int) -> float:
+            return round(n / self.rows, 6) if self.rows else 0.0
+
+        order = {risk: i for i, risk in enumerate(self.risk_order)}
+        risks = sorted(self.risk_counts, key=lambda r: (order.get(r, len(order)), r))
+        diagonal = np.diag(self.co_occurrence)
+        return {
+            "rows": self.rows,
+            "rules": [
+                {"rule": rule, "rows": int(diagonal[i]), "prevalence": share(int(diagonal[i]))}
+                for i, rule in enumerate(self.rules)
+            ],
+            "rule_region": [
+                {"rule": rule, "region": region, "rows": n, "prevalence": share(n)}
+                for (rule, region), n in self.region_hits.items()
+            ],
+            "developability_risk": [{"risk": r, "rows": self.risk_counts[r]} for r in risks],
+            "developability_cost": [
+                {"low": b * COST_BIN_WIDTH, "high": (b + 1) * COST_BIN_WIDTH, "rows": self.cost_bins[b]}
+                for b in sorted(self.cost_bins)
+            ],
+            "co_occurrence": {"rules": list(self.rules), "rows": self.co_occurrence.tolist()},
+        }
+
+    def write(self, path: str) -> None:
+        report = self.report()
+        if not path.endswith(".parquet"):
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            return
+        records = [{"section": "rules", **r} for r in report["rules"]]
+        records += [{"section": "rule_region", **r} for r in report["rule_region"]]
+        records += [{"section": "developability_risk", **r} for r in report["developability_risk"]]
+        records += [{"section": "developability_cost", **r} for r in report["developability_cost"]]
+        records += [
+            {"section": "co_occurrence", "rule": a, "other_rule": b, "rows": int(self.co_occurrence[i, j])}
+            for i, a in enumerate(self.rules)
+            for j, b in enumerate(self.rules)
+        ]
+        schema = {
+            "section": pl.Utf8,
+            "rule": pl.Utf8,
+            "region": pl.Utf8,
+            "other_rule": pl.Utf8,
+            "risk": pl.Utf8,
+            "low": pl.Float64,
+            "high": pl.Float64,
+            "rows": pl.Int64,
+            "prevalence": pl.Float64,
+        }
+        pl.from_dicts(records, schema=schema).write_parquet(path)
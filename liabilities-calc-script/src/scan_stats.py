@@ -0,0 +1,97 @@
+"""Per-rule, per-region scan statistics (--stats-output).
+
+For every (rule, region) pair the collector keeps the rows evaluated, the rows hit, the
+total number of matches and the cumulative evaluation time. Rules that fall back to the
+regex engine are timed row by row, so the slowest rows (with their lengths) can be
+listed; rules evaluated column-wise (motif kernel, cysteine checks) only have a
+column-level time and no per-row breakdown.
+
+Collectors are plain picklable objects: worker processes fill their own (see spawn())
+and the parent merges them.
+"""
+
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class RuleRegionStats:
+    engine: str
+    rows_evaluated: int = 0
+    hits: int = 0
+    total_matches: int = 0
+    seconds: float = 0.0
+    slowest_rows: list[tuple[float, int, int]] = field(default_factory=list)  # (seconds, row, length)
+
+
+class ScanStats:
+    def __init__(self, slowest_n: int = 5, row_offset: int = 0):
+        self.slowest_n = slowest_n
+        # Added to frame-local row indices, so batches and shards report input row numbers.
+        self.row_offset = row_offset
+        self.entries: dict[tuple[str, str], RuleRegionStats] = {}
+
+    def spawn(self) -> "ScanStats":
+        """An empty collector with the same settings, for a worker to fill."""
+        return ScanStats(self.slowest_n, self.row_offset)
+
+    def record(
+        self,
+        rule: str,
+        region: str,
+        engine: str,
+        evaluated: np.ndarray,
+        match_counts: np.ndarray,
+        seconds: float,
+        lengths: np.ndarray,
+        row_seconds: np.ndarray | None = None,
+    ) -> None:
+        """Add one evaluation of `rule` over a column; arrays are per row, `evaluated` a boolean mask."""
+        entry = self.entries.setdefault((rule, region), RuleRegionStats(engine=engine))
+        entry.rows_evaluated += int(evaluated.sum())
+        entry.hits += int(((match_counts > 0) & evaluated).sum())
+        entry.total_matches += int(match_counts[evaluated].sum())
+        entry.seconds += seconds
+        if row_seconds is not None and len(row_seconds) and self.slowest_n:
+            top = np.argsort(row_seconds, kind="stable")[::-1][: self.slowest_n]
+            candidates = [(float(row_seconds[i]), int(i) + self.row_offset, int(lengths[i])) for i in top]
+            self._keep_slowest(entry, candidates)
+
+    def _keep_slowest(self, entry: RuleRegionStats, candidates: list[tuple[float, int, int]]) -> None:
+        merged = sorted(entry.slowest_rows + candidates, key=lambda t: (-t[0], t[1]))
+        entry.slowest_rows = merged[: self.slowest_n]
+
+    def merge(self, other: "ScanStats") -> None:
+        for key, theirs in other.entries.items():
+            entry = self.entries.setdefault(key, RuleRegionStats(engine=theirs.engine))
+            entry.rows_evaluated += theirs.rows_evaluated
+            entry.hits += theirs.hits
+            entry.total_matches += theirs.total_matches
+            entry.seconds += theirs.seconds
+            self._keep_slowest(entry, theirs.slowest_rows)
+
+    def to_dict(self) -> dict:
+        rules = [
+            {
+                "rule": rule,
+                "region": region,
+                "engine": entry.engine,
+                "rows_evaluated": entry.rows_evaluated,
+                "hits": entry.hits,
+                "total_matches": entry.total_matches,
+                "seconds": round(entry.seconds, 6),
+                "slowest_rows": [
+                    {"row": row, "length": length, "seconds": round(seconds, 6)}
+                    for seconds, row, length in entry.slowest_rows
+                ],
+            }
+            for (rule, region), entry in self.entries.items()
+        ]
+        rules.sort(key=lambda r: (-r["seconds"], r["rule"], r["region"]))
+        return {"rules": rules}
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,58 @@
+"""--top-k K: keep the K best lead candidates of a run while it scans.
+
+Candidates rank by Is Productive (Pass first), then Developability risk (None, Low,
+Medium, High, Very High, Non-Developable), then Developability cost (lowest first);
+ties go to the smaller clonotypeKey, then to the earlier input row. Each scanned frame
+is merged into the current best K with a partial sort (bottom_k), so memory stays
+bounded by K plus one batch and the full output never has to be sorted.
+"""
+
+import polars as pl
+
+RANK_COLUMNS = ("Is Productive", "Developability risk", "Developability cost")
+RISK_ORDER = ("None", "Low", "Medium", "High", "Very High", "Non-Developable")
+_ROW = "__top_k_row"
+_SORT_KEYS = ("__top_k_productive", "__top_k_risk", "__top_k_cost", "__top_k_no_key", "__top_k_key", _ROW)
+
+
+def _sort_key_exprs(has_key: bool) -> list[pl.Expr]:
+    risk = pl.col("Developability risk").cast(pl.Utf8)
+    key = pl.col("clonotypeKey").cast(pl.Utf8) if has_key else pl.lit(None, dtype=pl.Utf8)
+    return [
+        (pl.col("Is Productive") != "Pass").fill_null(True).alias(_SORT_KEYS[0]),
+        risk.replace_strict(RISK_ORDER, list(range(len(RISK_ORDER))), default=len(RISK_ORDER)).alias(_SORT_KEYS[1]),
+        pl.col("Developability cost").cast(pl.Float64).fill_null(float("inf")).alias(_SORT_KEYS[2]),
+        key.is_null().alias(_SORT_KEYS[3]),
+        key.fill_null("").alias(_SORT_KEYS[4]),
+    ]
+
+
+class TopK:
+    """The K best rows seen so far; add() frames in input order, then ranked()."""
+
+    def __init__(self, k: int, first_row: int = 0):
+        self.k = k
+        self.next_row = first_row
+        self._best: pl.DataFrame | None = None
+
+    def add(self, df_out: pl.DataFrame) -> None:
+        missing = [c for c in RANK_COLUMNS if c not in df_out.columns]
+        if missing:
+            if df_out.height:
+                raise ValueError(f"--top-k needs the {', '.join(missing)} output column(s)")
+            return
+        frame = df_out.with_columns(
+            *_sort_key_exprs("clonotypeKey" in df_out.columns),
+            pl.int_range(self.next_row, self.next_row + df_out.height, dtype=pl.Int64).alias(_ROW),
+        )
+        self.next_row += df_out.height
+        if self._best is not None:
+            frame = pl.concat([self._best, frame], how="diagonal_relaxed")
+        self._best = frame.bottom_k(self.k, by=list(_SORT_KEYS))
+
+    def ranked(self) -> pl.DataFrame:
+        """The best rows, best first, with a leading 1-based Rank column."""
+        if self._best is None:
+            return pl.DataFrame({"Rank": []}, schema={"Rank": pl.UInt32})
+        best = self._best.sort(list(_SORT_KEYS)).drop(_SORT_KEYS)
+        return best.with_row_index("Rank", offset=1)
@@ -0,0 +1,84 @@
+"""Vectorised translation of nucleotide columns (e.g. "Heavy sequence nt") to amino acids.
+
+A column is packed into one uint8 buffer (see motif_kernel.PackedColumn) and every codon
+of every row is translated at once: its three base indices form an index into a 5×5×5
+table of the standard genetic code (the fifth "base" is anything other than A, C, G,
+T/U, and gives 'X'). The translated rows are joined into one buffer and
+split back into a column by Polars, so there is no per-codon or per-row Python.
+
+Each sequence is read from its first base in one frame, as a single unit. Stop codons
+become '*', and a trailing partial codon (length not a multiple of three, i.e. a frame
+shift somewhere in the sequence) becomes '_', MiXCR's out-of-frame mark. The
+disqualifying checks ("Contains stop codon", "Out of frame") then see the real reading
+frame, without the boundary artifacts of region-by-region amino-acid exports.
+"""
+
+import numpy as np
+import polars as pl
+
+from motif_kernel import PackedColumn
+
+NT_SUFFIX = " nt"
+AA_SUFFIX = " aa"
+_OUT_OF_FRAME = ord("_")
+_SEPARATOR = ord("\n")
+
+_BASE_INDEX = np.full(256, 4, dtype=np.uint8)  # Codon index 25*b1 + 5*b2 + b3 < 125 fits uint8
+for _i, _base in enumerate(b"ACGT"):
+    _BASE_INDEX[_base] = _i
+_BASE_INDEX[ord("U")] = 3
+
+# Standard genetic code, codons in TCAG order (TTT, TTC, TTA, TTG, TCT, ...)
+_STANDARD_CODE = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+_CODON_TABLE = np.full(125, ord("X"), dtype=np.uint8)
+for _n, _aa in enumerate(_STANDARD_CODE):
+    _b1, _b2, _b3 = ("TCAG"[_n // 16], "TCAG"[_n // 4 % 4], "TCAG"[_n % 4])
+    _CODON_TABLE[25 * _BASE_INDEX[ord(_b1)] + 5 * _BASE_INDEX[ord(_b2)] + _BASE_INDEX[ord(_b3)]] = ord(_aa)
+
+
+def translate(series: pl.Series) -> pl.Series:
+    """Amino-acid translation of a nucleotide column (case-insensitive; nulls stay null)."""
+    if not len(series):
+        return pl.Series(series.name, [], dtype=pl.Utf8)
+    packed = PackedColumn.from_series(series)
+    n_codons = packed.lengths // 3
+    partial = packed.lengths % 3 != 0
+    out_lengths = n_codons + partial
+
+    # Codon k (numbered across all rows) of row r, its j-th, starts at buf[starts[r] + 3j] and
+    # lands at out[out_starts[r] + j], with j = k - first[r]
+    first = np.cumsum(n_codons) - n_codons
+    k = np.arange(int(n_codons.sum()), dtype=np.int64)
+    at = np.repeat(packed.starts - 3 * first, n_codons) + 3 * k
+    # Code of the triplet starting at every buffer position (contiguous arithmetic), then
+    # one gather at the codon starts; triplets over separators are never gathered.
+    bases = _BASE_INDEX[packed.buf]
+    triplets = bases[:-2] * np.uint8(25)
+    triplets += bases[1:-1] * np.uint8(5)
+    triplets += bases[2:]
+    codons = triplets[at]
+
+    out_starts = np.cumsum(out_lengths + 1) - (out_lengths + 1)
+    out = np.full(int(out_lengths.sum()) + len(packed), _SEPARATOR, dtype=np.uint8)
+    out[np.repeat(out_starts - first, n_codons) + k] = _CODON_TABLE[codons]
+    out[(out_starts + n_codons)[partial]] = _OUT_OF_FRAME
+    rows = pl.Series([out[:-1].tobytes().decode("ascii")]).str.split("\n").explode()
+    return pl.select(pl.when(series.is_not_null()).then(rows).alias(series.name)).to_series()
+
+
+def translate_nt_columns(df: pl.DataFrame) -> tuple[pl.DataFrame, list[str]]:
+    """Add "<name> aa" for every "<name> nt" column that has no amino-acid counterpart yet.
+
+    Returns the frame and the added column names.
+    """
+    present = {c.lower() for c in df.columns}
+    added = []
+    for column in df.columns:
+        if not column.lower().endswith(NT_SUFFIX):
+            continue
+        aa_column = column[: -len(NT_SUFFIX)] + AA_SUFFIX
+        if aa_column.lower() in present:
+            continue
+        added.append(translate(df[column].cast(pl.Utf8)).alias(aa_column))
+        present.add(aa_column.lower())
+    return (df.with_columns(added) if added else df), [s.name for s in added]
@@ -0,0 +1,152 @@
+"""Reading and writing (optionally compressed) TSV files.
+
+Compressed inputs are detected from their magic bytes, not their names, so a gzip or
+zstd file is read the same way as plain text whatever it is called. Outputs are
+compressed when asked explicitly or when the output name ends in .gz / .zst:
+
+- gzip: the text is cut into blocks that are compressed concurrently by a thread pool
+  (zlib releases the GIL) and written as consecutive gzip members, which every gzip
+  reader decodes as one stream;
+- zstd: zstandard's own multi-threaded compressor.
+"""
+
+import gzip
+import io
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+import polars as pl
+import zstandard
+
+COMPRESSIONS = ("gzip", "zstd")
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+_GZIP_LEVEL = 6
+_ZSTD_LEVEL = 3
+_BLOCK_SIZE = 4 * 1024 * 1024
+_WRITE_CHUNK_ROWS = 100_000
+
+
+def detect_compression(path: str) -> str | None:
+    """'gzip', 'zstd' or None (plain text), from the file's first bytes."""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(_ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def compression_for(path: str, requested: str | None) -> str | None:
+    """The compression to write `path` with: the requested one, else implied by its suffix."""
+    if requested and requested != "none":
+        return requested
+    if requested == "none":
+        return None
+    return _SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def open_input(path: str) -> BinaryIO:
+    """Open a TSV for binary line reading, decompressing transparently."""
+    compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    return open(path, "rb")
+
+
+class _ParallelGzipWriter(io.RawIOBase):
+    """Write-only stream that gzips fixed-size blocks on a thread pool, preserving order."""
+
+    def __init__(self, raw: BinaryIO, threads: int):
+        self._raw = raw
+        self._buffer = bytearray()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads))
+        self._pending = []
+        self._max_pending = 2 * max(1, threads)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= _BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:_BLOCK_SIZE]))
+            del self._buffer[:_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(self._executor.submit(gzip.compress, block, _GZIP_LEVEL, mtime=0))
+        while len(self._pending) > self._max_pending:
+            self._raw.write(self._pending.pop(0).result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._pending:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            for future in self._pending:
+                self._raw.write(future.result())
+            self._pending.clear()
+        finally:
+            self._executor.shutdown()
+            self._raw.close()
+            super().close()
+
+
+def open_output(path: str, compression: str | None = None, threads: int = 1) -> BinaryIO:
+    """Open `path` for binary writing, compressing with `compression` on `threads` threads."""
+    raw = open(path, "wb")
+    if compression is None:
+        return raw
+    if compression == "gzip":
+        return _ParallelGzipWriter(raw, threads)
+    if compression == "zstd":
+        compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL, threads=threads if threads > 1 else 0)
+        return compressor.stream_writer(raw, closefd=True)
+    raw.close()
+    raise ValueError(f"unknown compression {compression!r}; expected one of {COMPRESSIONS}")
+
+
+def write_tsv(df: pl.DataFrame, path: str, compression: str | None = None, threads: int = 1, **write_kwargs) -> None:
+    """df.write_csv(path, separator="\\t", **write_kwargs), optionally compressed.
+
+    Compressed output is serialised in row chunks so the uncompressed text of the whole
+    table is never held in memory at once.
+    """
+    if compression is None:
+        df.write_csv(path, separator="\t", **write_kwargs)
+        return
+    with open_output(path, compression, threads) as out:
+        for i, chunk in enumerate(df.iter_slices(_WRITE_CHUNK_ROWS) if len(df) else [df]):
+            buf = io.BytesIO()
+            chunk.write_csv(buf, separator="\t", include_header=(i == 0), **write_kwargs)
+            out.write(buf.getvalue())
+
+
+def concat_tsvs(paths: list[str], output_path: str, compression: str | None = None, threads: int = 1) -> None:
+    """Concatenate TSV files with one shared header, in order, byte for byte (inputs may be compressed).
+
+    Raises ValueError if the headers differ: the files are not parts of one table.
+    """
+    headers = []
+    for path in paths:
+        with open_input(path) as f:
+            headers.append(f.readline())
+    for path, header in zip(paths[1:], headers[1:]):
+        if header != headers[0]:
+            raise ValueError(f"the header of '{path}' differs from that of '{paths[0]}'")
+    with open_output(output_path, compression, threads) as out:
+        for i, path in enumerate(paths):
+            with open_input(path) as f:
+                if i > 0:
+                    f.readline()
+                shutil.copyfileobj(f, out)
@@ -0,0 +1,106 @@
+"""In-process API: scan_clonotypes / scan_peptides must return what the CLIs write, and a
+shared RuleSet must give the same results when calls run concurrently."""
+
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+import main as m
+import peptide_main as pm
+from api import RuleSet, scan_clonotypes, scan_peptides
+
+DATA_DIR = Path(__file__).parent / "data"
+LABEL_MAP = {"1": "CDR1", "2": "CDR2", "3": "CDR3"}
+CUSTOM = [
+    {"name": "WW motif", "pattern": "WW", "riskLevel": "Medium", "fixability": "fixable", "regions": ["CDR3", "FR1"]},
+    {"name": "Lookahead NxS", "pattern": "N(?=.S)", "riskLevel": "Low", "fixability": "fixable", "regions": ["CDR3"]},
+]
+PEPTIDES = pl.DataFrame(
+    {
+        "variantKey": [f"v{i}" for i in range(6)],
+        "sequence aa": ["ACDNGSW", "MWWNPSK", "", "DPTSNAS", "GGGG", "NGNGWMDG"],
+    }
+)
+
+
+def _run_cli(entry_main, argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["prog"] + argv
+    try:
+        entry_main()
+    finally:
+        sys.argv = original
+
+
+@pytest.fixture(scope="module")
+def rules() -> RuleSet:
+    return RuleSet.build(custom=CUSTOM)
+
+
+@pytest.mark.parametrize("data_name", ["sequences.tsv", "sequences_annotated.tsv", "sequences_sc_annotated.tsv"])
+@pytest.mark.parametrize("numbering_schema", [None, "kabat"])
+def test_scan_clonotypes_matches_cli(tmp_path, rules, data_name, numbering_schema):
+    custom_path = tmp_path / "custom.json"
+    custom_path.write_text(json.dumps(CUSTOM))
+    out, map_path = tmp_path / "out.tsv", tmp_path / "map.json"
+    argv = [str(DATA_DIR / data_name), str(out), "-m", json.dumps(LABEL_MAP), "-o", str(map_path)]
+    argv += ["--custom-liabilities", str(custom_path)]
+    argv += ["--numbering-schema", numbering_schema] if numbering_schema else []
+    _run_cli(m.main, argv)
+
+    df = pl.read_csv(DATA_DIR / data_name, separator="\t", infer_schema_length=1000)
+    got = scan_clonotypes(df, rules, numbering_schema, LABEL_MAP)
+    assert got.equals(pl.read_csv(out, separator="\t", infer_schema_length=1000))
+    assert rules.label_map(LABEL_MAP) == json.loads(map_path.read_text())
+
+
+def test_scan_peptides_matches_cli(tmp_path, rules):
+    PEPTIDES.write_csv(tmp_path / "in.tsv", separator="\t")
+    (tmp_path / "custom.json").write_text(json.dumps(CUSTOM))
+    argv = ["--input_tsv", str(tmp_path / "in.tsv"), "--output_tsv", str(tmp_path / "out.tsv")]
+    argv += ["--use_predefined_liabilities", "--custom_liabilities", str(tmp_path / "custom.json")]
+    _run_cli(pm.main, argv)
+
+    expected = pl.read_csv(tmp_path / "out.tsv", separator="\t")
+    assert scan_peptides(PEPTIDES, rules).equals(expected, null_equal=True)
+    with pytest.raises(ValueError, match="variantKey"):
+        scan_peptides(PEPTIDES.drop("variantKey"), rules)
+
+
+def test_shared_rule_set_is_thread_safe(rules, capsys):
+    frames = [
+        pl.read_csv(DATA_DIR / name, separator="\t", infer_schema_length=1000)
+        for name in ("sequences.tsv", "sequences_annotated.tsv", "sequences_sc_annotated.tsv")
+    ]
+    jobs = [(frame, schema) for frame in frames for schema in (None, "imgt")] * 3
+
+    def scan(job):
+        frame, schema = job
+        return scan_clonotypes(frame, rules, schema, LABEL_MAP, parallel_chains=False), scan_peptides(PEPTIDES, rules)
+
+    sequential = [scan(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        concurrent = list(executor.map(scan, jobs))
+    for (clonotypes, peptides), (expected_clonotypes, expected_peptides) in zip(concurrent, sequential):
+        assert clonotypes.equals(expected_clonotypes)
+        assert peptides.equals(expected_peptides)
+    assert capsys.readouterr().out == ""
+
+
+def test_invalid_custom_pattern_raises():
+    with pytest.raises(re.error, match="unterminated character set"):
+        RuleSet.build(custom=[{**CUSTOM[0], "pattern": "N[GS"}])
+
+
+def test_custom_rules_without_regions_are_peptide_only():
+    rules = RuleSet.build(
+        custom=[*CUSTOM, {"name": "PP motif", "pattern": "PP", "riskLevel": "Low", "fixability": "fixable"}]
+    )
+    assert "PP motif" in rules.peptide_rules
+    assert "PP motif" not in rules.clonotype_config.liability_names()
+    assert "PP motif" not in rules.label_map(LABEL_MAP).values()
@@ -0,0 +1,103 @@
+"""Chain-level scanning: matches found once on the full chain and attributed to regions by
+coordinate must be exactly re.finditer on each region's fragment."""
+
+import random
+import re
+import sys
+
+import numpy as np
+import polars as pl
+import pytest
+
+import main as m
+from chain_scan import ChainScan
+from definitions import ORIG_REGEX_LIABILITIES
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVW"
+PATTERNS = [regex for regex, _risk, _fixability in ORIG_REGEX_LIABILITIES.values()] + ["W(?!$)", "NN", "[ST]", "GGG"]
+
+
+def _chains(rng: random.Random, n: int, overlapping: bool):
+    seqs, spans = [], {name: (np.full(n, -1), np.full(n, -1)) for name in ("FR1", "CDR1", "CDR2", "CDR3")}
+    for i in range(n):
+        seq = "".join(rng.choices(AMINO_ACIDS + "nw", k=rng.randint(0, 60))) if rng.random() > 0.05 else None
+        seqs.append(seq)
+        if not seq:
+            continue
+        cut = sorted(rng.sample(range(len(seq) + 1), min(len(seq) + 1, 6)))
+        for name, (start, end) in zip(spans, zip(cut, cut[1:])):
+            if rng.random() < 0.85:
+                if overlapping and rng.random() < 0.3:
+                    start = max(0, start - rng.randint(1, 3))
+                spans[name][0][i], spans[name][1][i] = start, end
+    return seqs, spans
+
+
+@pytest.mark.parametrize("overlapping", [False, True])
+def test_region_matches_equal_fragment_scans(overlapping):
+    seqs, spans = _chains(random.Random(11 + overlapping), 600, overlapping)
+    chain = ChainScan(seqs, spans)
+    assert chain._disjoint is not overlapping
+    for pattern in PATTERNS:
+        compiled = re.compile(pattern)
+        for region, (starts, ends) in spans.items():
+            expected = [
+                (i, match.start())
+                for i, (seq, start, end) in enumerate(zip(seqs, starts, ends))
+                if seq is not None and start >= 0
+                for match in compiled.finditer(seq[start:end].upper())
+            ]
+            rows, offsets = chain.region_matches(pattern, region)
+            assert list(zip(rows.tolist(), offsets.tolist())) == expected, (pattern, region)
+            counts = chain.region(region).match_counts(pattern)
+            assert counts.tolist() == np.bincount([r for r, _ in expected], minlength=len(seqs)).tolist()
+
+
+def test_unsupported_rules_fall_back_to_fragments():
+    spans = {"CDR3": (np.array([0]), np.array([4]))}
+    assert ChainScan(["CAWW"], spans).region_matches(r"(?<=A)W", "CDR3") is None
+    assert ChainScan(["CAWW"], spans).region_matches("W+", "CDR3") is None
+    assert ChainScan(["CAWW"], spans).region_matches("A(?!W)", "CDR3") is None
+    assert ChainScan(["CÄWW"], spans).region("CDR3").match_counts("W") is None
+
+
+def test_boundary_hits():
+    seqs = ["AAANGSSDPQ", "NGAAAAAAAA", "DPAAAAAAAA", None]
+    spans = {
+        "CDR1": (np.array([0, 0, 0, -1]), np.array([4, 1, 1, -1])),
+        "FR2": (np.array([4, 1, 1, -1]), np.array([8, 10, 10, -1])),
+        "CDR2": (np.array([8, -1, -1, -1]), np.array([10, -1, -1, -1])),
+    }
+    rules = {"Deamidation": "N[GS]", "Fragmentation": "DP", "Glycosylation": "N[^P][ST]", "Short": "W"}
+    hits = ChainScan(seqs, spans).boundary_hits(rules).to_list()
+    assert hits == [
+        "Deamidation (CDR1/FR2), Fragmentation (FR2/CDR2), Glycosylation (CDR1/FR2)",
+        "Deamidation (CDR1/FR2)",
+        "Fragmentation (CDR1/FR2)",
+        "Unknown",
+    ]
+    assert ChainScan(["AAAAW"], {"CDR3": (np.array([0]), np.array([5]))}).boundary_hits(rules).to_list() == ["None"]
+
+
+def test_boundary_motifs_column(tmp_path):
+    df = pl.DataFrame(
+        {
+            "clonotypeKey": ["k0", "k1"],
+            "Heavy sequence aa": ["QVQLNGDPVRQAPGKGLEWVAYCARDPW", "QVQLQESWVRQAPGKGLEWVAYCARGGW"],
+            # CDR1 4+3, FR2 7+11: "NG" lies inside CDR1, "DP" starts in CDR1 and ends in FR2
+            "Heavy annotations": ["1:4+3|4:7+B|2:I+4|3:M+6", "1:4+3|4:7+B|2:I+4|3:M+6"],
+        }
+    )
+    df.write_csv(tmp_path / "in.tsv", separator="\t")
+    original = sys.argv
+    label_map = '{"1": "CDR1", "2": "CDR2", "3": "CDR3", "4": "FR2"}'
+    sys.argv = ["main.py", str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv"), "-m", label_map, "--boundary-motifs"]
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+    out = pl.read_csv(tmp_path / "out.tsv", separator="\t")
+    column = "boundary-spanning motifs"  # A single chain's columns carry no chain prefix
+    assert out.columns.index(column) > out.columns.index("CDR3 aa liabilities")
+    assert out[column].to_list() == ["Fragmentation (DP) (CDR1/FR2)", "None"]
+    assert "Deamidation (N[GS])" in out["CDR1 aa liabilities"][0]
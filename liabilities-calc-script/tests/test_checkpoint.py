@@ -0,0 +1,108 @@
+"""--checkpoint-dir: a batched run interrupted part-way and re-run with the same arguments must
+finish with the output an uninterrupted run writes, scanning only the unfinished batches."""
+
+import json
+import os
+import random
+import sys
+
+import numpy as np
+import polars as pl
+import pytest
+
+import batching
+import main as m
+import match_matrix as mm
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+N_ROWS = 400
+LABEL_MAP = '{"1": "CDR1", "2": "CDR2", "3": "CDR3"}'
+
+
+@pytest.fixture
+def input_tsv(tmp_path, monkeypatch):
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 50)
+    rng = random.Random(12)
+    seqs = ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(30, 60))) for _ in range(N_ROWS)]
+    # Some CDR3 segments run past the chain end, for the input warnings.
+    anns = [f"1:2+6|2:{rng.randint(10, 14):X}+5|3:{rng.randint(20, 40):X}+{rng.randint(5, 22):X}" for _ in seqs]
+    pl.DataFrame(
+        {"clonotypeKey": [f"k{i}" for i in range(N_ROWS)], "Heavy sequence aa": seqs, "Heavy annotations": anns}
+    ).write_csv(tmp_path / "in.tsv", separator="\t")
+    return str(tmp_path / "in.tsv")
+
+
+def _run(argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["main.py", "-m", LABEL_MAP, "--max-memory", "1"] + argv
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+
+
+def _outputs(tmp_path, name: str) -> list[str]:
+    return [str(tmp_path / f"{name}{suffix}") for suffix in (".tsv", ".json", ".npz")]
+
+
+def _argv(input_tsv: str, outputs: list[str]) -> list[str]:
+    tsv, diagnostics, matrix = outputs
+    return [input_tsv, tsv, "--diagnostics-output", diagnostics, "--match-matrix", matrix]
+
+
+def test_resume_after_interruption(tmp_path, input_tsv, monkeypatch, capsys):
+    reference = _outputs(tmp_path, "reference")
+    _run(_argv(input_tsv, reference))
+
+    checkpoint_dir = tmp_path / "checkpoint"
+    resumed = _outputs(tmp_path, "resumed")
+    argv = _argv(input_tsv, resumed) + ["--checkpoint-dir", str(checkpoint_dir)]
+    process_frame = m._process_frame
+    scanned, stop_at = [], ["k250"]
+
+    def interrupted(df, *args, **kwargs):
+        if df.height and df["clonotypeKey"][0] in stop_at:
+            raise RuntimeError("pre-empted")
+        if df.height <= batching.MIN_BATCH_ROWS:
+            scanned.append(df["clonotypeKey"][0])
+        return process_frame(df, *args, **kwargs)
+
+    monkeypatch.setattr(m, "_process_frame", interrupted)
+    with pytest.raises(RuntimeError, match="pre-empted"):
+        _run(argv)
+    manifest = json.loads((checkpoint_dir / "manifest.json").read_text())
+    assert [b["rows"] for b in manifest["batches"]] == [50] * 5
+    assert not os.path.exists(resumed[0])
+
+    # A different rule set must not reuse the finished batches.
+    with pytest.raises(SystemExit, match="belongs to a different run"):
+        _run(argv + ["--boundary-motifs"])
+
+    scanned.clear()
+    stop_at.clear()
+    capsys.readouterr()
+    _run(argv)
+    assert "Resuming from" in capsys.readouterr().out
+    assert scanned == [f"k{i}" for i in range(250, N_ROWS, 50)]
+    assert open(resumed[0], "rb").read() == open(reference[0], "rb").read()
+    diagnostics = json.loads(open(reference[1]).read())
+    assert diagnostics["total"] > 0 and json.loads(open(resumed[1]).read()) == diagnostics
+    reference_matrix, resumed_matrix = mm.MatchMatrix.load(reference[2]), mm.MatchMatrix.load(resumed[2])
+    assert resumed_matrix.n_rows == N_ROWS and resumed_matrix.rules == reference_matrix.rules
+    assert np.array_equal(resumed_matrix.score(mm.WeightProfile()), reference_matrix.score(mm.WeightProfile()))
+    assert not checkpoint_dir.exists()
+
+
+def test_checkpoint_needs_batches(tmp_path, input_tsv):
+    checkpoint = ["--checkpoint-dir", str(tmp_path / "checkpoint")]
+    original = sys.argv
+    for argv in (
+        ["main.py", input_tsv, str(tmp_path / "out.tsv")] + checkpoint,
+        ["main.py", input_tsv, str(tmp_path / "out.tsv"), "--max-memory", "1", "--top-k", "5"] + checkpoint,
+    ):
+        sys.argv = argv
+        try:
+            with pytest.raises(SystemExit):
+                m.main()
+        finally:
+            sys.argv = original
@@ -0,0 +1,110 @@
+"""Custom regex engine selection: the linear-time engine must agree with Python `re`, and
+backtracking patterns must stop at the time budget."""
+
+import random
+import re
+import threading
+import time
+
+import numpy as np
+import polars as pl
+import pytest
+
+from custom_regex import RegexBudget, RegexTimeout, compile_custom, linear_match_offsets
+
+LINEAR_PATTERNS = ["N[^P][ST]", "W{2,}", "(A+)+B", "C.{2,4}C", "^Q", "K$", r"\bM", "(?i)ng|DP"]
+
+
+@pytest.fixture(scope="module")
+def sequences() -> list[str]:
+    rng = random.Random(0)
+    alphabet = "ACDEFGHIKLMNPQRSTVWY"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))) for _ in range(2000)] + ["AAAB", "WWWW"]
+
+
+@pytest.mark.parametrize(
+    "pattern, construct",
+    [
+        ("N(?=.S)", "look-ahead"),
+        ("(?<=P)N", "look-behind"),
+        ("(?<!P)N", "negative look-behind"),
+        ("W(?!$)", "negative look-ahead"),
+        (r"(N)\1", "backreference"),
+        ("(?>A+)B", "atomic group"),
+        ("A++B", "possessive quantifier"),
+        ("(N)?(?(1)G|S)", "conditional group"),
+    ],
+)
+def test_backtracking_constructs_are_reported(pattern, construct):
+    custom = compile_custom(pattern)
+    assert not custom.linear
+    assert construct in custom.unsupported
+
+
+@pytest.mark.parametrize("pattern", LINEAR_PATTERNS)
+def test_linear_engine_matches_re_finditer(sequences, pattern):
+    custom = compile_custom(pattern)
+    assert custom.linear
+    series = pl.Series(sequences, dtype=pl.Utf8)
+    counts = series.str.count_matches(pattern).to_numpy()
+    offsets = linear_match_offsets(series, custom, counts)
+    assert offsets == [[m.start() for m in re.finditer(pattern, s)] for s in sequences]
+
+
+def test_invalid_pattern_raises():
+    with pytest.raises(re.error):
+        compile_custom("N[GS")
+
+
+def test_budget_interrupts_runaway_match():
+    budget = RegexBudget(seconds=0.2)
+    started = time.perf_counter()
+    with pytest.raises(RegexTimeout, match="exhausted the 0.2 s budget"):
+        budget.scan("Runaway", "CDR3", re.compile("(A+)+(?=B)"), ["AB", "A" * 40])
+    assert time.perf_counter() - started < 5
+
+
+def test_budget_interrupts_runaway_match_off_the_main_thread(capsys):
+    results = {}
+
+    def scan(on_timeout):
+        budget = RegexBudget(seconds=0.2, on_timeout=on_timeout)
+        started = time.perf_counter()
+        try:
+            results[on_timeout] = budget.scan("Runaway", "CDR3", re.compile("(A+)+(?=B)"), ["AAB", "A" * 40, "AB"])
+        except RegexTimeout as e:
+            results[on_timeout] = e
+        results[on_timeout, "seconds"] = time.perf_counter() - started
+
+    for on_timeout in ("fail", "skip"):
+        thread = threading.Thread(target=scan, args=(on_timeout,))
+        thread.start()
+        thread.join()
+    assert isinstance(results["fail"], RegexTimeout)
+    spans, _row_seconds = results["skip"]
+    assert spans == [[(0, 2)], [], []]
+    # A fresh worker process starts after each kill; the runaway row itself never outlives the budget.
+    assert results["fail", "seconds"] < 5 and results["skip", "seconds"] < 5
+
+
+def test_budget_skip_keeps_earlier_rows(capsys):
+    budget = RegexBudget(seconds=0.2, on_timeout="skip")
+    spans, row_seconds = budget.scan("Runaway", "CDR3", re.compile("(A+)+(?=B)"), ["AAB", "A" * 40, "AB"])
+    assert spans == [[(0, 2)], [], []]
+    assert "Runaway" in budget.skipped
+    assert "skipped for the rest of the job" in capsys.readouterr().err
+    # Exhausted: later scans of any backtracking rule are skipped at once.
+    spans, _ = budget.scan("Other", "CDR2", re.compile("(?=A)"), ["A"])
+    assert spans == [[]] and "Other" in budget.skipped
+
+
+def test_spawned_budget_is_absorbed_once():
+    budget = RegexBudget(seconds=10)
+    budget.spent = 1.0
+    child = budget.spawn()
+    child.scan("Rule", "CDR3", re.compile("(?=A)A"), ["A" * 1000] * 200)
+    budget.absorb(child)
+    assert budget.spent == pytest.approx(child.spent)
+    budget.absorb(budget)
+    assert budget.spent == pytest.approx(child.spent)
+    assert np.isfinite(budget.remaining)
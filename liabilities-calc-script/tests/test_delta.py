@@ -0,0 +1,91 @@
+"""--previous-output: rows already in a previous output are copied from it, the rest scanned, and
+the result is exactly the output a full scan writes; a changed rule set forces a full scan."""
+
+import os
+import random
+import sys
+
+import polars as pl
+import pytest
+
+import main as m
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+N_ROWS = 300
+LABEL_MAP = '{"1": "CDR1", "2": "CDR2", "3": "CDR3"}'
+
+
+@pytest.fixture
+def repertoire(tmp_path) -> tuple[str, str]:
+    """(full input, earlier input): the earlier one is a shuffled two-thirds of the rows."""
+    rng = random.Random(14)
+    seqs = ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(30, 60))) for _ in range(N_ROWS)]
+    anns = [f"1:2+6|2:{rng.randint(10, 14):X}+5|3:{rng.randint(20, 40):X}+{rng.randint(5, 22):X}" for _ in seqs]
+    df = pl.DataFrame(
+        {"clonotypeKey": [f"k{i}" for i in range(N_ROWS)], "Heavy sequence aa": seqs, "Heavy annotations": anns}
+    )
+    df = df.with_columns(
+        pl.when(pl.int_range(N_ROWS) % 17 == 0)
+        .then(None)
+        .otherwise(pl.col("Heavy sequence aa"))
+        .alias("Heavy sequence aa")
+    )
+    df.write_csv(tmp_path / "full.tsv", separator="\t")
+    df.sample(fraction=2 / 3, seed=3, shuffle=True).write_csv(tmp_path / "earlier.tsv", separator="\t")
+    return str(tmp_path / "full.tsv"), str(tmp_path / "earlier.tsv")
+
+
+def _run(argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["main.py", "-m", LABEL_MAP] + argv
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+
+
+def test_delta_equals_full_scan(tmp_path, repertoire, capsys):
+    full, earlier = repertoire
+    _run([earlier, str(tmp_path / "earlier.out.tsv"), "--output-metadata", str(tmp_path / "earlier.meta.json")])
+    _run([full, str(tmp_path / "full.out.tsv")])
+    capsys.readouterr()
+    previous = ["--previous-output", str(tmp_path / "earlier.out.tsv")]
+    _run([full, str(tmp_path / "delta.out.tsv"), "--previous-metadata", str(tmp_path / "earlier.meta.json")] + previous)
+    assert f"{N_ROWS // 3} of {N_ROWS} rows scanned" in capsys.readouterr().out
+    assert (tmp_path / "delta.out.tsv").read_bytes() == (tmp_path / "full.out.tsv").read_bytes()
+
+    # The delta output is itself a valid previous output.
+    _run([full, str(tmp_path / "again.out.tsv"), "--previous-output", str(tmp_path / "delta.out.tsv")])
+    assert f"0 of {N_ROWS} rows scanned" in capsys.readouterr().out
+    assert (tmp_path / "again.out.tsv").read_bytes() == (tmp_path / "full.out.tsv").read_bytes()
+
+
+def test_plain_run_writes_no_metadata(tmp_path, repertoire):
+    _full, earlier = repertoire
+    _run([earlier, str(tmp_path / "earlier.out.tsv")])
+    assert sorted(os.listdir(tmp_path)) == ["earlier.out.tsv", "earlier.tsv", "full.tsv"]
+
+
+def test_rule_change_forces_full_scan(tmp_path, repertoire, capsys):
+    full, earlier = repertoire
+    _run([earlier, str(tmp_path / "earlier.out.tsv"), "--output-metadata", str(tmp_path / "earlier.out.tsv.meta.json")])
+    _run([full, str(tmp_path / "full.out.tsv"), "--boundary-motifs"])
+    capsys.readouterr()
+    previous = ["--previous-output", str(tmp_path / "earlier.out.tsv")]
+    _run([full, str(tmp_path / "delta.out.tsv"), "--boundary-motifs"] + previous)
+    assert "the rule set or label map changed" in capsys.readouterr().out
+    assert (tmp_path / "delta.out.tsv").read_bytes() == (tmp_path / "full.out.tsv").read_bytes()
+
+    os.remove(tmp_path / "earlier.out.tsv.meta.json")
+    _run([full, str(tmp_path / "delta.out.tsv"), "--boundary-motifs"] + previous)
+    assert "scanning every row" in capsys.readouterr().out
+    assert (tmp_path / "delta.out.tsv").read_bytes() == (tmp_path / "full.out.tsv").read_bytes()
+
+
+def test_previous_output_needs_a_single_full_scan(tmp_path, repertoire):
+    full, _earlier = repertoire
+    with pytest.raises(SystemExit):
+        _run([full, str(tmp_path / "out.tsv"), "--previous-metadata", full])
+    for extra in (["--max-memory", "1"], ["--top-k", "3"], ["--match-matrix", str(tmp_path / "m.npz")]):
+        with pytest.raises(SystemExit):
+            _run([full, str(tmp_path / "out.tsv"), "--previous-output", full] + extra)
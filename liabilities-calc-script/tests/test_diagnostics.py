@@ -0,0 +1,84 @@
+"""--diagnostics-output / --verbose-warnings: per-row input warnings are counted per category,
+reported once at the end, and counted the same however the input is processed."""
+
+import json
+import sys
+
+import polars as pl
+
+import batching
+import main as m
+from diagnostics import SEGMENT_OUT_OF_BOUNDS, UNDECODABLE_PART, Diagnostics
+
+N_ROWS = 200
+LABEL_MAP = '{"1": "CDR1", "2": "CDR2", "3": "CDR3"}'
+
+
+def _messy_input(tmp_path) -> str:
+    # Every row has an undecodable part ("1:!!+3"); every third row a CDR3 past the chain end.
+    anns = [f"1:2+4|2:8+3|3:{'Z' if i % 3 == 0 else 'C'}+5|1:!!+3" for i in range(N_ROWS)]
+    df = pl.DataFrame(
+        {
+            "clonotypeKey": [f"k{i}" for i in range(N_ROWS)],
+            "Heavy sequence aa": ["QVQLNGSWVRQAPGKGLEWVAYCARDPW"] * N_ROWS,
+            "Heavy annotations": anns,
+        }
+    )
+    path = tmp_path / "in.tsv"
+    df.write_csv(path, separator="\t")
+    return str(path)
+
+
+def _run(argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["main.py", "-m", LABEL_MAP] + argv
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+
+
+def test_warnings_are_summarised_once(tmp_path, capsys, monkeypatch):
+    input_tsv = _messy_input(tmp_path)
+    report = tmp_path / "diagnostics.json"
+    _run([input_tsv, str(tmp_path / "out.tsv"), "--diagnostics-output", str(report), "--diagnostics-examples", "2"])
+    err = capsys.readouterr().err
+    assert "Warning: Segment" not in err and "Warning: Could not decode" not in err
+    assert f"{UNDECODABLE_PART}: {N_ROWS}" in err and f"{SEGMENT_OUT_OF_BOUNDS}: {N_ROWS // 3 + 1}" in err
+
+    document = json.loads(report.read_text())
+    counts = {c["category"]: c["count"] for c in document["categories"]}
+    assert counts == {UNDECODABLE_PART: N_ROWS, SEGMENT_OUT_OF_BOUNDS: N_ROWS // 3 + 1}
+    assert document["total"] == sum(counts.values())
+    assert all(len(c["examples"]) == 2 for c in document["categories"])
+    assert document["categories"][1]["examples"][0] == "Segment CDR3 (35+5) out of bounds for seq length 28."
+
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 30)
+    batched = tmp_path / "batched.json"
+    _run([input_tsv, str(tmp_path / "out.tsv"), "--diagnostics-output", str(batched), "--max-memory", "1"])
+    assert [c["count"] for c in json.loads(batched.read_text())["categories"]] == list(counts.values())
+
+
+def test_verbose_warnings_print_every_occurrence(tmp_path, capsys):
+    _run([_messy_input(tmp_path), str(tmp_path / "out.tsv"), "--verbose-warnings"])
+    err = capsys.readouterr().err
+    assert err.count("Warning: Could not decode part '1:!!+3'") == N_ROWS
+    assert err.count("Warning: Segment CDR3") == N_ROWS // 3 + 1
+    assert "Warnings: " in err
+
+
+def test_merge_keeps_first_examples():
+    first, second = Diagnostics(max_examples=3), Diagnostics(max_examples=3)
+    for i in range(2):
+        first.warn("a", f"first {i}")
+    for i in range(4):
+        second.warn("a", f"second {i}")
+    second.warn("b", "only")
+    first.merge(second)
+    assert first.to_dict() == {
+        "total": 7,
+        "categories": [
+            {"category": "a", "count": 6, "examples": ["first 0", "first 1", "second 0"]},
+            {"category": "b", "count": 1, "examples": ["only"]},
+        ],
+    }
@@ -638,3 +638,422 @@ def test_structural_supersedes_hard_to_fix_in_developability_risk(tmp_path):
     # hard_to_fix alone → Very High; structural wins → Non-Developable.
     assert r["Developability risk"] == "Non-Developable"
     assert r["Structural liabilities"] == "Present"
+
+
+# ---------------------------------------------------------------------------
+# Paired single-cell data with annotations (Path A, one worker per chain)
+# ---------------------------------------------------------------------------
+
+
+DATA_SC_ANNOTATED = Path(__file__).parent / "data" / "sequences_sc_annotated.tsv"
+
+
+def test_sc_annotated_chains_scanned_independently(tmp_path):
+    label_map_file = tmp_path / "label_map.json"
+    label_map_file.write_text(json.dumps(LABEL_MAP))
+    df = run_main(tmp_path, ["-m", str(label_map_file)], data_path=DATA_SC_ANNOTATED)
+    heavy = row(df, "sca_heavy_met_cdr3")
+    assert heavy["CDR3 aa liabilities"] == "Heavy: Methionine Oxidation (M) | Light: None"
+    light = row(df, "sca_light_ngs_cdr2")
+    assert light["CDR2 aa liabilities"] == "Heavy: None | Light: Deamidation (N[GS])"
+
+
+def test_sc_annotated_concurrent_matches_sequential(tmp_path, monkeypatch):
+    """Running the chains in worker processes yields the same table and label map."""
+    label_map_file = tmp_path / "label_map.json"
+    label_map_file.write_text(json.dumps(LABEL_MAP))
+    outputs = {}
+    import batching
+
+    for cpus in (1, 2):
+        monkeypatch.setattr(batching, "available_cpus", lambda cpus=cpus: cpus)
+        run_dir = tmp_path / f"cpus{cpus}"
+        run_dir.mkdir()
+        out_map = run_dir / "out_map.json"
+        df = run_main(run_dir, ["-m", str(label_map_file), "-o", str(out_map)], data_path=DATA_SC_ANNOTATED)
+        outputs[cpus] = (df, json.loads(out_map.read_text()))
+    assert outputs[1][0].equals(outputs[2][0])
+    assert outputs[1][1] == outputs[2][1]
+
+
+# ---------------------------------------------------------------------------
+# --shard i/n and merge_shards.py
+# ---------------------------------------------------------------------------
+
+
+def _decode_annotations(df: pl.DataFrame, label_map: dict) -> list[set]:
+    ann_cols = [c for c in df.columns if c.endswith("annotations")]
+    decoded = []
+    for r in df.select(ann_cols).iter_rows():
+        decoded.append(
+            {
+                (col, label_map.get(part.split(":")[0]), part.split(":")[1])
+                for col, ann in zip(ann_cols, r)
+                if ann
+                for part in ann.split("|")
+            }
+        )
+    return decoded
+
+
+@pytest.mark.parametrize("n_shards", [2, 5])
+def test_sharded_run_merges_to_full_run(tmp_path, n_shards):
+    import merge_shards
+
+    label_map_file = tmp_path / "label_map.json"
+    label_map_file.write_text(json.dumps(LABEL_MAP))
+    common = ["-m", str(label_map_file)]
+
+    full_dir = tmp_path / "full"
+    full_dir.mkdir()
+    full = run_main(
+        full_dir,
+        common + ["-o", str(full_dir / "map.json"), "--output-regions-found", str(full_dir / "regions.json")],
+        data_path=DATA_SC_ANNOTATED,
+    )
+
+    shard_tsvs, shard_maps, shard_regions = [], [], []
+    for i in range(n_shards):
+        shard_dir = tmp_path / f"shard{i}"
+        shard_dir.mkdir()
+        run_main(
+            shard_dir,
+            common
+            + ["-o", str(shard_dir / "map.json"), "--output-regions-found", str(shard_dir / "regions.json")]
+            + ["--shard", f"{i}/{n_shards}"],
+            data_path=DATA_SC_ANNOTATED,
+        )
+        shard_tsvs.append(str(shard_dir / "out.tsv"))
+        shard_maps.append(str(shard_dir / "map.json"))
+        shard_regions.append(str(shard_dir / "regions.json"))
+
+    merged_tsv = tmp_path / "merged.tsv"
+    argv = ["merge_shards.py", str(merged_tsv), *shard_tsvs, *common]
+    argv += ["--shard-label-maps", *shard_maps, "-o", str(tmp_path / "merged_map.json")]
+    argv += ["--shard-regions-found", *shard_regions, "--output-regions-found", str(tmp_path / "merged_regions.json")]
+    original = sys.argv
+    sys.argv = argv
+    try:
+        merge_shards.main()
+    finally:
+        sys.argv = original
+
+    merged = pl.read_csv(merged_tsv, separator="\t")
+    ann_cols = [c for c in full.columns if c.endswith("annotations")]
+    assert merged.columns == full.columns
+    assert merged.drop(ann_cols).equals(full.drop(ann_cols))
+    full_map = json.loads((full_dir / "map.json").read_text())
+    merged_map = json.loads((tmp_path / "merged_map.json").read_text())
+    assert set(merged_map.values()) == set(full_map.values())
+    assert _decode_annotations(merged, merged_map) == _decode_annotations(full, full_map)
+    # Codes come from the rule set, so shards need no rewriting at all.
+    assert all(json.loads(Path(path).read_text()) == full_map for path in shard_maps)
+    assert merged_map == full_map
+    assert merged.equals(full)
+    assert json.loads((tmp_path / "merged_regions.json").read_text()) == json.loads(
+        (full_dir / "regions.json").read_text()
+    )
+
+
+def test_merge_rejects_shards_of_different_runs(tmp_path):
+    import merge_shards
+
+    (tmp_path / "a.tsv").write_text("clonotypeKey\tHeavy annotations\nk0\t8:1+2\n")
+    (tmp_path / "b.tsv").write_text("clonotypeKey\tHeavy annotations\tExtra\nk1\t8:1+2\tx\n")
+    (tmp_path / "a.json").write_text(json.dumps({**LABEL_MAP, "8": "Deamidation (N[GS])"}))
+    (tmp_path / "b.json").write_text(json.dumps({**LABEL_MAP, "8": "Isomerization (D[DGST])"}))
+    for shards, maps in [(["a.tsv", "a.tsv"], ["a.json", "b.json"]), (["a.tsv", "b.tsv"], ["a.json", "a.json"])]:
+        argv = ["merge_shards.py", str(tmp_path / "merged.tsv"), *(str(tmp_path / s) for s in shards)]
+        argv += ["--shard-label-maps", *(str(tmp_path / m) for m in maps)]
+        original = sys.argv
+        sys.argv = argv
+        try:
+            with pytest.raises(SystemExit, match="different runs"):
+                merge_shards.main()
+        finally:
+            sys.argv = original
+
+
+def test_liability_codes_follow_rule_set_order(tmp_path):
+    from definitions import ORIG_CYS_LIABILITIES, ORIG_EXTRA_PATTERNS, ORIG_REGEX_LIABILITIES
+
+    custom = tmp_path / "custom.json"
+    rule = {"name": "WW motif", "pattern": "WW", "riskLevel": "High", "fixability": "fixable", "regions": ["CDR3"]}
+    custom.write_text(json.dumps([rule]))
+    label_map = {**LABEL_MAP, "7": "FR1", "x": "Other"}
+    out_map = tmp_path / "map.json"
+    args = ["-m", json.dumps(label_map), "-o", str(out_map), "--custom-liabilities", str(custom)]
+    run_main(tmp_path, args, data_path=DATA_ANNOTATED)
+
+    entries = [(int(code), name) for code, name in json.loads(out_map.read_text()).items() if code not in label_map]
+    codes = {name: code for code, name in sorted(entries)}
+    expected_order = [*ORIG_REGEX_LIABILITIES, *ORIG_EXTRA_PATTERNS, "WW motif", *ORIG_CYS_LIABILITIES]
+    assert list(codes) == expected_order
+    assert list(codes.values()) == list(range(8, 8 + len(expected_order)))
+
+
+def test_shard_spec_is_validated(tmp_path):
+    with pytest.raises(SystemExit):
+        run_main(tmp_path, ["--shard", "2/2"])
+
+
+# ---------------------------------------------------------------------------
+# --max-memory: batched processing with spilled per-batch parts
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("data_path", [DATA, DATA_ANNOTATED, DATA_SC_ANNOTATED])
+def test_max_memory_batches_match_full_run(tmp_path, monkeypatch, data_path):
+    import batching
+
+    label_map_file = tmp_path / "label_map.json"
+    label_map_file.write_text(json.dumps(LABEL_MAP))
+    outputs = {}
+    for name, extra in [("full", []), ("batched", ["--max-memory", "1"])]:
+        run_dir = tmp_path / name
+        run_dir.mkdir()
+        args = ["-m", str(label_map_file), "-o", str(run_dir / "map.json")]
+        args += ["--output-regions-found", str(run_dir / "regions.json")]
+        # A 1-byte budget is below the interpreter baseline, so batches fall back to the minimum size.
+        monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 2)
+        df = run_main(run_dir, args + extra, data_path=data_path)
+        outputs[name] = (df, json.loads((run_dir / "map.json").read_text()), (run_dir / "regions.json").read_text())
+        assert not [p for p in run_dir.iterdir() if p.name.startswith(".liabilities-batches-")]
+
+    (full, full_map, full_regions), (batched, batched_map, batched_regions) = outputs["full"], outputs["batched"]
+    ann_cols = [c for c in full.columns if c.endswith("annotations")]
+    assert batched.columns == full.columns
+    assert batched.drop(ann_cols).equals(full.drop(ann_cols))
+    assert _decode_annotations(batched, batched_map) == _decode_annotations(full, full_map)
+    assert batched_regions == full_regions
+    assert batched_map == full_map
+    assert batched.equals(full)
+
+
+@pytest.mark.parametrize("batch_rows", [2, 3, 10])
+def test_batches_reject_quoted_line_breaks(tmp_path, batch_rows):
+    import batching
+
+    path = tmp_path / "in.tsv"
+    schema = pl.Schema({"clonotypeKey": pl.Utf8, "CDR3 aa": pl.Utf8})
+    path.write_text('clonotypeKey\tCDR3 aa\nk0\t"CARW"\nk1\tCAR"W\n')  # Quotes within a line are fine
+    assert [b.height for b in batching.iter_tsv_batches(str(path), 1, schema, True)] == [1, 1]
+    assert batching.count_data_rows(str(path)) == 2
+
+    path.write_text('clonotypeKey\tCDR3 aa\nk0\tCARW\nk1\tCARW\nk2\t"CA\nRW"\nk3\tCARW\n')
+    with pytest.raises(ValueError, match="quoted field spans several lines"):
+        list(batching.iter_tsv_batches(str(path), batch_rows, schema, True))
+
+
+def test_pipeline_keeps_order_and_bounds_batches_in_flight():
+    import random
+    import threading
+    import time
+
+    import batching
+
+    rng = random.Random(0)
+    lock = threading.Lock()
+    # Batches between being parsed and scanned, and outputs between being scanned and written
+    inputs, outputs, peaks, written = set(), set(), {"inputs": 0, "outputs": 0}, []
+
+    def track(alive: set, add: int | None = None, remove: int | None = None, name: str = "") -> None:
+        with lock:
+            if add is not None:
+                alive.add(add)
+                peaks[name] = max(peaks[name], len(alive))
+            alive.discard(remove)
+
+    def batches():
+        for i in range(40):
+            time.sleep(rng.random() / 500)
+            track(inputs, add=i, name="inputs")
+            yield i
+
+    def process(index, batch):
+        time.sleep(rng.random() / 500)
+        track(outputs, add=index, name="outputs")
+        track(inputs, remove=index)
+        return batch * 10
+
+    def write(index, output):
+        time.sleep(rng.random() / 500)
+        written.append((index, output))
+        track(outputs, remove=index)
+
+    assert batching.run_pipeline(batches(), process, write) == 40
+    assert written == [(i, i * 10) for i in range(40)]
+    assert peaks["inputs"] <= batching.PIPELINE_BATCHES
+    assert peaks["outputs"] <= batching.PIPELINE_BATCHES
+
+
+@pytest.mark.parametrize("failing_stage", ["read", "process", "write"])
+def test_pipeline_reraises_stage_errors(failing_stage):
+    import batching
+
+    def batches():
+        for i in range(100):
+            if failing_stage == "read" and i == 5:
+                raise OSError("read failed")
+            yield i
+
+    def process(index, batch):
+        if failing_stage == "process" and index == 5:
+            raise OSError("process failed")
+        return batch
+
+    def write(index, output):
+        if failing_stage == "write" and index == 5:
+            raise OSError("write failed")
+
+    with pytest.raises(OSError, match=f"{failing_stage} failed"):
+        batching.run_pipeline(batches(), process, write)
+
+
+def test_max_memory_spec_is_validated(tmp_path):
+    with pytest.raises(SystemExit):
+        run_main(tmp_path, ["--max-memory", "lots"])
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("16GiB", 16 * 1024**3), ("512MiB", 512 * 1024**2), ("2G", 2 * 1000**3), ("1500", 1500), ("1.5 GiB", 1610612736)],
+)
+def test_parse_memory_size(value, expected):
+    import batching
+
+    assert batching.parse_memory_size(value) == expected
+
+
+# ---------------------------------------------------------------------------
+# --estimate
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("data_path, path, chains", [(DATA, "B", 0), (DATA_SC_ANNOTATED, "A", 2)])
+def test_estimate_prints_projection_without_scanning(capsys, data_path, path, chains):
+    original = sys.argv
+    sys.argv = ["main.py", str(data_path), "--estimate", "-m", json.dumps(LABEL_MAP)]
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+
+    projection = json.loads(capsys.readouterr().out)
+    n_rows = len(pl.read_csv(data_path, separator="\t"))
+    assert projection["path"] == path
+    assert projection["chains"] == chains
+    assert projection["sample_rows"] == n_rows
+    assert projection["estimated_rows"] == n_rows
+    assert projection["projected_peak_memory_bytes"] >= projection["baseline_memory_bytes"]
+    assert projection["suggested_threads"] >= 1
+    if path == "A":
+        assert set(projection["mean_annotation_lengths"]) == {"Heavy annotations", "Light annotations"}
+        assert {"Heavy CDR3", "Light CDR3"} <= set(projection["mean_region_lengths"])
+    else:
+        assert set(projection["mean_region_lengths"]) == set(projection["mean_sequence_lengths"])
+    assert all(length > 0 for length in projection["mean_region_lengths"].values())
+
+
+# ---------------------------------------------------------------------------
+# Compressed input and output
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("suffix, compression", [(".gz", "gzip"), (".zst", "zstd")])
+@pytest.mark.parametrize("batched", [False, True])
+def test_compressed_output_matches_plain(tmp_path, suffix, compression, batched):
+    import tsv_io
+
+    extra = ["--max-memory", "1"] if batched else []
+    plain = tmp_path / "plain.tsv"
+    packed = tmp_path / f"packed.tsv{suffix}"
+    for out in (plain, packed):
+        original = sys.argv
+        sys.argv = ["main.py", str(DATA), str(out), "--compression-threads", "2"] + extra
+        try:
+            m.main()
+        finally:
+            sys.argv = original
+
+    assert tsv_io.detect_compression(str(packed)) == compression
+    with tsv_io.open_input(str(packed)) as f:
+        assert f.read() == plain.read_bytes()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_compressed_input_is_detected(tmp_path, compression):
+    import tsv_io
+
+    packed_input = tmp_path / "input.bin"  # Detection must not rely on the file name
+    with tsv_io.open_output(str(packed_input), compression, threads=2) as f:
+        f.write(DATA.read_bytes())
+    expected = run_main(tmp_path, [])
+    got = run_main(tmp_path, [], data_path=packed_input)
+    assert got.equals(expected)
+
+
+# ---------------------------------------------------------------------------
+# --stats-output
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("data_path", [DATA, DATA_SC_ANNOTATED])
+@pytest.mark.parametrize("batched", [False, True])
+def test_stats_output_matches_scan(tmp_path, monkeypatch, data_path, batched):
+    import batching
+
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 2)
+    custom = tmp_path / "custom.json"
+    rule = {"name": "Lookahead NxS", "pattern": "N(?=.S)", "riskLevel": "Low", "fixability": "fixable"}
+    custom.write_text(json.dumps([{**rule, "regions": ["CDR1", "CDR2", "CDR3", "FR1"]}]))
+    stats_path = tmp_path / "stats.json"
+    args = ["-m", json.dumps(LABEL_MAP), "--custom-liabilities", str(custom), "--stats-output", str(stats_path)]
+    args += ["--stats-slowest", "3"] + (["--max-memory", "1"] if batched else [])
+    df = run_main(tmp_path, args, data_path=data_path)
+
+    entries = json.loads(stats_path.read_text())["rules"]
+    by_key = {(e["rule"], e["region"]): e for e in entries}
+    assert by_key[("Lookahead NxS", next(r for _rule, r in by_key if "CDR3" in r))]["engine"] == "regex"
+    assert any(e["engine"] == "motif kernel" for e in entries)
+    # Path A writes one column per region, joined across chains: a row flagged there was hit
+    # in at least one chain's region, and no more often than in all of them.
+    hits_per_column: dict[tuple[str, str], list[int]] = {}
+    for e in entries:
+        hits_per_column.setdefault((e["rule"], e["region"].split()[-1]), []).append(e["hits"])
+    for (rule_name, region), hits in hits_per_column.items():
+        flagged = df[f"{region} aa liabilities"].fill_null("").str.contains(rule_name, literal=True).sum()
+        assert max(hits) <= flagged <= sum(hits), (rule_name, region, hits)
+        if len(hits) == 1:
+            assert hits[0] == flagged
+    for e in entries:
+        assert e["rows_evaluated"] <= len(df)
+        assert e["total_matches"] >= e["hits"]
+        if e["engine"] == "regex":
+            assert 0 < len(e["slowest_rows"]) <= 3
+            assert all(0 <= r["row"] < len(df) for r in e["slowest_rows"])
+        else:
+            assert e["slowest_rows"] == []
+
+
+# ---------------------------------------------------------------------------
+# Lazy post-scan plan (--explain)
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("data_path", [DATA, DATA_SC_ANNOTATED])
+def test_explain_prints_plan_and_keeps_output(tmp_path, capsys, data_path):
+    args = ["-m", json.dumps(LABEL_MAP)]
+    expected = run_main(tmp_path, args, data_path=data_path)
+    capsys.readouterr()
+    # Columns the scan never reads are dropped on input, without changing the output.
+    padded = tmp_path / "padded.tsv"
+    pl.read_csv(data_path, separator="\t").with_columns(pl.lit("x").alias("Unused column")).write_csv(
+        padded, separator="\t"
+    )
+    got = run_main(tmp_path, args + ["--explain"], data_path=padded)
+
+    out = capsys.readouterr().out
+    assert "Optimized query plan:" in out
+    assert "Developability cost" in out
+    assert got.equals(expected)
@@ -0,0 +1,96 @@
+"""k-mer index: queries must return exactly the rows `re` finds, whatever the batching or sharding
+of the run that built the index."""
+
+import random
+import re
+import sys
+
+import numpy as np
+import polars as pl
+import pytest
+
+import main as m
+from kmer_index import KmerIndex
+
+REGIONS = ["CDR1 aa", "CDR2 aa", "CDR3 aa", "FR1 aa"]
+PATTERNS = ["NG", "N[^P][ST]", "W", "DP|NG", "N.S", "[ST]N", "C.{2}C", "(?<=C)AR", "MWKQ", "W(?!$)"]
+
+
+@pytest.fixture(scope="module")
+def repertoire(tmp_path_factory) -> tuple[str, pl.DataFrame]:
+    rng = random.Random(0)
+    alphabet = "ACDEFGHIKLMNPQRSTVWY"
+    rows = {"clonotypeKey": [f"k{i}" for i in range(400)]}
+    for region in REGIONS:
+        rows[region] = [
+            None if rng.random() < 0.05 else "".join(rng.choices(alphabet, k=rng.randint(0, 25))) for _ in range(400)
+        ]
+    rows["CDR3 aa"][:3] = ["cwngs", "*NGS_", ""]  # Lowercase and non-residue symbols
+    df = pl.DataFrame(rows)
+    path = tmp_path_factory.mktemp("kmer") / "in.tsv"
+    df.write_csv(path, separator="\t")
+    return str(path), df
+
+
+def _build_index(tmp_path, input_tsv: str, extra: list[str]) -> KmerIndex:
+    index_path = tmp_path / "index.npz"
+    original = sys.argv
+    sys.argv = ["main.py", input_tsv, str(tmp_path / "out.tsv"), "--kmer-index", str(index_path)] + extra
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+    return KmerIndex.load(str(index_path))
+
+
+def _expected_rows(df: pl.DataFrame, pattern: str, column: str) -> np.ndarray:
+    seqs = df[column].fill_null("").str.to_uppercase().to_list()
+    return np.array([i for i, s in enumerate(seqs) if re.search(pattern, s)], dtype=np.int64)
+
+
+def test_queries_match_re(tmp_path, repertoire):
+    input_tsv, df = repertoire
+    index = _build_index(tmp_path, input_tsv, [])
+    assert index.columns == REGIONS
+    for column in REGIONS:
+        for pattern in PATTERNS:
+            rows = index.query(pattern, column)
+            expected = _expected_rows(df, pattern, column)
+            assert np.array_equal(rows, expected), (pattern, column)
+            assert index.keys(rows) == df["clonotypeKey"].gather(expected).to_list()
+    # Short motifs are answered from the postings: candidates are (nearly) the matches
+    assert len(index.candidates("N[^P][ST]", "CDR3 aa")) < len(df) // 4
+    with pytest.raises(KeyError, match="not indexed"):
+        index.query("NG", "CDR4 aa")
+
+
+def test_lowercase_queries_match_residues(tmp_path, repertoire):
+    input_tsv, df = repertoire
+    index = _build_index(tmp_path, input_tsv, [])
+    for pattern in ["ng", "n[^p][st]", "Dp|nG", "w(?!$)", "n[^p]+[st]", "(?<=c)ar"]:
+        expected = _expected_rows(df, pattern.upper(), "CDR3 aa")
+        assert len(expected) > 0, pattern
+        assert np.array_equal(index.query(pattern, "CDR3 aa"), expected), pattern
+    assert np.array_equal(index.postings("CDR3 aa", "ngs"), index.postings("CDR3 aa", "NGS"))
+    # Escapes keep their meaning: \d is never a residue
+    assert len(index.query(r"n\d", "CDR3 aa")) == 0
+
+
+def test_batched_and_sharded_indexes_agree(tmp_path, repertoire, monkeypatch):
+    import batching
+
+    input_tsv, df = repertoire
+    full = _build_index(tmp_path, input_tsv, [])
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 7)
+    batched = _build_index(tmp_path, input_tsv, ["--max-memory", "1"])
+    for column in REGIONS:
+        for kmer in ("NG", "NGS", "NGST"):
+            assert np.array_equal(batched.postings(column, kmer), full.postings(column, kmer))
+        for pattern in PATTERNS:
+            assert np.array_equal(batched.query(pattern, column), full.query(pattern, column))
+
+    shard = _build_index(tmp_path, input_tsv, ["--shard", "1/2"])
+    assert shard.first_row == 200 and shard.n_rows == 200
+    for pattern in PATTERNS:
+        expected = full.query(pattern, "CDR3 aa")
+        assert np.array_equal(shard.query(pattern, "CDR3 aa"), expected[expected >= 200])
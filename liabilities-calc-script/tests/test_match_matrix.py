@@ -0,0 +1,102 @@
+"""--weights / --match-matrix: matrix-product costs must equal the per-row scorer exactly, and a
+saved matrix must re-weight into the cost columns of a full run without rescanning."""
+
+import json
+import random
+import sys
+
+import numpy as np
+import polars as pl
+import pytest
+
+import batching
+import main as m
+import match_matrix as mm
+from definitions import FIXABILITY_MAP
+from scoring import _parse_liability_names, compute_developability_score
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+PROFILES = {
+    "cdr3": {"regions": {"CDR3": 3.0, "fr1": 0.1}, "rules": {"Deamidation (N[GS])": 10}},
+    "flat": {"fixability": {"fixable": 1, "hard_to_fix": 1, "structural": 1}, "other_regions": 2.0},
+}
+
+
+def test_score_matches_per_row_scorer():
+    rng = random.Random(3)
+    names = list(FIXABILITY_MAP) + ["Unknown rule"]
+    columns = ["Heavy CDR3 aa liabilities", "FR1 aa liabilities", "sequence aa liabilities", "Light FR4 liabilities"]
+
+    def cell():
+        if rng.random() < 0.2:
+            return rng.choice([None, "None", "Unknown", ""])
+        return ", ".join(rng.sample(names, rng.randint(1, 4)))
+
+    df = pl.DataFrame({c: [cell() for _ in range(500)] for c in columns}, schema={c: pl.Utf8 for c in columns})
+    matrix = mm.MatchMatrix.from_liability_frame(df, FIXABILITY_MAP, list(FIXABILITY_MAP))
+    expected = [compute_developability_score(row, FIXABILITY_MAP) for row in df.iter_rows(named=True)]
+    assert matrix.score(mm.WeightProfile()).tolist() == expected
+    assert matrix.rules[-1] == "Unknown rule" and matrix.fixability["Unknown rule"] is None
+
+    empty = mm.MatchMatrix.from_liability_frame(pl.DataFrame(), FIXABILITY_MAP, n_rows=4)
+    assert empty.score(mm.WeightProfile()).tolist() == [0.0] * 4
+
+
+@pytest.mark.parametrize(
+    "document",
+    [{}, {"p": {"weights": {}}}, {"p": {"fixability": {"fixable": "3"}}}, {"p": {"fixability": {"easy": 1.0}}}],
+)
+def test_bad_weight_files_are_rejected(tmp_path, document):
+    path = tmp_path / "weights.json"
+    path.write_text(json.dumps(document))
+    with pytest.raises(ValueError):
+        mm.load_weight_profiles(str(path))
+
+
+def _run(argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["main.py"] + argv
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+
+
+def test_profiles_and_reweighting(tmp_path, monkeypatch):
+    rng = random.Random(4)
+    df = pl.DataFrame(
+        {"clonotypeKey": [f"k{i}" for i in range(300)]}
+        | {
+            r: ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(4, 18))) for _ in range(300)]
+            for r in ("CDR1 aa", "CDR3 aa", "FR1 aa")
+        }
+    )
+    df.write_csv(tmp_path / "in.tsv", separator="\t")
+    (tmp_path / "weights.json").write_text(json.dumps(PROFILES))
+    argv = [str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv"), "--weights", str(tmp_path / "weights.json")]
+    _run(argv + ["--match-matrix", str(tmp_path / "matrix.npz")])
+    out = pl.read_csv(tmp_path / "out.tsv", separator="\t")
+    cost_columns = ["Developability cost", "Developability cost (cdr3)", "Developability cost (flat)"]
+    assert out.columns[-4:-1] == cost_columns
+
+    # The cdr3 profile by hand: FR1 weight 0.1, CDR3 3.0, one rule at 10 regardless of fixability
+    profile = mm.load_weight_profiles(str(tmp_path / "weights.json"))["cdr3"]
+    region_w = {"CDR1 aa liabilities": 1.2, "CDR3 aa liabilities": 3.0, "FR1 aa liabilities": 0.1}
+    for row in out.iter_rows(named=True):
+        total = sum(
+            profile.rule_weight(name, FIXABILITY_MAP.get(name)) * w
+            for column, w in region_w.items()
+            for name in _parse_liability_names(row[column])
+        )
+        assert row["Developability cost (cdr3)"] == pytest.approx(total)
+
+    matrix = mm.MatchMatrix.load(str(tmp_path / "matrix.npz"))
+    rescored = matrix.cost_frame(mm.load_weight_profiles(str(tmp_path / "weights.json")))
+    assert rescored.equals(out.select(["clonotypeKey"] + cost_columns))
+
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 70)
+    _run(argv + ["--match-matrix", str(tmp_path / "batched.npz"), "--max-memory", "1"])
+    assert (tmp_path / "out.tsv").read_text() == out.write_csv(separator="\t")
+    batched = mm.MatchMatrix.load(str(tmp_path / "batched.npz"))
+    assert batched.n_rows == matrix.n_rows and batched.rules == matrix.rules
+    assert np.array_equal(batched.score(profile), matrix.score(profile))
@@ -0,0 +1,33 @@
+"""Micro-benchmark harness: every hot function has a workload and a stored baseline, and
+compare() flags only slowdowns beyond the tolerance."""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import microbench  # noqa: E402
+
+
+def test_every_benchmark_runs_and_has_a_baseline():
+    current = microbench.run_benchmarks(rows=20, repeats=1)
+    with open(microbench.BASELINE_PATH) as f:
+        baseline = json.load(f)
+    assert set(current["benchmarks"]) == set(baseline["benchmarks"])
+    assert all(entry["normalized"] > 0 for entry in current["benchmarks"].values())
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    def document(**normalized):
+        return {"benchmarks": {name: {"normalized": value} for name, value in normalized.items()}}
+
+    baseline = document(a=1.0, b=1.0, c=1.0)
+    rows, regressed = microbench.compare(baseline, document(a=1.2, b=0.5, c=1.0, d=1.0), tolerance=0.25)
+    assert not regressed
+    assert [row["status"] for row in rows] == ["ok", "improved", "ok", "new"]
+    rows, regressed = microbench.compare(baseline, document(a=1.3), tolerance=0.25)
+    assert regressed and rows[0]["status"] == "regressed"
+
+    merged = microbench.keep_fastest(document(a=1.3, b=1.0), document(a=1.1))
+    assert merged["benchmarks"] == {"a": {"normalized": 1.1}, "b": {"normalized": 1.0}}
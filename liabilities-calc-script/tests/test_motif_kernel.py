@@ -0,0 +1,60 @@
+"""Equivalence tests: the NumPy motif kernel must agree with Python `re` on every rule it accepts, and the
+column-wise cysteine checks with the per-row ones."""
+
+import random
+import re
+
+import polars as pl
+import pytest
+
+from definitions import ORIG_EXTRA_PATTERNS, ORIG_REGEX_LIABILITIES
+from detection import _evaluate_cys_liabilities, _evaluate_cys_liabilities_packed
+from motif_kernel import PackedColumn, compile_motif
+
+PATTERNS = [p for p, *_ in ORIG_REGEX_LIABILITIES.values()] + list(ORIG_EXTRA_PATTERNS.values()) + [r"W(?!$)", "N.[ST]"]
+
+
+@pytest.fixture(scope="module")
+def sequences() -> list[str | None]:
+    rng = random.Random(0)
+    alphabet = "ACDEFGHIKLMNPQRSTVWY*_"
+    seqs = [
+        None if rng.random() < 0.05 else "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        for _ in range(2000)
+    ]
+    return seqs + ["", " ", "DDDD", "TSTSTS", "NGSNGS", "cw", "W"]
+
+
+@pytest.mark.parametrize("pattern", PATTERNS)
+def test_row_hits_match_re_search(sequences, pattern):
+    packed = PackedColumn.from_series(pl.Series(sequences, dtype=pl.Utf8))
+    motif = compile_motif(pattern)
+    assert motif is not None
+    expected = [re.search(pattern, (s or "").upper()) is not None for s in sequences]
+    assert motif.row_hits(packed).tolist() == expected
+
+
+@pytest.mark.parametrize("pattern", [p for p in PATTERNS if compile_motif(p).fixed_length])
+def test_match_positions_match_re_finditer(sequences, pattern):
+    packed = PackedColumn.from_series(pl.Series(sequences, dtype=pl.Utf8))
+    rows, offsets = compile_motif(pattern).match_positions(packed)
+    expected = [(i, m.start()) for i, s in enumerate(sequences) for m in re.finditer(pattern, (s or "").upper())]
+    assert sorted(zip(rows.tolist(), offsets.tolist())) == sorted(expected)
+
+
+@pytest.mark.parametrize("pattern", ["W+", "(AB)", r"\d", "A{2}", "^A", "C.+C", ""])
+def test_unsupported_patterns_fall_back(pattern):
+    assert compile_motif(pattern) is None
+
+
+@pytest.mark.parametrize("non_ascii", [False, True])
+@pytest.mark.parametrize("expected_positions, expected_count", [([-1], 1), ([0, 3], 2), ([], 0)])
+def test_packed_cysteine_checks_match_per_row(sequences, non_ascii, expected_positions, expected_count):
+    rng = random.Random(1)
+    seqs = [s.replace("A", "Ä") if s and non_ascii and rng.random() < 0.3 else s for s in sequences]
+    seqs += ["ÄCAAC", "éCC", "CÄÄÄ"] if non_ascii else []
+    packed = PackedColumn.from_series(pl.Series(seqs, dtype=pl.Utf8))
+    assert packed.is_ascii != non_ascii
+    missing, extra = _evaluate_cys_liabilities_packed(packed, expected_positions, expected_count)
+    expected = [_evaluate_cys_liabilities((s or "").upper(), expected_positions, expected_count)[:2] for s in seqs]
+    assert list(zip(missing.tolist(), extra.tolist())) == expected
@@ -0,0 +1,68 @@
+"""peptide_main --workers: chunks scanned in worker processes must reassemble into exactly the
+single-process output, statistics and summary report, with and without batched input."""
+
+import json
+import random
+import sys
+
+import pytest
+
+import batching
+import peptide_main as pm
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+CUSTOM = [
+    {"name": "WW motif", "pattern": "WW", "riskLevel": "Medium", "fixability": "fixable"},
+    {"name": "Lookahead NxS", "pattern": "N(?=.S)", "riskLevel": "Low", "fixability": "fixable"},
+]
+
+
+@pytest.fixture(scope="module")
+def peptide_files(tmp_path_factory):
+    rng = random.Random(7)
+    root = tmp_path_factory.mktemp("workers")
+    lines = ["variantKey\tsequence aa"]
+    lines += [f"v{i}\t{''.join(rng.choices(AMINO_ACIDS, k=rng.randint(0, 40)))}" for i in range(700)]
+    (root / "in.tsv").write_text("\n".join(lines) + "\n")
+    (root / "custom.json").write_text(json.dumps(CUSTOM))
+    return root
+
+
+def _run(root, name: str, extra: list[str]) -> tuple[bytes, list, bytes]:
+    out, stats, summary = root / f"{name}.tsv", root / f"{name}.stats.json", root / f"{name}.summary.json"
+    argv = ["peptide_main.py", "--input_tsv", str(root / "in.tsv"), "--output_tsv", str(out)]
+    argv += ["--use_predefined_liabilities", "--custom_liabilities", str(root / "custom.json")]
+    argv += ["--stats_output", str(stats), "--summary_report", str(summary)] + extra
+    original = sys.argv
+    sys.argv = argv
+    try:
+        pm.main()
+    finally:
+        sys.argv = original
+    rules = json.loads(stats.read_text())["rules"]
+    counts = sorted((r["rule"], r["rows_evaluated"], r["hits"], r["total_matches"]) for r in rules)
+    return out.read_bytes(), counts, summary.read_bytes()
+
+
+def test_workers_match_single_process(peptide_files, monkeypatch):
+    monkeypatch.setattr(pm, "MIN_CHUNK_ROWS", 60)
+    expected = _run(peptide_files, "single", [])
+    assert _run(peptide_files, "pool", ["--workers", "3"]) == expected
+
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 250)
+    assert _run(peptide_files, "pool_batched", ["--workers", "2", "--max_memory", "1"]) == expected
+
+
+def test_workers_must_be_positive(peptide_files):
+    with pytest.raises(SystemExit):
+        _run(peptide_files, "bad", ["--workers", "0"])
+
+
+def test_estimate_suggests_one_thread_per_chunk(peptide_files, monkeypatch):
+    monkeypatch.setattr(batching, "available_cpus", lambda: 8)
+    path = str(peptide_files / "in.tsv")
+    assert pm.estimate_run(path, True, [], CUSTOM)["suggested_threads"] == 1  # 700 rows: a single chunk
+    monkeypatch.setattr(pm, "MIN_CHUNK_ROWS", 200)
+    assert pm.estimate_run(path, True, [], CUSTOM)["suggested_threads"] == 4
+    monkeypatch.setattr(pm, "MIN_CHUNK_ROWS", 60)
+    assert pm.estimate_run(path, True, [], CUSTOM)["suggested_threads"] == 8
@@ -0,0 +1,115 @@
+"""--preview: the sample must not depend on row order, its rows must be scanned exactly as in a full
+run, and the prevalence report must agree with the sampled output."""
+
+import json
+import random
+import sys
+
+import polars as pl
+import pytest
+
+import main as m
+import peptide_main as pm
+from preview import wilson_interval
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def _run(entry_main, argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["prog"] + argv
+    try:
+        entry_main()
+    finally:
+        sys.argv = original
+
+
+@pytest.fixture(scope="module")
+def clonotypes() -> pl.DataFrame:
+    rng = random.Random(1)
+    regions = ["CDR1 aa", "CDR2 aa", "CDR3 aa", "FR1 aa"]
+    return pl.DataFrame(
+        {"clonotypeKey": [f"k{i}" for i in range(500)]}
+        | {r: ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(5, 20))) for _ in range(500)] for r in regions}
+    )
+
+
+@pytest.fixture(scope="module")
+def peptides() -> pl.DataFrame:
+    rng = random.Random(2)
+    return pl.DataFrame(
+        {
+            "variantKey": [f"v{i}" for i in range(500)],
+            "sequence aa": ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(5, 30))) for _ in range(500)],
+        }
+    )
+
+
+def _main_preview(tmp_path, df: pl.DataFrame, n: int, name: str) -> tuple[pl.DataFrame, dict]:
+    df.write_csv(tmp_path / f"{name}.tsv", separator="\t")
+    out = tmp_path / f"{name}.out.tsv"
+    _run(m.main, [str(tmp_path / f"{name}.tsv"), str(out), "--preview", str(n)])
+    return pl.read_csv(out, separator="\t"), json.loads((tmp_path / f"{name}.out.tsv.preview.json").read_text())
+
+
+def _peptide_preview(tmp_path, df: pl.DataFrame, n: int, name: str) -> tuple[pl.DataFrame, dict]:
+    df.write_csv(tmp_path / f"{name}.tsv", separator="\t")
+    out = tmp_path / f"{name}.out.tsv"
+    argv = ["--input_tsv", str(tmp_path / f"{name}.tsv"), "--output_tsv", str(out), "--use_predefined_liabilities"]
+    _run(pm.main, argv + ["--preview", str(n)])
+    return pl.read_csv(out, separator="\t"), json.loads((tmp_path / f"{name}.out.tsv.preview.json").read_text())
+
+
+@pytest.mark.parametrize(
+    "run_preview, data, key",
+    [(_main_preview, "clonotypes", "clonotypeKey"), (_peptide_preview, "peptides", "variantKey")],
+)
+def test_preview_sample_is_stable_and_scanned_as_in_full_run(tmp_path, request, run_preview, data, key):
+    df = request.getfixturevalue(data)
+    full, full_report = run_preview(tmp_path, df, len(df), "full")
+    sample, report = run_preview(tmp_path, df, 60, "sample")
+    shuffled, _ = run_preview(tmp_path, df.sample(fraction=1.0, shuffle=True, seed=3), 60, "shuffled")
+    larger, _ = run_preview(tmp_path, df, 120, "larger")
+
+    assert len(sample) == 60 and report["sample_rows"] == 60 and report["total_rows"] == len(df)
+    assert sample[key].to_list() == sorted(sample[key].to_list(), key=lambda k: int(k[1:]))  # Input order
+    assert set(shuffled[key]) == set(sample[key])
+    assert set(sample[key]) <= set(larger[key])
+    assert sample.equals(full.filter(pl.col(key).is_in(sample[key].implode())))
+
+    # The whole table as the sample: the interval collapses onto the exact count.
+    for rule in full_report["rules"]:
+        assert rule["estimated_rows_low"] == rule["estimated_rows"] == rule["estimated_rows_high"]
+    for rule in report["rules"]:
+        assert rule["prevalence_low"] <= rule["prevalence"] <= rule["prevalence_high"]
+        assert rule["sample_hits"] == round(rule["prevalence"] * 60)
+        assert max(rule["sample_hits_by_region"].values()) <= rule["sample_hits"]
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(10, 100, 10**9)
+    assert low == pytest.approx(0.0552, abs=1e-4) and high == pytest.approx(0.1744, abs=1e-4)
+    assert wilson_interval(0, 50, 10**6)[0] == 0.0
+    assert wilson_interval(7, 20, 20) == pytest.approx((0.35, 0.35))
+
+
+def test_preview_rejects_batched_runs(tmp_path):
+    with pytest.raises(SystemExit):
+        _run(m.main, ["in.tsv", str(tmp_path / "out.tsv"), "--preview", "10", "--max-memory", "1GiB"])
+
+
+def test_peptide_preview_counts_rules_whose_names_contain_separators(tmp_path, peptides):
+    custom = [
+        {"name": "NxS; sequon, glycosylation", "pattern": "N[A-Z]S", "riskLevel": "Low", "fixability": "fixable"},
+        {"name": "WW | W", "pattern": "WW", "riskLevel": "Low", "fixability": "fixable"},
+    ]
+    (tmp_path / "custom.json").write_text(json.dumps(custom))
+    peptides.write_csv(tmp_path / "in.tsv", separator="\t")
+    argv = ["--input_tsv", str(tmp_path / "in.tsv"), "--output_tsv", str(tmp_path / "out.tsv"), "--preview", "500"]
+    _run(pm.main, argv + ["--custom_liabilities", str(tmp_path / "custom.json")])
+
+    report = json.loads((tmp_path / "out.tsv.preview.json").read_text())
+    hits = {rule["rule"]: rule["sample_hits"] for rule in report["rules"]}
+    sequences = peptides["sequence aa"]
+    assert hits == {rule["name"]: int(sequences.str.contains(rule["pattern"]).sum()) for rule in custom}
+    assert all(n > 0 for n in hits.values())
@@ -0,0 +1,129 @@
+"""--summary-report: the counts gathered during the scan must equal aggregating the written
+output afterwards, for single-pass and batched runs of both scripts."""
+
+import json
+import random
+import re
+import sys
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+import main as m
+import peptide_main as pm
+from top_k import RISK_ORDER
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def _run(entry_main, argv: list[str]) -> None:
+    original = sys.argv
+    sys.argv = ["prog"] + argv
+    try:
+        entry_main()
+    finally:
+        sys.argv = original
+
+
+def _random_seqs(rng: random.Random, n: int, low: int, high: int) -> list[str]:
+    return ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(low, high))) for _ in range(n)]
+
+
+@pytest.fixture(scope="module")
+def clonotypes_tsv(tmp_path_factory) -> str:
+    rng = random.Random(5)
+    df = pl.DataFrame(
+        {"clonotypeKey": [f"k{i}" for i in range(400)]}
+        | {r: _random_seqs(rng, 400, 4, 18) for r in ("CDR1 aa", "CDR2 aa", "CDR3 aa", "FR1 aa")}
+    )
+    path = tmp_path_factory.mktemp("summary") / "clonotypes.tsv"
+    df.write_csv(path, separator="\t")
+    return str(path)
+
+
+def _listed(cell: str | None, rule: str) -> bool:
+    return rule in re.split(r", | \| |: ", cell or "")
+
+
+def test_main_summary_matches_output(tmp_path, clonotypes_tsv, monkeypatch):
+    import batching
+
+    out, report_path = tmp_path / "out.tsv", tmp_path / "summary.json"
+    _run(m.main, [clonotypes_tsv, str(out), "--summary-report", str(report_path)])
+    report = json.loads(report_path.read_text())
+    df = pl.read_csv(out, separator="\t")
+    regions = [c.removesuffix(" liabilities") for c in df.columns if c.endswith(" aa liabilities")]
+
+    assert report["rows"] == len(df)
+    flagged = {}
+    for entry in report["rule_region"]:
+        column = df[f"{entry['region']} liabilities"].to_list()
+        assert entry["rows"] == sum(_listed(cell, entry["rule"]) for cell in column)
+    for entry in report["rules"]:
+        flagged[entry["rule"]] = [
+            any(_listed(df[f"{r} liabilities"][i], entry["rule"]) for r in regions) for i in range(len(df))
+        ]
+        assert entry["rows"] == sum(flagged[entry["rule"]])
+    rules = report["co_occurrence"]["rules"]
+    for i, a in enumerate(rules):
+        for j, b in enumerate(rules):
+            both = sum(x and y for x, y in zip(flagged[a], flagged[b]))
+            assert report["co_occurrence"]["rows"][i][j] == both
+    risks = dict(df.group_by("Developability risk").len().iter_rows())
+    assert {e["risk"]: e["rows"] for e in report["developability_risk"]} == risks
+    order = [RISK_ORDER.index(e["risk"]) for e in report["developability_risk"]]
+    assert order == sorted(order)
+    assert sum(e["rows"] for e in report["developability_cost"]) == len(df)
+    for e in report["developability_cost"]:
+        cost = pl.col("Developability cost")
+        assert e["rows"] == df.filter((cost >= e["low"]) & (cost < e["high"])).height
+
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 37)
+    batched_path = tmp_path / "batched.json"
+    _run(m.main, [clonotypes_tsv, str(out), "--summary-report", str(batched_path), "--max-memory", "1"])
+    assert json.loads(batched_path.read_text()) == report
+
+
+def test_rule_names_with_separators_are_counted_as_scanned(tmp_path):
+    """Paired chains: hits come from the scan, so a custom name containing ", " or " | " (the
+    separators of the output cells) counts exactly like the same rule under a plain name."""
+    data = Path(__file__).parent / "data" / "sequences_sc_annotated.tsv"
+    label_map = json.dumps({"1": "CDR1", "2": "CDR2", "3": "CDR3"})
+    reports = {}
+    for name in ("Glycine", "Glycine, G | motif"):
+        custom = tmp_path / "custom.json"
+        rule = {"name": name, "pattern": "G", "riskLevel": "Low", "fixability": "fixable", "regions": ["CDR3"]}
+        custom.write_text(json.dumps([rule]))
+        report_path = tmp_path / f"{len(reports)}.json"
+        argv = [str(data), str(tmp_path / "out.tsv"), "-m", label_map, "--custom-liabilities", str(custom)]
+        _run(m.main, argv + ["--summary-report", str(report_path)])
+        report = json.loads(report_path.read_text())
+        reports[name] = {e["region"]: e["rows"] for e in report["rule_region"] if e["rule"] == name}
+    assert reports["Glycine, G | motif"] == reports["Glycine"]
+    assert reports["Glycine"]["CDR3 aa"] > 0
+
+
+def test_peptide_summary_parquet(tmp_path):
+    rng = random.Random(6)
+    peptides = pl.DataFrame({"variantKey": [f"v{i}" for i in range(300)], "sequence aa": _random_seqs(rng, 300, 5, 30)})
+    peptides.write_csv(tmp_path / "in.tsv", separator="\t")
+    argv = ["--input_tsv", str(tmp_path / "in.tsv"), "--output_tsv", str(tmp_path / "out.tsv")]
+    argv += ["--use_predefined_liabilities", "--summary_report", str(tmp_path / "summary.parquet")]
+    _run(pm.main, argv)
+    report = pl.read_parquet(tmp_path / "summary.parquet")
+    out = pl.read_csv(tmp_path / "out.tsv", separator="\t")
+
+    risks = report.filter(section="developability_risk").select("risk", "rows")
+    assert dict(risks.iter_rows()) == dict(out.group_by("developability_risk").len().iter_rows())
+    names = (
+        out["liabilities_summary"]
+        .fill_null("")
+        .str.split("; ")
+        .list.eval(pl.element().str.replace(r" at pos \d+$", ""))
+    )
+    for rule, rows in report.filter(section="rules").select("rule", "rows").iter_rows():
+        assert rows == names.list.contains(rule).sum()
+    assert set(report.filter(section="rule_region")["region"]) == {"sequence"}
+    co = report.filter(section="co_occurrence")
+    assert co.height == report.filter(section="rules").height ** 2
@@ -0,0 +1,199 @@
+"""Scaling guards: runtime must grow (at most) linearly along every input axis.
+
+Each case runs main.py or peptide_main.py end-to-end at geometric input sizes along one
+axis (rows, sequence length, annotation segments, custom rules), keeping the others
+fixed, and fits the growth exponent as the slope of log(time) over log(size). A linear
+path fits ~1.0; fixed start-up costs only pull the slope down. Axes whose work includes
+a sort (annotation parts, per-row match lists) are allowed n log n.
+
+Row-count cases draw sequence lengths from a long-tailed distribution (most short, a
+few very long), tiled so the total residue count stays proportional to the row count.
+
+Wall-clock exponents are noisy on slow or shared runners, so the default run deselects
+them (see addopts in pyproject.toml); the suite, ~30 s, runs on its own with
+`pytest -m scaling` (`pnpm run test:scaling`).
+"""
+
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import main as m
+import peptide_main as pm
+
+pytestmark = pytest.mark.scaling
+
+SIZES = [1, 2, 4, 8]  # Multiples of each case's base size
+REPEATS = 3
+LINEAR_MAX_EXPONENT = 1.3
+N_LOG_N_MAX_EXPONENT = 1.45
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+LABEL_MAP = {"1": "CDR1", "2": "CDR2", "3": "CDR3"}
+
+
+def _random_seq(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices(AMINO_ACIDS, k=length))
+
+
+def _long_tail_lengths(n: int) -> list[int]:
+    """n lengths tiled from a fixed Pareto-shaped pattern: median ~15, a few rows in the thousands."""
+    rng = np.random.default_rng(7)
+    pattern = np.minimum((10 * (1 + rng.pareto(1.2, size=250))).astype(int), 5000)
+    return np.resize(pattern, n).tolist()
+
+
+def _annotation(seq_len: int, n_segments: int) -> str:
+    """n_segments one-residue segments cycling through the label-map codes and an unmapped one."""
+    step = max(1, seq_len // n_segments)
+    parts = [f"{'1234'[i % 4]}:{m.base36_encode(i * step)}+1" for i in range(n_segments)]
+    return "|".join(parts)
+
+
+def _region_annotation(seq_len: int) -> str:
+    """FR1 / CDR1 / CDR2 / CDR3 each spanning a fixed fraction of the sequence, so regions grow with it."""
+    eighth = max(1, seq_len // 8)
+    b36 = m.base36_encode
+    return "|".join(f"{code}:{b36(2 * code * eighth)}+{b36(eighth)}" for code in (1, 2, 3))
+
+
+def _write_tsv(path, header: list[str], rows: list[list[str]]) -> None:
+    with open(path, "w") as f:
+        f.write("\t".join(header) + "\n")
+        for r in rows:
+            f.write("\t".join(r) + "\n")
+
+
+def _custom_rules(n: int) -> list[dict]:
+    rng = random.Random(n)
+    return [
+        {
+            "name": f"Custom {i}",
+            "pattern": "".join(rng.choices(AMINO_ACIDS, k=2)) + "[ST]",
+            "riskLevel": "Low",
+            "fixability": "fixable",
+            "regions": ["CDR1", "CDR2", "CDR3", "FR1"],
+        }
+        for i in range(n)
+    ]
+
+
+# ——— Input builders: (tmp_path, size) -> argv tail for the entry point ———————————
+
+
+def _main_rows_path_b(tmp_path, size):
+    rng = random.Random(size)
+    n = 1500 * size
+    lengths = _long_tail_lengths(4 * n)
+    rows = [[f"k{i}"] + [_random_seq(rng, lengths[4 * i + j]) for j in range(4)] for i in range(n)]
+    _write_tsv(tmp_path / "in.tsv", ["clonotypeKey", "CDR1 aa", "CDR2 aa", "CDR3 aa", "FR1 aa"], rows)
+    return [str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv")]
+
+
+def _main_rows_path_a(tmp_path, size):
+    rng = random.Random(size)
+    n = 1000 * size
+    lengths = _long_tail_lengths(n)
+    rows = []
+    for i in range(n):
+        seq_len = max(40, 4 * lengths[i])
+        rows.append([f"k{i}", _random_seq(rng, seq_len), _region_annotation(seq_len)])
+    _write_tsv(tmp_path / "in.tsv", ["clonotypeKey", "sequence aa", "annotations"], rows)
+    return [str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv"), "-m", json.dumps(LABEL_MAP)]
+
+
+def _main_sequence_length(tmp_path, size):
+    rng = random.Random(size)
+    seq_len = 2000 * size
+    rows = [[f"k{i}", _random_seq(rng, seq_len), _region_annotation(seq_len)] for i in range(100)]
+    _write_tsv(tmp_path / "in.tsv", ["clonotypeKey", "sequence aa", "annotations"], rows)
+    return [str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv"), "-m", json.dumps(LABEL_MAP)]
+
+
+def _main_annotation_segments(tmp_path, size):
+    rng = random.Random(size)
+    n_segments = 500 * size
+    rows = [[f"k{i}", _random_seq(rng, 2 * n_segments), _annotation(2 * n_segments, n_segments)] for i in range(40)]
+    _write_tsv(tmp_path / "in.tsv", ["clonotypeKey", "sequence aa", "annotations"], rows)
+    return [str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv"), "-m", json.dumps(LABEL_MAP)]
+
+
+def _main_custom_rules(tmp_path, size):
+    rng = random.Random(0)
+    rows = [[f"k{i}"] + [_random_seq(rng, 20) for _ in range(4)] for i in range(3000)]
+    _write_tsv(tmp_path / "in.tsv", ["clonotypeKey", "CDR1 aa", "CDR2 aa", "CDR3 aa", "FR1 aa"], rows)
+    (tmp_path / "custom.json").write_text(json.dumps(_custom_rules(8 * size)))
+    argv = [str(tmp_path / "in.tsv"), str(tmp_path / "out.tsv"), "--custom-liabilities", str(tmp_path / "custom.json")]
+    return argv + ["--use-predefined-liabilities", "false"]  # Only the custom rules vary
+
+
+def _peptide_input(tmp_path, lengths, n_custom=0, use_predefined=True):
+    rng = random.Random(len(lengths))
+    rows = [[f"v{i}", _random_seq(rng, length)] for i, length in enumerate(lengths)]
+    _write_tsv(tmp_path / "in.tsv", ["variantKey", "sequence aa"], rows)
+    argv = ["--input_tsv", str(tmp_path / "in.tsv"), "--output_tsv", str(tmp_path / "out.tsv")]
+    if use_predefined:
+        argv += ["--use_predefined_liabilities"]
+    if n_custom:
+        (tmp_path / "custom.json").write_text(json.dumps(_custom_rules(n_custom)))
+        argv += ["--custom_liabilities", str(tmp_path / "custom.json")]
+    return argv
+
+
+def _peptide_rows(tmp_path, size):
+    return _peptide_input(tmp_path, _long_tail_lengths(4000 * size))
+
+
+def _peptide_sequence_length(tmp_path, size):
+    return _peptide_input(tmp_path, [2000 * size] * 100)
+
+
+def _peptide_custom_rules(tmp_path, size):
+    return _peptide_input(tmp_path, [30] * 4000, n_custom=8 * size, use_predefined=False)
+
+
+def _run_entry_point(entry_main, argv: list[str]) -> float:
+    original = sys.argv
+    sys.argv = ["prog"] + argv
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            started = time.perf_counter()
+            entry_main()
+            return time.perf_counter() - started
+    finally:
+        sys.argv = original
+
+
+def _growth_exponent(sizes: list[int], seconds: list[float]) -> float:
+    slope, _intercept = np.polyfit(np.log(sizes), np.log(seconds), 1)
+    return float(slope)
+
+
+@pytest.mark.parametrize(
+    "entry_main, build_input, max_exponent",
+    [
+        pytest.param(m.main, _main_rows_path_b, LINEAR_MAX_EXPONENT, id="main-rows-path-b-long-tail"),
+        pytest.param(m.main, _main_rows_path_a, LINEAR_MAX_EXPONENT, id="main-rows-path-a-long-tail"),
+        pytest.param(m.main, _main_sequence_length, N_LOG_N_MAX_EXPONENT, id="main-sequence-length"),
+        pytest.param(m.main, _main_annotation_segments, N_LOG_N_MAX_EXPONENT, id="main-annotation-segments"),
+        pytest.param(m.main, _main_custom_rules, LINEAR_MAX_EXPONENT, id="main-custom-rules"),
+        pytest.param(pm.main, _peptide_rows, LINEAR_MAX_EXPONENT, id="peptide-rows-long-tail"),
+        pytest.param(pm.main, _peptide_sequence_length, N_LOG_N_MAX_EXPONENT, id="peptide-sequence-length"),
+        pytest.param(pm.main, _peptide_custom_rules, LINEAR_MAX_EXPONENT, id="peptide-custom-rules"),
+    ],
+)
+def test_runtime_grows_at_most_linearly(tmp_path, entry_main, build_input, max_exponent):
+    seconds = []
+    for size in SIZES:
+        run_dir = tmp_path / f"size{size}"
+        run_dir.mkdir()
+        argv = build_input(run_dir, size)
+        seconds.append(min(_run_entry_point(entry_main, argv) for _ in range(REPEATS)))
+    exponent = _growth_exponent(SIZES, seconds)
+    timings = ", ".join(f"x{size}: {t:.3f}s" for size, t in zip(SIZES, seconds))
+    assert exponent <= max_exponent, f"growth exponent {exponent:.2f} > {max_exponent} ({timings})"
@@ -0,0 +1,74 @@
+"""--top-k: the ranked file must be the head of the fully sorted output, however the run is batched."""
+
+import random
+import sys
+
+import polars as pl
+import pytest
+
+import main as m
+from top_k import RISK_ORDER, TopK
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+@pytest.fixture(scope="module")
+def input_tsv(tmp_path_factory) -> str:
+    rng = random.Random(4)
+    n = 600
+    # Few distinct keys and short sequences: many rows tie on all three ranking columns
+    df = pl.DataFrame(
+        {"clonotypeKey": [f"k{rng.randint(0, 40)}" for _ in range(n)]}
+        | {
+            r: ["".join(rng.choices(AMINO_ACIDS, k=rng.randint(2, 9))) for _ in range(n)]
+            for r in ("CDR1 aa", "CDR3 aa")
+        }
+    )
+    path = tmp_path_factory.mktemp("top_k") / "in.tsv"
+    df.write_csv(path, separator="\t")
+    return str(path)
+
+
+def _run(tmp_path, input_tsv: str, extra: list[str]) -> tuple[pl.DataFrame, pl.DataFrame]:
+    out = tmp_path / "out.tsv"
+    original = sys.argv
+    sys.argv = ["main.py", input_tsv, str(out)] + extra
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+    return pl.read_csv(out, separator="\t"), pl.read_csv(tmp_path / "out.tsv.top-k.tsv", separator="\t")
+
+
+def _expected(full: pl.DataFrame, k: int) -> pl.DataFrame:
+    risk = pl.col("Developability risk").replace_strict(RISK_ORDER, list(range(len(RISK_ORDER))))
+    return (
+        full.with_row_index("row")
+        .sort([pl.col("Is Productive") != "Pass", risk, "Developability cost", "clonotypeKey", "row"])
+        .head(k)
+        .drop("row")
+    )
+
+
+@pytest.mark.parametrize("k", [1, 25, 1000])
+def test_top_k_is_head_of_sorted_output(tmp_path, input_tsv, k):
+    full, ranked = _run(tmp_path, input_tsv, ["--top-k", str(k)])
+    assert ranked["Rank"].to_list() == list(range(1, min(k, len(full)) + 1))
+    assert ranked.drop("Rank").equals(_expected(full, k))
+
+
+def test_batched_top_k_matches_single_pass(tmp_path, input_tsv, monkeypatch):
+    import batching
+
+    _, single = _run(tmp_path, input_tsv, ["--top-k", "30"])
+    monkeypatch.setattr(batching, "MIN_BATCH_ROWS", 17)
+    _, batched = _run(tmp_path, input_tsv, ["--top-k", "30", "--max-memory", "1"])
+    assert batched.equals(single)
+
+
+def test_top_k_requires_ranking_columns():
+    top = TopK(3)
+    top.add(pl.DataFrame({"clonotypeKey": []}))  # Empty frames carry no candidates
+    with pytest.raises(ValueError, match="Developability cost"):
+        top.add(pl.DataFrame({"Is Productive": ["Pass"], "Developability risk": ["None"]}))
+    assert top.ranked().columns == ["Rank"]
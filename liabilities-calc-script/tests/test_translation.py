@@ -0,0 +1,86 @@
+"""Nucleotide input: the vectorised translation must agree with codon-by-codon translation, and a
+run on nucleotide columns must equal a run on their translations."""
+
+import random
+import sys
+
+import polars as pl
+import pytest
+
+import main as m
+from translation import translate, translate_nt_columns
+
+BASES = "TCAG"
+STANDARD_CODE = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+CODONS = {
+    a + b + c: STANDARD_CODE[16 * i + 4 * j + k]
+    for i, a in enumerate(BASES)
+    for j, b in enumerate(BASES)
+    for k, c in enumerate(BASES)
+}
+
+
+def _reference(seq: str | None) -> str | None:
+    if seq is None:
+        return None
+    seq = seq.upper().replace("U", "T")
+    aa = "".join(CODONS.get(seq[i : i + 3], "X") for i in range(0, len(seq) - 2, 3))
+    return aa + ("_" if len(seq) % 3 else "")
+
+
+def test_translate_matches_codon_by_codon():
+    rng = random.Random(8)
+    seqs = [
+        None
+        if rng.random() < 0.1
+        else "".join(rng.choices("ACGTacgtNU-", weights=[5] * 8 + [1] * 3, k=rng.randint(0, 50)))
+        for _ in range(2000)
+    ]
+    seqs += ["", "A", "AC", "ATG", "TAA", "ATGTAAC", "atgnnnTGA"]
+    assert translate(pl.Series(seqs)).to_list() == [_reference(s) for s in seqs]
+    assert translate(pl.Series([], dtype=pl.Utf8)).to_list() == []
+
+
+def test_existing_aa_columns_are_kept():
+    df = pl.DataFrame({"CDR3 nt": ["TGTTAA"], "CDR3 aa": ["CARW"], "Heavy sequence nt": ["ATGAAA"]})
+    out, added = translate_nt_columns(df)
+    assert added == ["Heavy sequence aa"]
+    assert out["CDR3 aa"].to_list() == ["CARW"] and out["Heavy sequence aa"].to_list() == ["MK"]
+
+
+def _run(tmp_path, df: pl.DataFrame, name: str) -> pl.DataFrame:
+    df.write_csv(tmp_path / f"{name}.tsv", separator="\t")
+    original = sys.argv
+    sys.argv = ["main.py", str(tmp_path / f"{name}.tsv"), str(tmp_path / f"{name}.out.tsv")]
+    try:
+        m.main()
+    finally:
+        sys.argv = original
+    return pl.read_csv(tmp_path / f"{name}.out.tsv", separator="\t")
+
+
+@pytest.mark.parametrize("chain_prefix", ["", "Heavy "])
+def test_nucleotide_input_matches_amino_acid_input(tmp_path, chain_prefix):
+    rng = random.Random(9)
+
+    def nt(lengths):
+        return ["".join(rng.choices("ACGT", k=rng.choice(lengths))) for _ in range(80)]
+
+    df = pl.DataFrame(
+        {
+            "clonotypeKey": [f"k{i}" for i in range(80)],
+            f"{chain_prefix}sequence nt": nt([300, 303, 301]),
+            "CDR1 nt": nt([24, 27]),
+            "CDR3 nt": nt([33, 36, 34]),
+        }
+    )
+    translated = df.select(
+        "clonotypeKey", *[translate(df[c]).alias(c.replace(" nt", " aa")) for c in df.columns if c.endswith(" nt")]
+    )
+    from_nt = _run(tmp_path, df, "nt")
+    assert from_nt.equals(_run(tmp_path, translated, "aa"))
+
+    chain = from_nt[f"{chain_prefix}sequence aa liabilities"]
+    frame_shifted = (df[f"{chain_prefix}sequence nt"].str.len_bytes() % 3 != 0).to_list()
+    assert [("Out of frame" in c) for c in chain.to_list()] == frame_shifted
+    assert (from_nt.filter(pl.Series(frame_shifted))["Is Productive"] == "Fail").all()